@@ -1,6 +1,10 @@
-from fastapi import APIRouter, HTTPException
-from app.models.excel import ChartConfig
+from fastapi import APIRouter, HTTPException, Header, Query, Response
+from typing import Optional
+from app.models.excel import ChartConfig, SheetChartRequest, AggregateChartRequest
 from app.services.chart_service import chart_service
+from app.services.chart_renderer import chart_renderer, chart_key, FORMATS
+from app.services.executors import run_in_thread
+from app.api.responses import json_response, etag_matches
 
 router = APIRouter(prefix='/api/chart', tags=['chart'])
 
@@ -9,18 +13,101 @@ router = APIRouter(prefix='/api/chart', tags=['chart'])
 async def create_chart(config: ChartConfig):
     """Create a chart configuration"""
     try:
-        chart = chart_service.create_chart(
+        # Large payloads are downsampled, keep that off the event loop
+        chart = await run_in_thread(
+            chart_service.create_chart,
             config.type,
             config.data,
             config.title,
-            config.columns
+            config.columns,
+            config.max_points,
         )
-        return {
-            'message': 'Chart created successfully',
-            'type': 'chart',
-            'data': chart
-        }
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return await json_response({
+        'message': 'Chart created successfully',
+        'type': 'chart',
+        'data': chart,
+    })
+
+
+@router.post('/from-sheet')
+async def create_chart_from_sheet(request: SheetChartRequest):
+    """Create a chart from columns of a stored sheet, its first row being headers"""
+    try:
+        chart = await run_in_thread(
+            chart_service.chart_from_sheet,
+            request.workbook_id,
+            request.sheet_index,
+            request.type,
+            request.label_col,
+            request.value_cols,
+            request.title,
+            request.max_points,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return await json_response({
+        'message': 'Chart created successfully',
+        'type': 'chart',
+        'data': chart,
+    })
+
+
+@router.post('/aggregate')
+async def create_aggregate_chart(request: AggregateChartRequest):
+    """Create a chart of a stored sheet grouped (and optionally pivoted) by its columns"""
+    try:
+        chart = await run_in_thread(
+            chart_service.aggregate,
+            request.workbook_id,
+            request.sheet_index,
+            request.group_col,
+            request.value_cols,
+            request.agg,
+            request.pivot_col,
+            request.type,
+            request.title,
+            request.sort_by,
+            request.limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return await json_response({
+        'message': 'Chart created successfully',
+        'type': 'chart',
+        'data': chart,
+    })
+
+
+@router.post('/render')
+async def render_chart(config: ChartConfig, format: str = Query('png'),
+                       if_none_match: Optional[str] = Header(None)):
+    """Render a chart as an image; identical charts are drawn once and then served from cache"""
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported image format: {format}")
+    chart = config.dict()
+    # The image is a function of the chart, so its hash is a strong ETag
+    headers = {'ETag': f'"{chart_key(chart, format)}"', 'Cache-Control': 'private, max-age=86400'}
+    if if_none_match and etag_matches(if_none_match, headers['ETag']):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        image = await chart_renderer.render_async(chart, format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return Response(image, media_type=FORMATS[format], headers=headers)
+
+
+@router.get('/render/stats')
+async def render_stats():
+    """Counters of the chart image cache and renders"""
+    return chart_renderer.stats()
@@ -1,6 +1,9 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from app.services.agent_service import agent_service
+from app.services.executors import run_in_thread
+from app.api.responses import sse_event, SSE_HEADERS
 
 router = APIRouter(prefix='/api/chat', tags=['chat'])
 
@@ -13,7 +16,23 @@ class ChatRequest(BaseModel):
 async def chat(request: ChatRequest):
     """Process chat message and return AI response"""
     try:
-        response = agent_service.process_message(request.message)
+        response = await agent_service.process_message(request.message)
         return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post('/stream')
+async def chat_stream(request: ChatRequest):
+    """
+    Process chat message and stream the response as Server-Sent Events:
+    message, status updates, workbook and its rows in chunks, then done
+    """
+    async def events():
+        try:
+            async for event in agent_service.stream_message(request.message):
+                yield await run_in_thread(sse_event, event.pop('event'), event)
+        except Exception as e:
+            yield sse_event('error', {'message': str(e)})
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers=SSE_HEADERS)
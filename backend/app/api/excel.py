@@ -1,9 +1,12 @@
-from fastapi import APIRouter, HTTPException, Response, Body
+from fastapi import APIRouter, HTTPException, Response, Body, Header, Query, UploadFile, File
 from fastapi.responses import StreamingResponse
-import io
-from typing import List
-from app.models.excel import Workbook, UpdateCellRequest
-from app.services.excel_service import excel_service
+from typing import List, Optional
+from app.models.excel import Workbook, UpdateCellRequest, PatchRequest, SyncPatchRequest, BoundChartRequest
+from app.services.excel_service import excel_service, WorkbookConflictError, DEFAULT_PAGE_ROWS, MAX_RANGE_ROWS
+from app.services.import_service import import_service, ImportLimitError
+from app.services.chart_service import chart_service
+from app.services.executors import run_in_thread
+from app.api.responses import json_response, etag_matches
 
 router = APIRouter(prefix='/api/excel', tags=['excel'])
 
@@ -12,33 +15,117 @@ router = APIRouter(prefix='/api/excel', tags=['excel'])
 async def create_workbook(workbook: Workbook):
     """Create a new Excel workbook"""
     try:
-        workbook_id = excel_service.create_workbook(workbook)
+        workbook_id = await run_in_thread(excel_service.create_workbook, workbook)
         return {'id': workbook_id, 'message': 'Workbook created successfully'}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post('/import')
+async def import_workbook(file: UploadFile = File(...), encoding: str = 'utf-8-sig'):
+    """
+    Import an uploaded .csv, .tsv or .xlsx file as a new workbook
+    Returns the workbook handle with the first page of each sheet.
+    Files over the import limits are rejected with 413
+    """
+    try:
+        # Parsing is CPU bound, keep it off the event loop
+        workbook_id = await run_in_thread(import_service.import_file, file.filename, file.file, encoding)
+        return {
+            'id': workbook_id,
+            'message': 'Workbook imported successfully',
+            'data': await run_in_thread(excel_service.get_workbook_page, workbook_id),
+        }
+    except ImportLimitError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (ValueError, LookupError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await file.close()
+
+
 @router.get('/workbook/{workbook_id}')
-async def get_workbook(workbook_id: str):
-    """Get a workbook by ID"""
-    workbook = excel_service.get_workbook(workbook_id)
+async def get_workbook(workbook_id: str, page_rows: Optional[int] = Query(None, ge=0, le=MAX_RANGE_ROWS)):
+    """
+    Get a workbook by ID
+    With ?page_rows=N only the first N rows of each sheet are returned,
+    plus every sheet's n_rows and n_cols
+    """
+    if page_rows is not None:
+        try:
+            return await run_in_thread(excel_service.get_workbook_page, workbook_id, page_rows)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    workbook = await run_in_thread(excel_service.get_workbook, workbook_id)
     if not workbook:
         raise HTTPException(status_code=404, detail='Workbook not found')
-    return workbook.dict()
+    return await json_response(workbook.dict())
+
+
+@router.get('/workbook/{workbook_id}/sheet/{sheet_index}/range')
+async def read_range(
+    workbook_id: str,
+    sheet_index: int,
+    row_start: int = Query(0, ge=0),
+    row_count: int = Query(DEFAULT_PAGE_ROWS, ge=0, le=MAX_RANGE_ROWS),
+    col_start: int = Query(0, ge=0),
+    col_count: Optional[int] = Query(None, ge=0),
+):
+    """Read a window of rows and columns from a sheet, with the sheet's full dimensions"""
+    try:
+        return await run_in_thread(
+            excel_service.read_range, workbook_id, sheet_index, row_start, row_count, col_start, col_count
+        )
+    except ValueError as e:
+        status_code = 404 if workbook_id not in excel_service.workbooks else 400
+        raise HTTPException(status_code=status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.put('/workbook/{workbook_id}/cell')
-async def update_cell(workbook_id: str, request: UpdateCellRequest):
-    """Update a cell in a workbook"""
+async def update_cell(workbook_id: str, request: UpdateCellRequest, delta: bool = False):
+    """
+    Update a cell in a workbook
+    With ?delta=true only the changed cell, any auto-extended rows and
+    columns and the new version are returned instead of the whole workbook
+    """
     try:
-        workbook = excel_service.update_cell(
+        if delta:
+            changes = await run_in_thread(
+                excel_service.update_cell_delta,
+                workbook_id,
+                request.sheet_index,
+                request.row,
+                request.col,
+                request.value
+            )
+            return {'message': 'Cell updated successfully', 'delta': changes}
+
+        workbook = await run_in_thread(
+            excel_service.update_cell,
             workbook_id,
             request.sheet_index,
             request.row,
             request.col,
             request.value
         )
-        return {'message': 'Cell updated successfully', 'data': workbook.dict()}
+        return await json_response({'message': 'Cell updated successfully', 'data': workbook.dict()})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post('/workbook/{workbook_id}/patch')
+async def patch_cells(workbook_id: str, request: PatchRequest):
+    """Apply a batch of cell and block writes to one sheet and return the delta"""
+    try:
+        changes = await run_in_thread(excel_service.apply_patch, workbook_id, request.sheet_index, request.operations)
+        return {'message': 'Cells updated successfully', 'delta': changes}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -46,15 +133,26 @@ async def update_cell(workbook_id: str, request: UpdateCellRequest):
 
 
 @router.get('/export/{workbook_id}')
-async def export_excel(workbook_id: str):
+async def export_excel(workbook_id: str, if_none_match: Optional[str] = Header(None)):
     """Export workbook as Excel file with charts"""
     try:
-        excel_data = excel_service.export_to_excel_with_charts(workbook_id)
+        # Ask clients to revalidate every time; unchanged workbooks get a 304
+        if if_none_match:
+            etag = await run_in_thread(excel_service.export_etag, workbook_id)
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': 'private, no-cache'})
+
+        # The ETag sent is the one of the version the body was taken from
+        etag, chunks = await run_in_thread(excel_service.stream_excel_with_charts, workbook_id)
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
 
         return StreamingResponse(
-            io.BytesIO(excel_data),
+            chunks,
             media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            headers={'Content-Disposition': f'attachment; filename=workbook_{workbook_id}.xlsx'}
+            headers={
+                'Content-Disposition': f'attachment; filename=workbook_{workbook_id}.xlsx',
+                **headers,
+            }
         )
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -66,7 +164,7 @@ async def export_excel(workbook_id: str):
 async def add_chart_to_workbook(workbook_id: str, chart: dict):
     """Add a chart to the workbook for export"""
     try:
-        excel_service.add_chart(workbook_id, chart)
+        await run_in_thread(excel_service.add_chart, workbook_id, chart)
         return {'message': 'Chart added successfully'}
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -76,23 +174,99 @@ async def add_chart_to_workbook(workbook_id: str, chart: dict):
 
 @router.post('/{workbook_id}/charts/batch')
 async def add_charts_to_workbook(workbook_id: str, charts: List[dict] = Body(...)):
-    """Add multiple charts and replace existing ones"""
+    """Replace the workbook's static charts; charts bound to ranges are kept"""
     try:
-        excel_service.set_workbook_charts(workbook_id, charts)
-        return {'message': f'Added {len(charts)} charts successfully'}
+        version = await run_in_thread(excel_service.set_workbook_charts, workbook_id, charts)
+        return {'message': f'Added {len(charts)} charts successfully', 'version': version}
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post('/{workbook_id}/charts')
+async def add_bound_chart(workbook_id: str, request: BoundChartRequest):
+    """
+    Add a chart bound to a range of a sheet; returns it with its current data
+    Cell edits in the range keep it current and exports chart the range
+    itself, so it never needs to be sent back before an export
+    """
+    try:
+        chart = await run_in_thread(
+            chart_service.bind_chart,
+            workbook_id,
+            request.sheet_index,
+            request.type,
+            request.title,
+            request.label_col,
+            request.value_cols,
+            request.row_start,
+            request.row_stop,
+            request.max_points,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return await json_response({'message': 'Chart added successfully', 'type': 'chart', 'data': chart})
+
+
+@router.get('/{workbook_id}/charts')
+async def get_bound_charts(workbook_id: str):
+    """Bound charts of a workbook with data derived from their ranges"""
+    try:
+        charts = await run_in_thread(chart_service.bound_charts, workbook_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return await json_response({'charts': charts})
+
+
+@router.get('/{workbook_id}/charts/{chart_id}')
+async def get_bound_chart(workbook_id: str, chart_id: str):
+    """One bound chart with data derived from its range"""
+    try:
+        charts = await run_in_thread(chart_service.bound_charts, workbook_id, chart_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return await json_response(charts[0])
+
+
+@router.delete('/{workbook_id}/charts/{chart_id}')
+async def remove_bound_chart(workbook_id: str, chart_id: str):
+    """Remove a chart from a workbook"""
+    try:
+        await run_in_thread(excel_service.remove_chart, workbook_id, chart_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {'message': 'Chart removed successfully'}
+
+
 @router.put('/{workbook_id}/sync')
 async def sync_workbook(workbook_id: str, workbook: Workbook):
     """Sync the entire workbook data from frontend to backend"""
     try:
-        excel_service.sync_workbook(workbook_id, workbook)
-        return {'message': 'Workbook synced successfully'}
+        synced = await run_in_thread(excel_service.sync_workbook, workbook_id, workbook)
+        return {'message': 'Workbook synced successfully', 'version': synced.version}
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.patch('/{workbook_id}/sync')
+async def sync_workbook_changes(workbook_id: str, request: SyncPatchRequest):
+    """
+    Sync only the changed cells and rows since base_version
+    Answers 409 with the current version when the base is stale, in which
+    case the client should fall back to a full sync
+    """
+    try:
+        result = await run_in_thread(excel_service.sync_changes, workbook_id, request.base_version, request.changes)
+        return {'message': 'Workbook synced successfully', **result}
+    except WorkbookConflictError as e:
+        raise HTTPException(status_code=409, detail={'message': str(e), 'version': e.current_version})
+    except ValueError as e:
+        status_code = 404 if workbook_id not in excel_service.workbooks else 400
+        raise HTTPException(status_code=status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
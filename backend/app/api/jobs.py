@@ -0,0 +1,153 @@
+from contextlib import aclosing
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
+from typing import Any, Awaitable, Callable
+from app.services.job_service import job_service, Job, JobQueueFullError, FINISHED_STATUSES
+from app.services.scraper_service import scraper_service
+from app.services.excel_service import excel_service
+from app.services.agent_service import agent_service
+from app.services.executors import run_in_thread
+from app.api.chat import ChatRequest
+from app.api.scraper import ScrapeRequest, BatchScrapeRequest, CrawlRequest
+from app.api.responses import json_response, sse_event, SSE_HEADERS
+
+router = APIRouter(prefix='/api/jobs', tags=['jobs'])
+
+# Seconds between keep-alive comments on a quiet event stream
+SSE_HEARTBEAT_SECONDS = 15
+
+
+def _submit(job_type: str, run: Callable[[Job], Awaitable[Any]]) -> dict:
+    try:
+        job = job_service.submit(job_type, run)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {'job_id': job.id, 'status': job.status}
+
+
+def _get_job(job_id: str) -> Job:
+    try:
+        return job_service.get(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post('/scrape')
+async def submit_scrape(request: ScrapeRequest):
+    """Scrape a table into a new workbook in the background"""
+    async def run(job: Job):
+        sheet = await scraper_service.scrape_table_sheet(request.url, request.table_index, job.report)
+        job.report('building', rows=sheet.n_rows)
+        workbook_id = await run_in_thread(excel_service.create_workbook_from_sheets, [sheet])
+        return {'workbook_id': workbook_id, 'rows': sheet.n_rows}
+
+    return _submit('scrape', run)
+
+
+@router.post('/batch')
+async def submit_batch(request: BatchScrapeRequest):
+    """Scrape many url/table targets into one multi-sheet workbook in the background"""
+    targets = [target.dict() for target in request.targets]
+
+    async def run(job: Job):
+        return await scraper_service.scrape_batch(targets, request.concurrency, job.report)
+
+    return _submit('batch', run)
+
+
+@router.post('/crawl')
+async def submit_crawl(request: CrawlRequest):
+    """Crawl a paginated table into one sheet in the background, each page reported as progress"""
+    async def run(job: Job):
+        events = scraper_service.crawl(
+            request.url, request.table_index, request.next_selector, request.url_pattern,
+            request.start_page, request.max_pages, request.sheet_name,
+        )
+        # Closed on cancel too, so a prefetched page is not left behind
+        async with aclosing(events):
+            async for event in events:
+                if event['event'] == 'done':
+                    return event
+                job.report('crawling', **{key: value for key, value in event.items() if key != 'event'})
+
+    return _submit('crawl', run)
+
+
+@router.post('/export/{workbook_id}')
+async def submit_export(workbook_id: str):
+    """Build a workbook's Excel export in the background, then download it from /api/jobs/{job_id}/file"""
+    async def run(job: Job):
+        job.report('building')
+        # Cancelled while building, export_to_file deletes the file once it
+        # is written; from here on the job owns it and removes it with itself
+        version, path = await excel_service.export_to_file(workbook_id)
+        job.files.append(path)
+        return {'workbook_id': workbook_id, 'version': version, 'file': f'/api/jobs/{job.id}/file'}
+
+    # Fail now rather than in the job for a workbook that does not exist
+    try:
+        await run_in_thread(excel_service.export_etag, workbook_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return _submit('export', run)
+
+
+@router.post('/chat')
+async def submit_chat(request: ChatRequest):
+    """Process a chat message in the background; the result is the usual chat response"""
+    async def run(job: Job):
+        return await agent_service.process_message(request.message, job.report)
+
+    return _submit('chat', run)
+
+
+@router.get('')
+async def list_jobs():
+    """Every job still kept, without results, and the pool's counters"""
+    return {'jobs': job_service.list_jobs(), 'stats': job_service.stats()}
+
+
+@router.get('/{job_id}')
+async def get_job(job_id: str):
+    """Status, progress and, once finished, result or error of a job"""
+    return await json_response(_get_job(job_id).snapshot())
+
+
+@router.get('/{job_id}/events')
+async def job_events(job_id: str):
+    """
+    Server-Sent Events of a job: a 'progress' event with its snapshot on
+    every change, then one 'done' event with the final state
+    """
+    job = _get_job(job_id)
+
+    async def events():
+        async for snapshot in job.watch(SSE_HEARTBEAT_SECONDS):
+            if snapshot is None:
+                yield ': keep-alive\n\n'
+                continue
+            name = 'done' if snapshot['status'] in FINISHED_STATUSES else 'progress'
+            yield await run_in_thread(sse_event, name, snapshot)
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers=SSE_HEADERS)
+
+
+@router.get('/{job_id}/file')
+async def job_file(job_id: str):
+    """Download the file an export job built"""
+    job = _get_job(job_id)
+    if job.status != 'succeeded' or not job.files:
+        raise HTTPException(status_code=409, detail=f'Job {job_id} has no file ({job.status})')
+    return FileResponse(
+        job.files[0],
+        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        filename=f"workbook_{job.result['workbook_id']}.xlsx",
+    )
+
+
+@router.delete('/{job_id}')
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    _get_job(job_id)
+    job = await job_service.cancel(job_id)
+    return job.snapshot(with_result=False)
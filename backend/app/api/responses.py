@@ -0,0 +1,25 @@
+import json
+from fastapi.responses import JSONResponse
+from app.services.executors import run_in_thread
+
+# Keep proxies from caching or buffering an event stream
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+async def json_response(content: dict) -> JSONResponse:
+    """
+    Render a potentially large JSON body in the thread pool
+    Returning a plain dict would serialize it on the event loop
+    """
+    return await run_in_thread(JSONResponse, content)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or any(tag.removeprefix('W/') == etag.removeprefix('W/') for tag in candidates)
+
+
+def sse_event(name: str, data) -> str:
+    """One Server-Sent Events message carrying data as JSON"""
+    return f'event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
@@ -1,5 +1,12 @@
+import json
 from fastapi import APIRouter, HTTPException, Body
-from app.services.scraper_service import scraper_service
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from app.services.scraper_service import scraper_service, DEFAULT_CRAWL_PAGES
+from app.services.excel_service import excel_service
+from app.services.executors import run_in_thread
+from app.services.http_client import http_client
+from app.api.responses import json_response
 from pydantic import BaseModel
 
 router = APIRouter(prefix='/api/scrape', tags=['scraper'])
@@ -10,31 +17,119 @@ class ScrapeRequest(BaseModel):
     table_index: int = 0
 
 
+class BatchScrapeTarget(BaseModel):
+    url: str
+    table_index: Optional[int] = 0  # None scrapes every table on the page
+    sheet_name: Optional[str] = None
+
+
+class BatchScrapeRequest(BaseModel):
+    targets: List[BatchScrapeTarget]
+    concurrency: Optional[int] = None
+
+
+class CrawlRequest(BaseModel):
+    url: Optional[str] = None
+    table_index: int = 0
+    next_selector: Optional[str] = None  # CSS selector of the next-page link, default rel="next"
+    url_pattern: Optional[str] = None  # e.g. https://example.com/list?page={page}, instead of next links
+    start_page: int = 1
+    max_pages: int = DEFAULT_CRAWL_PAGES
+    sheet_name: Optional[str] = None
+
+
 @router.post('/table')
 async def scrape_table(request: ScrapeRequest):
     """Scrape a table from a webpage"""
     try:
-        sheet = scraper_service.scrape_table(request.url, request.table_index)
-        return {
+        sheet = await scraper_service.scrape_table(request.url, request.table_index)
+        return await json_response({
             'message': f'Successfully scraped table with {len(sheet.rows)} rows',
             'data': sheet.dict()
-        }
+        })
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post('/batch')
+async def scrape_batch(request: BatchScrapeRequest):
+    """Scrape many url/table targets concurrently into one multi-sheet workbook"""
+    try:
+        targets = [target.dict() for target in request.targets]
+        batch = await scraper_service.scrape_batch(targets, request.concurrency)
+        workbook_id = batch['workbook_id']
+        return await json_response({
+            'message': f"Scraped {batch['succeeded']} of {len(targets)} targets",
+            **batch,
+            'data': await run_in_thread(excel_service.get_workbook_page, workbook_id) if workbook_id else None,
+        })
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post('/crawl')
+async def crawl(request: CrawlRequest):
+    """
+    Crawl a paginated table into one sheet, streaming one JSON line of
+    progress per page and a final 'done' line. The workbook exists from
+    the first line on and grows as pages arrive
+    """
+    events = scraper_service.crawl(
+        request.url, request.table_index, request.next_selector, request.url_pattern,
+        request.start_page, request.max_pages, request.sheet_name,
+    )
+    try:
+        # Fail with a status code while nothing has been sent yet
+        first = await events.__anext__()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def lines():
+        yield json.dumps(first, ensure_ascii=False) + '\n'
+        async for event in events:
+            yield json.dumps(event, ensure_ascii=False) + '\n'
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+
 @router.post('/list')
 async def scrape_list(url: str = Body(..., embed=True), list_index: int = Body(0, embed=True)):
     """Scrape a list from a webpage"""
     try:
-        sheet = scraper_service.scrape_list(url, list_index)
-        return {
+        sheet = await scraper_service.scrape_list(url, list_index)
+        return await json_response({
             'message': f'Successfully scraped list with {len(sheet.rows)} items',
             'data': sheet.dict()
-        }
+        })
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post('/index')
+async def page_index(url: str = Body(..., embed=True), sample_rows: int = Body(3, embed=True)):
+    """List every table and list on a webpage with its shape, header and sample rows"""
+    try:
+        return await json_response(await scraper_service.page_index(url, sample_rows))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get('/cache/stats')
+async def cache_stats():
+    """Counters of the scraped page cache, the parsed document cache and the HTTP client"""
+    cache = scraper_service.cache
+    return {
+        'cache': cache.stats() if cache else None,
+        'documents': scraper_service.documents.stats(),
+        'client': http_client.stats(),
+    }
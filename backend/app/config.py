@@ -0,0 +1,106 @@
+"""
+Runtime settings, read once from environment variables
+"""
+import os
+import tempfile
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+# Total size of generated XLSX files kept in the per-process export cache
+EXPORT_CACHE_MAX_BYTES = _env_int('WEB_EXCEL_EXPORT_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+
+# Workbook store: memory budget for sheet data, idle time before a
+# workbook is evicted from memory, and where evicted workbooks are spilled
+# (set WEB_EXCEL_SPILL_PATH to an empty string to drop them instead)
+WORKBOOK_MEMORY_BUDGET_BYTES = _env_int('WEB_EXCEL_WORKBOOK_MEMORY_BUDGET_BYTES', 512 * 1024 * 1024)
+WORKBOOK_TTL_SECONDS = _env_int('WEB_EXCEL_WORKBOOK_TTL_SECONDS', 2 * 60 * 60)
+WORKBOOK_SPILL_PATH = os.environ.get(
+    'WEB_EXCEL_SPILL_PATH', os.path.join(tempfile.gettempdir(), 'web-excel', 'spill.sqlite3')
+)
+WORKBOOK_SPILL_TTL_SECONDS = _env_int('WEB_EXCEL_SPILL_TTL_SECONDS', 7 * 24 * 60 * 60)
+
+# Where state shared between worker processes lives: memory:// (single
+# worker), sqlite:///path/to/state.sqlite3 or redis://host:port/db, and
+# how long an untouched workbook is kept there
+STATE_BACKEND_URL = os.environ.get('WEB_EXCEL_STATE_BACKEND', 'memory://')
+SHARED_STATE_TTL_SECONDS = _env_int('WEB_EXCEL_SHARED_STATE_TTL_SECONDS', 7 * 24 * 60 * 60)
+
+# Upload import limits: file size, decompressed size of an XLSX archive,
+# and rows and columns per sheet
+IMPORT_MAX_BYTES = _env_int('WEB_EXCEL_IMPORT_MAX_BYTES', 200 * 1024 * 1024)
+IMPORT_MAX_UNPACKED_BYTES = _env_int('WEB_EXCEL_IMPORT_MAX_UNPACKED_BYTES', 1024 * 1024 * 1024)
+IMPORT_MAX_ROWS = _env_int('WEB_EXCEL_IMPORT_MAX_ROWS', 2_000_000)
+IMPORT_MAX_COLUMNS = _env_int('WEB_EXCEL_IMPORT_MAX_COLUMNS', 1024)
+
+# Worker pools for blocking work: threads for blocking calls, processes
+# for CPU-bound parsing and export builds (0 picks a size from the CPU count)
+THREAD_POOL_SIZE = _env_int('WEB_EXCEL_THREAD_POOL_SIZE', 16)
+PROCESS_POOL_SIZE = _env_int('WEB_EXCEL_PROCESS_POOL_SIZE', 0)
+
+# Chart images: matplotlib worker processes, and the total size of
+# rendered images kept for identical charts
+CHART_RENDER_PROCESSES = _env_int('WEB_EXCEL_CHART_RENDER_PROCESSES', 2)
+CHART_RENDER_CACHE_MAX_BYTES = _env_int('WEB_EXCEL_CHART_RENDER_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+
+# Parsed numeric sheet columns kept for repeated charts of unchanged sheets
+NUMERIC_CACHE_MAX_BYTES = _env_int('WEB_EXCEL_NUMERIC_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+
+# Bound charts whose derived series are kept in memory and updated on edits
+CHART_SERIES_MAX_CHARTS = _env_int('WEB_EXCEL_CHART_SERIES_MAX_CHARTS', 64)
+
+# Scraper HTTP client: requests in flight overall and per host, requests
+# started per second per host (0 for no limit), retries of failed or
+# throttled requests with exponential backoff, and the request timeout
+SCRAPE_MAX_IN_FLIGHT = _env_int('WEB_EXCEL_SCRAPE_MAX_IN_FLIGHT', 32)
+SCRAPE_PER_HOST_CONCURRENCY = _env_int('WEB_EXCEL_SCRAPE_PER_HOST_CONCURRENCY', 4)
+SCRAPE_PER_HOST_RATE = _env_float('WEB_EXCEL_SCRAPE_PER_HOST_RATE', 5.0)
+SCRAPE_MAX_RETRIES = _env_int('WEB_EXCEL_SCRAPE_MAX_RETRIES', 3)
+SCRAPE_BACKOFF_SECONDS = _env_float('WEB_EXCEL_SCRAPE_BACKOFF_SECONDS', 0.5)
+SCRAPE_TIMEOUT_SECONDS = _env_float('WEB_EXCEL_SCRAPE_TIMEOUT_SECONDS', 10.0)
+
+# Largest page body downloaded, and the size above which a page is parsed
+# as a stream straight into sheet storage instead of in memory
+SCRAPE_MAX_BYTES = _env_int('WEB_EXCEL_SCRAPE_MAX_BYTES', 512 * 1024 * 1024)
+SCRAPE_IN_MEMORY_PARSE_BYTES = _env_int('WEB_EXCEL_SCRAPE_IN_MEMORY_PARSE_BYTES', 16 * 1024 * 1024)
+
+# Batch scrapes: pages fetched and parsed at once, and targets per batch
+SCRAPE_BATCH_CONCURRENCY = _env_int('WEB_EXCEL_SCRAPE_BATCH_CONCURRENCY', 8)
+SCRAPE_BATCH_MAX_TARGETS = _env_int('WEB_EXCEL_SCRAPE_BATCH_MAX_TARGETS', 200)
+
+# Most pages one crawl of a paginated listing may follow
+SCRAPE_CRAWL_MAX_PAGES = _env_int('WEB_EXCEL_SCRAPE_CRAWL_MAX_PAGES', 1000)
+
+# Rows of each sheet a streamed chat response sends; the grid reads the
+# rest in ranges
+CHAT_STREAM_MAX_ROWS = _env_int('WEB_EXCEL_CHAT_STREAM_MAX_ROWS', 100_000)
+
+# Background jobs: jobs running at once overall and per job type
+# (type=limit pairs, types not listed share the overall limit), jobs
+# allowed to wait for a slot, and how long finished jobs are kept
+JOB_MAX_WORKERS = _env_int('WEB_EXCEL_JOB_MAX_WORKERS', 8)
+JOB_TYPE_LIMITS = os.environ.get('WEB_EXCEL_JOB_TYPE_LIMITS', 'scrape=4,batch=2,crawl=2,export=2,chat=4')
+JOB_MAX_QUEUED = _env_int('WEB_EXCEL_JOB_MAX_QUEUED', 256)
+JOB_TTL_SECONDS = _env_int('WEB_EXCEL_JOB_TTL_SECONDS', 60 * 60)
+
+# On-disk cache of scraped pages (set WEB_EXCEL_HTTP_CACHE_DIR to an empty
+# string to disable it), its size cap, and how long a page that sends no
+# freshness information is reused before being revalidated
+HTTP_CACHE_DIR = os.environ.get('WEB_EXCEL_HTTP_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'web-excel', 'http-cache'))
+HTTP_CACHE_MAX_BYTES = _env_int('WEB_EXCEL_HTTP_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+HTTP_CACHE_DEFAULT_TTL_SECONDS = _env_int('WEB_EXCEL_HTTP_CACHE_DEFAULT_TTL_SECONDS', 300)
+
+# Parsed pages (every table and list) kept in memory for repeat scrapes
+DOCUMENT_CACHE_MAX_BYTES = _env_int('WEB_EXCEL_DOCUMENT_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+
+# HTML parser for scraped pages: auto (lxml when installed, falling back
+# to html.parser) or html.parser to always use the pure-Python parser
+HTML_PARSER = os.environ.get('WEB_EXCEL_HTML_PARSER', 'auto')
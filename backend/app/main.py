@@ -1,11 +1,29 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import chat, excel, scraper, chart
+from app.api import chat, excel, scraper, chart, jobs
+from app.services import executors
+from app.services.http_client import http_client
+from app.services.job_service import job_service
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Spawn the parse/export worker processes before traffic arrives
+    executors.start()
+    yield
+    # Cancel background jobs still queued or running
+    await job_service.shutdown()
+    # Let queued parse and export work finish and stop the worker processes
+    executors.shutdown()
+    http_client.close()
+
 
 app = FastAPI(
     title='Web Excel Agent API',
     description='AI-powered Excel web application with web scraping capabilities',
-    version='0.1.0'
+    version='0.1.0',
+    lifespan=lifespan,
 )
 
 # Configure CORS
@@ -22,6 +40,7 @@ app.include_router(chat.router)
 app.include_router(excel.router)
 app.include_router(scraper.router)
 app.include_router(chart.router)
+app.include_router(jobs.router)
 
 
 @app.get('/')
@@ -35,6 +54,7 @@ async def root():
             'excel': '/api/excel',
             'scrape': '/api/scrape',
             'chart': '/api/chart',
+            'jobs': '/api/jobs',
         }
     }
 
@@ -29,6 +29,7 @@ class Workbook(BaseModel):
     id: Optional[str] = None
     sheets: List[Sheet]
     active_sheet: int = 0
+    version: int = 0  # Bumped by the server on every change
 
     class Config:
         json_schema_extra = {
@@ -51,8 +52,71 @@ class UpdateCellRequest(BaseModel):
     value: str
 
 
+class PatchOperation(BaseModel):
+    row: int
+    col: int
+    value: Optional[str] = None  # Single cell write at (row, col)
+    values: Optional[List[List[str]]] = None  # Block write anchored at (row, col)
+
+
+class PatchRequest(BaseModel):
+    sheet_index: int
+    operations: List[PatchOperation]
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "sheet_index": 0,
+                "operations": [
+                    {"row": 0, "col": 0, "value": "Name"},
+                    {"row": 1, "col": 0, "values": [["Alice", "30"], ["Bob", "25"]]},
+                ],
+            }
+        }
+
+
+class SyncPatchRequest(BaseModel):
+    base_version: int  # Workbook version the changes were made against
+    changes: List[PatchRequest]
+
+
 class ChartConfig(BaseModel):
     type: str  # bar, line, pie
     title: Optional[str] = None
     data: List[dict]
     columns: Optional[List[str]] = None
+    max_points: Optional[int] = None  # downsample bar/line data to about this many points
+
+
+class BoundChartRequest(BaseModel):
+    sheet_index: int = 0
+    type: str = 'bar'  # bar, line, pie
+    title: Optional[str] = None
+    label_col: int = 0
+    value_cols: Optional[List[int]] = None  # the mostly numeric columns if omitted
+    row_start: int = 1  # first data row, the row above holds the series names
+    row_stop: Optional[int] = None  # end of the sheet, following appended rows, if omitted
+    max_points: Optional[int] = None
+
+
+class AggregateChartRequest(BaseModel):
+    workbook_id: str
+    sheet_index: int = 0
+    group_col: int = 0
+    value_cols: Optional[List[int]] = None  # every column but the group columns if omitted
+    agg: str = 'sum'  # sum, mean, count, min, max
+    pivot_col: Optional[int] = None  # each distinct value becomes a series
+    type: str = 'bar'  # bar, line, pie
+    title: Optional[str] = None
+    sort_by: Optional[str] = None  # label, value
+    limit: Optional[int] = None
+
+
+class SheetChartRequest(BaseModel):
+    workbook_id: str
+    sheet_index: int = 0
+    type: str = 'bar'  # bar, line, pie
+    label_col: int = 0
+    value_cols: Optional[List[int]] = None  # every column but label_col if omitted
+    title: Optional[str] = None
+    max_points: Optional[int] = None
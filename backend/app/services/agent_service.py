@@ -1,9 +1,19 @@
+import asyncio
 import re
-from typing import Dict, Literal
+from typing import AsyncIterator, Callable, Dict, List, Literal, Optional
 from app.services.scraper_service import scraper_service
 from app.services.excel_service import excel_service
 from app.services.chart_service import chart_service
+from app.services.state_backend import state_backend
+from app.services.executors import run_in_thread
 from app.models.excel import Workbook
+from app.config import CHAT_STREAM_MAX_ROWS
+
+# Rows per 'rows' event of a streamed response
+STREAM_CHUNK_ROWS = 1000
+
+# Labels of a closing total row, left out of charts of the current workbook
+TOTAL_LABELS = ('总计', '合计', 'Total', 'total')
 
 
 class AgentService:
@@ -12,32 +22,100 @@ class AgentService:
     Can be replaced with real LLM integration later
     """
 
-    def __init__(self):
-        self.current_workbook_id = None  # Track current workbook for charts
+    @property
+    def current_workbook_id(self):
+        """Current workbook for charts, shared by all workers"""
+        return state_backend.get_value('agent:current_workbook_id')
+
+    @current_workbook_id.setter
+    def current_workbook_id(self, workbook_id):
+        state_backend.set_value('agent:current_workbook_id', workbook_id)
 
-    def process_message(self, message: str) -> Dict:
+    async def process_message(self, message: str, progress: Optional[Callable[..., None]] = None) -> Dict:
         """
         Process user message and determine intent and actions
-        Returns a response with action results
+        Returns a response with action results. progress, if given, is
+        called with each stage a long action reaches
         """
         message_lower = message.lower()
 
         # Pattern 0: Demo data
         if self._contains_demo_request(message_lower):
-            return self._handle_demo_request()
+            return await run_in_thread(self._handle_demo_request)
 
         # Pattern 1: Scrape webpage table
         if self._contains_scrape_request(message_lower):
-            return self._handle_scrape_request(message)
+            return await self._handle_scrape_request(message, progress)
 
         # Pattern 2: Create chart
         elif self._contains_chart_request(message_lower):
-            return self._handle_chart_request(message)
+            return await run_in_thread(self._handle_chart_request, message)
 
         # Pattern 3: General help
         else:
             return self._handle_help(message)
 
+    async def stream_message(self, message: str) -> AsyncIterator[Dict]:
+        """
+        Process user message as a stream of events, so long actions show
+        something at once: 'message' first (an acknowledgement while a
+        scrape runs), 'status' for each stage reached, then for a workbook
+        response 'workbook' with its first page and 'rows' chunks of the
+        remaining rows, and 'done' with the final message last
+        """
+        acknowledgement = self._acknowledgement(message)
+        if acknowledgement:
+            yield {'event': 'message', 'message': acknowledgement}
+
+        events: asyncio.Queue = asyncio.Queue()
+
+        def progress(stage: str, **info):
+            events.put_nowait({'event': 'status', 'stage': stage, **info})
+
+        task = asyncio.create_task(self.process_message(message, progress))
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+            response = task.result()
+        finally:
+            # The client went away mid-scrape
+            task.cancel()
+
+        if not acknowledgement:
+            yield {'event': 'message', 'message': response['message']}
+
+        if response['type'] == 'excel':
+            handle = response['data']
+            yield {'event': 'workbook', 'data': handle}
+            for sheet_index, sheet in enumerate(handle['sheets']):
+                stop = min(sheet['n_rows'], CHAT_STREAM_MAX_ROWS)
+                for row_start in range(len(sheet['rows']), stop, STREAM_CHUNK_ROWS):
+                    window = await run_in_thread(
+                        excel_service.read_range, handle['id'], sheet_index, row_start,
+                        min(STREAM_CHUNK_ROWS, stop - row_start),
+                    )
+                    yield {'event': 'rows', 'sheet_index': sheet_index, 'row_start': row_start, 'rows': window['rows']}
+
+        yield {
+            'event': 'done',
+            'message': response['message'],
+            'type': response['type'],
+            'data': None if response['type'] == 'excel' else response.get('data'),
+        }
+
+    def _acknowledgement(self, message: str) -> Optional[str]:
+        """Reply sent before a scrape starts, None for messages answered at once"""
+        message_lower = message.lower()
+        if self._contains_demo_request(message_lower) or not self._contains_scrape_request(message_lower):
+            return None
+        urls = self._extract_urls(message)
+        if not urls:
+            return None
+        if len(urls) == 1:
+            return f'正在抓取 {urls[0]} 的表格数据...'
+        return f'正在抓取 {len(urls)} 个网页的表格数据...'
+
     def _contains_demo_request(self, message: str) -> bool:
         keywords = ['demo', '演示', '测试数据', 'test data', 'example', '示例']
         return any(keyword in message for keyword in keywords)
@@ -50,6 +128,10 @@ class AgentService:
         keywords = ['图表', 'chart', '柱状图', '折线图', '饼图', '创建', '生成']
         return any(keyword in message for keyword in keywords)
 
+    def _extract_urls(self, message: str) -> List[str]:
+        """Extract every URL from message, in order and without repeats"""
+        return list(dict.fromkeys(re.findall(r'https?://[^\s]+', message)))
+
     def _extract_url(self, message: str) -> str:
         """Extract URL from message"""
         url_pattern = r'https?://[^\s]+'
@@ -80,22 +162,9 @@ class AgentService:
         workbook = Workbook(sheets=[demo_sheet])
         workbook_id = excel_service.create_workbook(workbook)
 
-        # Store current workbook ID for chart creation
-        self.current_workbook_id = workbook_id
-
-        created_workbook = excel_service.get_workbook(workbook_id)
+        return self._workbook_response(workbook_id, '已生成演示数据：包含6个月的销售数据，可以测试编辑、导出和图表功能')
 
-        return {
-            'message': '已生成演示数据：包含6个月的销售数据，可以测试编辑、导出和图表功能',
-            'type': 'excel',
-            'data': {
-                'id': workbook_id,
-                'sheets': [s.dict() for s in created_workbook.sheets],
-                'active_sheet': 0,
-            },
-        }
-
-    def _handle_scrape_request(self, message: str) -> Dict:
+    async def _handle_scrape_request(self, message: str, progress: Optional[Callable[..., None]] = None) -> Dict:
         """Handle web scraping request"""
         url = self._extract_url(message)
 
@@ -112,35 +181,60 @@ class AgentService:
             if index_match:
                 table_index = int(index_match.group(1)) - 1
 
-            # Scrape the table
-            sheet = scraper_service.scrape_table(url, table_index)
+            # Several pages, or every table of a page, go into one workbook
+            urls = self._extract_urls(message)
+            all_tables = re.search(r'所有表格|全部表格|all tables', message, re.IGNORECASE)
+            if len(urls) > 1 or all_tables:
+                return await self._handle_batch_scrape(urls, None if all_tables else table_index, progress)
 
-            # Create workbook
-            workbook = Workbook(sheets=[sheet])
-            workbook_id = excel_service.create_workbook(workbook)
+            # Scrape the table straight into columnar storage
+            sheet = await scraper_service.scrape_table_sheet(url, table_index, progress)
 
-            # Store current workbook ID for chart creation
-            self.current_workbook_id = workbook_id
+            # Create workbook
+            if progress is not None:
+                progress('building', rows=sheet.n_rows)
+            workbook_id = await run_in_thread(excel_service.create_workbook_from_sheets, [sheet])
 
-            # Get the workbook data
-            created_workbook = excel_service.get_workbook(workbook_id)
+            return await run_in_thread(
+                self._workbook_response, workbook_id, f'成功抓取 {url} 的表格数据，共 {sheet.n_rows} 行数据',
+            )
 
+        except Exception as e:
             return {
-                'message': f'成功抓取 {url} 的表格数据，共 {len(sheet.rows)} 行数据',
-                'type': 'excel',
-                'data': {
-                    'id': workbook_id,
-                    'sheets': [s.dict() for s in created_workbook.sheets],
-                    'active_sheet': 0,
-                },
+                'message': f'抓取失败: {str(e)}',
+                'type': 'error',
             }
 
-        except Exception as e:
+    async def _handle_batch_scrape(self, urls: List[str], table_index: Optional[int],
+                                   progress: Optional[Callable[..., None]] = None) -> Dict:
+        """Scrape the same table (or every table) of several pages into one workbook"""
+        targets = [{'url': url, 'table_index': table_index} for url in urls]
+        batch = await scraper_service.scrape_batch(targets, progress=progress)
+        errors = [f"{result['url']}: {result['error']}" for result in batch['results'] if result['status'] == 'error']
+        if not batch['workbook_id']:
             return {
-                'message': f'抓取失败: {str(e)}',
+                'message': '抓取失败: ' + '; '.join(errors),
                 'type': 'error',
             }
 
+        n_sheets = sum(len(result['sheets']) for result in batch['results'] if result['status'] == 'ok')
+        message = f"成功抓取 {batch['succeeded']} 个网页，共 {n_sheets} 个表格"
+        if errors:
+            message += f"，{batch['failed']} 个失败: " + '; '.join(errors)
+        return await run_in_thread(self._workbook_response, batch['workbook_id'], message)
+
+    def _workbook_response(self, workbook_id: str, message: str) -> Dict:
+        """Make a workbook the current one and answer with it; blocking, call it in a thread"""
+        # Store current workbook ID for chart creation
+        self.current_workbook_id = workbook_id
+
+        # Send a handle with the first page, the grid loads the rest on demand
+        return {
+            'message': message,
+            'type': 'excel',
+            'data': excel_service.get_workbook_page(workbook_id),
+        }
+
     def _handle_chart_request(self, message: str) -> Dict:
         """Handle chart creation request"""
         # Determine chart type
@@ -153,6 +247,15 @@ class AgentService:
             chart_type = 'pie'
             chart_name = '饼图'
 
+        # Chart the current workbook when there is one, bound to its rows
+        chart = self._bind_current_chart(chart_type, chart_name)
+        if chart is not None:
+            return {
+                'message': f'已根据当前表格创建{chart_name}，编辑表格会自动更新，并将在导出Excel时包含',
+                'type': 'chart',
+                'data': chart,
+            }
+
         # Get demo data for chart (using sales data)
         chart_data = [
             { 'name': '一月', 'value': 50000 },
@@ -179,6 +282,22 @@ class AgentService:
             'data': chart
         }
 
+    def _bind_current_chart(self, chart_type: str, chart_name: str) -> Optional[Dict]:
+        """
+        A chart bound to the first sheet of the current workbook, leaving out
+        a closing total row; None if there is no workbook or nothing to chart
+        """
+        workbook_id = self.current_workbook_id
+        if not workbook_id:
+            return None
+        try:
+            n_rows = excel_service.read_range(workbook_id, 0, 0, 0)['n_rows']
+            last = excel_service.read_range(workbook_id, 0, n_rows - 1, 1, 0, 1)['rows']
+            row_stop = n_rows - 1 if last and last[0] and last[0][0].strip() in TOTAL_LABELS else None
+            return chart_service.bind_chart(workbook_id, 0, chart_type, chart_name, row_stop=row_stop)
+        except ValueError:
+            return None
+
     def _handle_help(self, message: str) -> Dict:
         """Handle general help request"""
         help_messages = {
@@ -0,0 +1,86 @@
+"""
+Group-by and pivot aggregation of sheet columns
+
+Grouping is hash based and takes one pass over the rows: every distinct
+value of the group column gets an integer code, in order of first
+appearance, through a dict (a dictionary-encoded column already has
+such codes and only needs them renumbered). Aggregates are then computed
+per code in one vectorized pass each: np.bincount for counts and sums,
+np.minimum.at / np.maximum.at for min and max. A pivot combines the row
+and column group codes into one code per cell of the result grid, so it
+is the same single pass. Rows with a blank group cell are left out, and
+so are blank and non-numeric values.
+"""
+from typing import List, Tuple
+import numpy as np
+from app.services.sheet_store import Column
+
+AGGREGATIONS = ('sum', 'mean', 'count', 'min', 'max')
+
+
+def factorize(column: Column, start: int = 1) -> Tuple[np.ndarray, List[str]]:
+    """
+    Group codes of a column's cells from row start on, numbered in order
+    of first appearance, and the value of each code. Blank cells get -1
+    """
+    if column.kind == 'str':
+        return _factorize_codes(np.frombuffer(column.data, dtype=f'u{column.data.itemsize}')[start:], column.pool)
+
+    index = {}
+    setdefault = index.setdefault
+    values = column.slice(start, len(column))
+    codes = np.fromiter((setdefault(value, len(index)) for value in values), np.int64, len(values))
+    keys = list(index)
+    blank = index.get('')
+    if blank is not None:
+        codes[codes == blank] = -1
+        codes[codes > blank] -= 1
+        del keys[blank]
+    return codes, keys
+
+
+def _factorize_codes(pool_codes: np.ndarray, pool: List[str]) -> Tuple[np.ndarray, List[str]]:
+    """Renumber dictionary codes in order of first appearance, dropping unused and blank entries"""
+    n = len(pool_codes)
+    pool_codes = pool_codes.astype(np.int64)
+    first = np.full(len(pool), n, dtype=np.int64)
+    np.minimum.at(first, pool_codes, np.arange(n))
+    # Code 0 is the blank cell
+    first[0] = n
+    used = np.flatnonzero(first < n)
+    used = used[np.argsort(first[used], kind='stable')]
+
+    renumber = np.full(len(pool), -1, dtype=np.int64)
+    renumber[used] = np.arange(len(used))
+    return renumber[pool_codes], [pool[code] for code in used.tolist()]
+
+
+def group_reduce(codes: np.ndarray, n_groups: int, values: np.ndarray, how: str) -> np.ndarray:
+    """
+    Aggregate values by group code in one pass
+    Values that are NaN and codes below 0 are skipped; a group without
+    values is NaN, or 0 for a count
+    """
+    if how not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation: {how}. Use one of {', '.join(AGGREGATIONS)}")
+
+    keep = (codes >= 0) & ~np.isnan(values)
+    codes, values = codes[keep], values[keep]
+    counts = np.bincount(codes, minlength=n_groups).astype(np.float64)
+    if how == 'count':
+        return counts
+
+    if how in ('sum', 'mean'):
+        result = np.bincount(codes, weights=values, minlength=n_groups)
+        if how == 'mean':
+            result /= np.maximum(counts, 1)
+    else:
+        result = np.full(n_groups, np.inf if how == 'min' else -np.inf)
+        (np.minimum if how == 'min' else np.maximum).at(result, codes, values)
+    result[counts == 0] = np.nan
+    return result
+
+
+def pivot_codes(row_codes: np.ndarray, col_codes: np.ndarray, n_cols: int) -> np.ndarray:
+    """One code per (row group, column group) cell of a pivot, -1 where either is blank"""
+    return np.where((row_codes >= 0) & (col_codes >= 0), row_codes * n_cols + col_codes, -1)
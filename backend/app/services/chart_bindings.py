@@ -0,0 +1,277 @@
+"""
+Charts bound to sheet ranges
+
+A bound chart stores where its data lives rather than a copy of it: a
+sheet, a label column, value columns and a row range, with the series
+names in the row just above the range. Its derived series (labels and
+numeric values) are computed once and then kept current: an edit inside
+the range recomputes only the edited points, rows added below a range
+that runs to the end of the sheet are parsed and appended, and changes
+the cache is not told about (a full sync, say) leave it at an older
+workbook version, so the series is recomputed in full on the next read.
+Exports reference the range's cells directly.
+
+Callers hold the workbook's lock around every call here.
+"""
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from app.services.numeric_columns import parse_numbers
+from app.services.sheet_store import ColumnarSheet, StoredWorkbook
+from app.config import CHART_SERIES_MAX_CHARTS
+
+CHART_TYPES = ('bar', 'line', 'pie')
+
+# Once an edit touches more than this share of a chart's points,
+# recomputing the whole series is cheaper than patching it
+MAX_PATCH_RATIO = 0.25
+
+# An edited block of a sheet: row, col, rows, cols
+Rect = Tuple[int, int, int, int]
+
+
+def is_bound(chart: dict) -> bool:
+    return 'range' in chart
+
+
+def bind_chart(sheet: ColumnarSheet, sheet_index: int, chart_type: str = 'bar', title: Optional[str] = None,
+               label_col: int = 0, value_cols: Optional[List[int]] = None, row_start: int = 1,
+               row_stop: Optional[int] = None, max_points: Optional[int] = None) -> dict:
+    """
+    A bound chart over rows [row_start, row_stop) of a sheet, the series
+    names taken from row row_start - 1. row_stop None runs to the end of
+    the sheet, following rows added later. Value columns default to the
+    columns, other than the label column, where most cells are numbers
+    """
+    if chart_type not in CHART_TYPES:
+        raise ValueError(f"Unsupported chart type: {chart_type}. Use one of {', '.join(CHART_TYPES)}")
+    if row_start < 1:
+        raise ValueError("row_start must be at least 1, the row above it holds the series names")
+    if row_stop is not None and row_stop <= row_start:
+        raise ValueError("row_stop must be after row_start")
+    stop = sheet.n_rows if row_stop is None else min(row_stop, sheet.n_rows)
+    if stop <= row_start:
+        raise ValueError("Insufficient data for chart")
+
+    if value_cols is None:
+        value_cols = [
+            col for col in range(sheet.n_cols)
+            if col != label_col and _mostly_numbers(sheet.columns[col].slice(row_start, stop))
+        ]
+    for col in [label_col, *value_cols]:
+        if col < 0 or col >= sheet.n_cols:
+            raise ValueError(f"Column {col} out of range")
+    if not value_cols:
+        raise ValueError("No value columns for chart")
+    if chart_type == 'pie':
+        # A pie shows one series
+        value_cols = value_cols[:1]
+
+    return {
+        'id': str(uuid.uuid4()),
+        'type': chart_type,
+        'title': title,
+        'max_points': max_points,
+        'range': {
+            'sheet_index': sheet_index,
+            'label_col': label_col,
+            'value_cols': list(value_cols),
+            'row_start': row_start,
+            'row_stop': row_stop,
+        },
+    }
+
+
+def _mostly_numbers(cells: List[str]) -> bool:
+    return np.count_nonzero(~np.isnan(parse_numbers(cells))) * 2 > len(cells)
+
+
+def range_stop(sheet: ColumnarSheet, chart_range: dict) -> int:
+    """Row after the last row of a range, clipped to the sheet"""
+    row_stop = chart_range['row_stop']
+    return sheet.n_rows if row_stop is None else min(row_stop, sheet.n_rows)
+
+
+def _cells(sheet: ColumnarSheet, col: int, start: int, stop: int) -> List[str]:
+    """Cells of rows [start, stop) of a column; a column a full sync removed reads as blank"""
+    if col >= sheet.n_cols:
+        return [''] * max(0, stop - start)
+    return sheet.columns[col].slice(start, stop)
+
+
+def _cell(sheet: ColumnarSheet, row: int, col: int) -> str:
+    return sheet.get(row, col) if col < sheet.n_cols and row < sheet.n_rows else ''
+
+
+class ChartSeries:
+    """Series names, labels and numeric values of a bound chart's range at one workbook version"""
+
+    __slots__ = ('version', 'stop', 'headers', 'labels', 'values')
+
+    def __init__(self, version: int, stop: int, headers: List[str], labels: List[str], values: List[np.ndarray]):
+        self.version = version
+        self.stop = stop
+        self.headers = headers
+        self.labels = labels
+        self.values = values
+
+    @classmethod
+    def compute(cls, sheet: ColumnarSheet, chart_range: dict, version: int) -> 'ChartSeries':
+        start = chart_range['row_start']
+        stop = max(start, range_stop(sheet, chart_range))
+        return cls(
+            version,
+            stop,
+            [_cell(sheet, start - 1, col) for col in chart_range['value_cols']],
+            _cells(sheet, chart_range['label_col'], start, stop),
+            [parse_numbers(_cells(sheet, col, start, stop)) for col in chart_range['value_cols']],
+        )
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def update_rows(self, sheet: ColumnarSheet, chart_range: dict, rows: np.ndarray):
+        """Recompute the points of the given sheet rows"""
+        if not len(rows):
+            return
+        start = chart_range['row_start']
+        label_col = chart_range['label_col']
+        row_list = rows.tolist()
+        for row in row_list:
+            self.labels[row - start] = _cell(sheet, row, label_col)
+        points = rows - start
+        for values, col in zip(self.values, chart_range['value_cols']):
+            values[points] = parse_numbers([_cell(sheet, row, col) for row in row_list])
+
+    def extend(self, sheet: ColumnarSheet, chart_range: dict):
+        """Append the points of rows the range gained at its end"""
+        stop = range_stop(sheet, chart_range)
+        if stop <= self.stop:
+            return
+        self.labels.extend(_cells(sheet, chart_range['label_col'], self.stop, stop))
+        self.values = [
+            np.concatenate([values, parse_numbers(_cells(sheet, col, self.stop, stop))])
+            for values, col in zip(self.values, chart_range['value_cols'])
+        ]
+        self.stop = stop
+
+    def select(self, rows: Optional[np.ndarray]) -> Tuple[List[str], List[np.ndarray]]:
+        """Copies of the labels and values of the given points (None for all)"""
+        if rows is None:
+            return list(self.labels), [values.copy() for values in self.values]
+        return [self.labels[row] for row in rows.tolist()], [values[rows] for values in self.values]
+
+
+def _touched(chart_range: dict, stop: int, rects: List[Rect]) -> Tuple[List[Tuple[int, int]], bool, int]:
+    """
+    Row spans of a range that edits touched, whether they touched the
+    header row above it, and how many rows the spans add up to
+    """
+    start = chart_range['row_start']
+    cols = {chart_range['label_col'], *chart_range['value_cols']}
+    spans = []
+    header = False
+    count = 0
+    for row, col, n_rows, n_cols in rects:
+        if not any(col <= chart_col < col + n_cols for chart_col in cols):
+            continue
+        header = header or row <= start - 1 < row + n_rows
+        first, last = max(row, start), min(row + n_rows, stop)
+        if first < last:
+            spans.append((first, last))
+            count += last - first
+    return spans, header, count
+
+
+class ChartSeriesCache:
+    """Derived series of bound charts, least recently used dropped first"""
+
+    def __init__(self, max_charts: int):
+        self.max_charts = max_charts
+        self._entries: 'OrderedDict[Tuple[str, str], ChartSeries]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.patched_points = 0
+
+    def series(self, workbook: StoredWorkbook, chart: dict) -> ChartSeries:
+        """
+        A bound chart's current series, computed in full only if not kept
+        up to date. Later edits change it in place, read it under the lock
+        """
+        key = (workbook.id, chart['id'])
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == workbook.version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        chart_range = chart['range']
+        entry = ChartSeries.compute(workbook.sheets[chart_range['sheet_index']], chart_range, workbook.version)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_charts:
+                self._entries.popitem(last=False)
+        return entry
+
+    def advance(self, workbook: StoredWorkbook, old_version: int, edits: Dict[int, List[Rect]]) -> List[str]:
+        """
+        Carry kept series from old_version to the workbook's current version,
+        given every block edited in between by sheet index (no edits for a
+        change to anything but cells). Returns the ids of charts whose points changed
+        """
+        changed = []
+        with self._lock:
+            for chart in workbook.charts:
+                if not is_bound(chart):
+                    continue
+                key = (workbook.id, chart['id'])
+                entry = self._entries.get(key)
+                if entry is None or entry.version != old_version:
+                    continue
+
+                chart_range = chart['range']
+                rects = edits.get(chart_range['sheet_index'])
+                if rects:
+                    sheet = workbook.sheets[chart_range['sheet_index']]
+                    spans, header, count = _touched(chart_range, entry.stop, rects)
+                    if count > max(1, len(entry)) * MAX_PATCH_RATIO:
+                        # Left stale, the next read recomputes it
+                        del self._entries[key]
+                        changed.append(chart['id'])
+                        continue
+
+                    stop = entry.stop
+                    rows = np.unique(np.concatenate([np.arange(first, last) for first, last in spans] or [[]]))
+                    entry.update_rows(sheet, chart_range, rows.astype(np.int64))
+                    if header:
+                        entry.headers = [_cell(sheet, chart_range['row_start'] - 1, col) for col in chart_range['value_cols']]
+                    entry.extend(sheet, chart_range)
+                    self.patched_points += len(rows) + entry.stop - stop
+                    if len(rows) or header or entry.stop != stop:
+                        changed.append(chart['id'])
+                entry.version = workbook.version
+        return changed
+
+    def drop(self, workbook_id: str, chart_id: str):
+        with self._lock:
+            self._entries.pop((workbook_id, chart_id), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'charts': len(self._entries),
+                'max_charts': self.max_charts,
+                'hits': self.hits,
+                'misses': self.misses,
+                'patched_points': self.patched_points,
+            }
+
+
+# Global instance
+chart_series_cache = ChartSeriesCache(CHART_SERIES_MAX_CHARTS)
@@ -0,0 +1,163 @@
+"""
+Chart images with a content-addressed cache
+
+Charts are drawn by matplotlib in a small pool of worker processes that
+import it as they start (see executors.render_pool). Each render draws on
+its own Figure instead of pyplot's global state, so concurrent renders
+cannot draw into each other's charts. Images are cached under a hash of
+the chart's type, title, data and columns plus the image format: an
+identical chart is drawn once, and requests for a chart already being
+drawn wait for that render instead of starting another.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from app.services.executors import render_pool
+from app.config import CHART_RENDER_CACHE_MAX_BYTES
+
+# Image formats and their media types
+FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+    'pdf': 'application/pdf',
+}
+
+
+def chart_key(chart_config: dict, format: str) -> str:
+    """Hash identifying the image of a chart in a format"""
+    content = {field: chart_config.get(field) for field in ('type', 'title', 'data', 'columns')}
+    encoded = json.dumps(content, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(f'{format}:{encoded}'.encode()).hexdigest()
+
+
+def render_chart(chart_config: dict, format: str) -> bytes:
+    """Draw a chart as an image. Module-level so it can run in the process pool"""
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+
+    chart_type = chart_config.get('type', 'bar')
+    data = chart_config.get('data', [])
+
+    if chart_type == 'bar':
+        x_values = [item.get('name', '') for item in data]
+        y_values = [item.get(list(item.keys())[1], 0) for item in data]
+
+        ax.bar(x_values, y_values)
+    elif chart_type == 'line':
+        x_values = [item.get('name', '') for item in data]
+        y_values = [item.get(list(item.keys())[1], 0) for item in data]
+
+        ax.plot(x_values, y_values, marker='o')
+    elif chart_type == 'pie':
+        labels = [item.get('name', '') for item in data]
+        sizes = [item.get('value', 0) for item in data]
+
+        ax.pie(sizes, labels=labels, autopct='%1.1f%%')
+
+    fig.tight_layout()
+
+    output = io.BytesIO()
+    fig.savefig(output, format=format)
+    return output.getvalue()
+
+
+class ChartRenderer:
+    """Renders chart images in the render pool, keeping a size-bounded LRU cache of them"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._size = 0
+        # Renders in progress, by key
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.joined = 0
+        self.misses = 0
+        self.renders = 0
+        self.failures = 0
+        self.render_seconds = 0.0
+
+    def render(self, chart_config: dict, format: str = 'png') -> bytes:
+        """Image of a chart, from sync code"""
+        return self._image(chart_config, format).result()
+
+    async def render_async(self, chart_config: dict, format: str = 'png') -> bytes:
+        """Image of a chart, from any event loop"""
+        # Joined requests share the render's future; a caller that goes away
+        # must not cancel it for the others
+        return await asyncio.shield(asyncio.wrap_future(self._image(chart_config, format)))
+
+    def _image(self, chart_config: dict, format: str) -> Future:
+        """Future of a chart's image: cached, already being drawn, or a new render"""
+        if format not in FORMATS:
+            raise ValueError(f"Unsupported image format: {format}. Use one of {', '.join(FORMATS)}")
+        key = chart_key(chart_config, format)
+
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                future = Future()
+                future.set_result(data)
+                return future
+
+            pending = self._pending.get(key)
+            if pending is not None:
+                self.joined += 1
+                return pending
+
+            self.misses += 1
+            started = time.perf_counter()
+            future = render_pool().submit(render_chart, chart_config, format)
+            self._pending[key] = future
+        future.add_done_callback(lambda done: self._rendered(key, done, started))
+        return future
+
+    def _rendered(self, key: str, future: Future, started: float):
+        with self._lock:
+            self._pending.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                self.failures += 1
+                return
+            self.renders += 1
+            self.render_seconds += time.perf_counter() - started
+
+            data = future.result()
+            if len(data) > self.max_bytes:
+                return
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.hits + self.joined + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'joined': self.joined,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.joined) / requests if requests else 0.0,
+                'renders': self.renders,
+                'failures': self.failures,
+                'render_seconds': self.render_seconds,
+            }
+
+
+# Global instance
+chart_renderer = ChartRenderer(CHART_RENDER_CACHE_MAX_BYTES)
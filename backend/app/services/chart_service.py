@@ -3,14 +3,94 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import io
 import base64
-from typing import List, Dict
+import re
+from itertools import repeat
+from typing import List, Dict, Optional
+import numpy as np
+from app.services.downsampling import downsample_indices
+from app.services.numeric_columns import parse_numbers
+from app.services.aggregation import AGGREGATIONS, group_reduce, pivot_codes
+from app.services.excel_service import excel_service
+
+# Most distinct pivot values, each one becomes a series of the chart
+PIVOT_MAX_SERIES = 50
+
+_DIGIT_RUNS = re.compile('([0-9]+)')
+
+
+def _label_order(labels: List[str]) -> np.ndarray:
+    """
+    Order that sorts labels: by value when every label is a number, else
+    naturally, comparing runs of digits as numbers ("2024-2" before "2024-10")
+    """
+    numbers = parse_numbers(labels)
+    if not np.isnan(numbers).any():
+        return np.argsort(numbers, kind='stable')
+    return np.array(sorted(range(len(labels)), key=lambda idx: _natural_key(labels[idx])), dtype=np.int64)
+
+
+def _natural_key(label: str) -> list:
+    # Digit runs sit at odd positions of the split
+    return [(0, int(part)) if idx % 2 else (1, part) for idx, part in enumerate(_DIGIT_RUNS.split(label))]
+
+
+def _series_values(data: List[Dict], key: str) -> np.ndarray:
+    """One series of chart data as floats, NaN where missing or not a number"""
+    values = [row.get(key) for row in data]
+    try:
+        return np.array(values, dtype=np.float64)
+    except (ValueError, TypeError):
+        return np.array([_to_float(value) for value in values], dtype=np.float64)
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return np.nan
+
+
+def _chart_entries(labels: List[str], columns: List[str], series: List[np.ndarray]) -> List[Dict]:
+    """Chart data rows {'name': label, column: value, ...}, None where a value is missing"""
+    cells = []
+    for values in series:
+        missing = np.isnan(values)
+        if missing.any():
+            # JSON has no NaN, a missing value is null
+            values = values.astype(object)
+            values[missing] = None
+        cells.append(values.tolist())
+    return list(map(dict, map(zip, repeat(['name', *columns]), zip(labels, *cells))))
 
 
 class ChartService:
-    def create_chart(self, chart_type: str, data: List[Dict], title: str = None, columns: List[str] = None) -> Dict:
+    def downsample(self, chart_type: str, data: List[Dict], columns: List[str], max_points: Optional[int]) -> List[Dict]:
+        """
+        Keep at most about max_points rows of chart data, chosen to preserve
+        the chart's shape: Largest-Triangle-Three-Buckets for lines, the
+        min and max of each bucket for bars. Pie charts are left alone
+        """
+        if not max_points or chart_type == 'pie' or len(data) <= max_points:
+            return data
+
+        keys = [col for col in columns if col != 'name'] or [key for key in data[0] if key != 'name']
+        if not keys:
+            return data
+        indices = self._keep_rows(chart_type, [_series_values(data, key) for key in keys], max_points)
+        return data if indices is None else [data[idx] for idx in indices.tolist()]
+
+    def _keep_rows(self, chart_type: str, series: List[np.ndarray], max_points: Optional[int]) -> Optional[np.ndarray]:
+        """Rows downsample keeps of numeric series, None to keep them all"""
+        if not max_points or chart_type == 'pie' or not series or len(series[0]) <= max_points:
+            return None
+        return downsample_indices(series, max_points, 'minmax' if chart_type == 'bar' else 'lttb')
+
+    def create_chart(self, chart_type: str, data: List[Dict], title: str = None, columns: List[str] = None,
+                     max_points: Optional[int] = None) -> Dict:
         """
         Create a chart configuration
-        Returns a dict with chart data that can be rendered by frontend
+        Returns a dict with chart data that can be rendered by frontend.
+        With max_points, long bar and line series are downsampled to about that many points
         """
         if not data:
             raise ValueError("No data provided for chart")
@@ -23,7 +103,7 @@ class ChartService:
             chart_data = data
         else:
             # For bar/line charts, ensure proper structure
-            chart_data = data
+            chart_data = self.downsample(chart_type, data, columns or [], max_points)
 
         return {
             'type': chart_type,
@@ -32,45 +112,161 @@ class ChartService:
             'columns': columns or [],
         }
 
-    def prepare_chart_data_from_excel(self, sheet_data: List[List[str]], chart_type: str = 'bar') -> Dict:
+    def prepare_chart_data_from_excel(self, sheet_data: List[List[str]], chart_type: str = 'bar',
+                                      max_points: Optional[int] = None) -> Dict:
         """
         Prepare chart data from Excel sheet data
-        Assumes first row is headers, first column is labels
+        Assumes first row is headers, first column is labels. Values are
+        parsed a column at a time, so "16.7%", "1,234" and "¥5,000" count
+        as numbers; blank and non-numeric cells are left out as None. With
+        max_points, long series are downsampled as in create_chart
         """
         if not sheet_data or len(sheet_data) < 2:
             raise ValueError("Insufficient data for chart")
 
         headers = sheet_data[0]
-        data_rows = sheet_data[1:]
-
-        chart_data = []
+        data_rows = [row for row in sheet_data[1:] if row]
         columns = headers[1:] if len(headers) > 1 else [headers[0]]
 
-        for row in data_rows:
-            if not row:
-                continue
+        series = [
+            parse_numbers([row[col_idx] if col_idx < len(row) else '' for row in data_rows])
+            for col_idx in range(1, len(columns) + 1)
+        ]
+        labels = [row[0] for row in data_rows]
+        rows = self._keep_rows(chart_type, series, max_points)
+        if rows is not None:
+            labels = [labels[row] for row in rows.tolist()]
+            series = [values[rows] for values in series]
 
-            entry = {'name': row[0] if row else ''}
+        return {
+            'type': chart_type,
+            'title': f'{chart_type.capitalize()} Chart',
+            'data': _chart_entries(labels, columns, series),
+            'columns': columns,
+        }
+
+    def chart_from_sheet(self, workbook_id: str, sheet_index: int = 0, chart_type: str = 'bar',
+                         label_col: int = 0, value_cols: Optional[List[int]] = None,
+                         title: Optional[str] = None, max_points: Optional[int] = None) -> Dict:
+        """
+        Create a chart from a stored sheet's columns
+        The first row is headers. Parsed columns are cached per workbook
+        version, so charting an unchanged sheet again parses nothing, and
+        only the rows kept after downsampling become chart data
+        """
+        columns = excel_service.chart_columns(
+            workbook_id, sheet_index, label_col, value_cols,
+            lambda series: self._keep_rows(chart_type, series, max_points),
+        )
+        return {
+            'type': chart_type,
+            'title': title or f'{chart_type.capitalize()} Chart',
+            'data': _chart_entries(columns['labels'], columns['headers'], columns['series']),
+            'columns': columns['headers'],
+        }
+
+    def bind_chart(self, workbook_id: str, sheet_index: int = 0, chart_type: str = 'bar',
+                   title: Optional[str] = None, label_col: int = 0, value_cols: Optional[List[int]] = None,
+                   row_start: int = 1, row_stop: Optional[int] = None, max_points: Optional[int] = None) -> Dict:
+        """
+        Create a chart bound to rows [row_start, row_stop) of a stored sheet
+        and return it with its current data. It is stored with the workbook:
+        cell edits keep its data current and exports chart the range itself
+        """
+        chart = excel_service.add_bound_chart(
+            workbook_id, sheet_index, chart_type=chart_type, title=title, label_col=label_col,
+            value_cols=value_cols, row_start=row_start, row_stop=row_stop, max_points=max_points,
+        )
+        return self.bound_charts(workbook_id, chart['id'])[0]
 
-            for i, col in enumerate(columns):
-                col_idx = i + 1
-                if col_idx < len(row):
-                    value = row[col_idx]
-                    # Try to convert to number
-                    try:
-                        entry[col] = float(value)
-                    except (ValueError, TypeError):
-                        entry[col] = 0
+    def bound_charts(self, workbook_id: str, chart_id: Optional[str] = None) -> List[Dict]:
+        """A workbook's bound charts (or the one with chart_id) with data derived from their ranges"""
+        charts = []
+        bound = excel_service.bound_chart_series(
+            workbook_id, chart_id,
+            lambda chart, series: self._keep_rows(chart['type'], series, chart.get('max_points')),
+        )
+        for chart, headers, labels, values in bound:
+            charts.append({
+                **chart,
+                'title': chart['title'] or f"{chart['type'].capitalize()} Chart",
+                'data': _chart_entries(labels, headers, values),
+                'columns': headers,
+            })
+        return charts
 
-            chart_data.append(entry)
+    def aggregate(self, workbook_id: str, sheet_index: int = 0, group_col: int = 0,
+                  value_cols: Optional[List[int]] = None, agg: str = 'sum', pivot_col: Optional[int] = None,
+                  chart_type: str = 'bar', title: Optional[str] = None, sort_by: Optional[str] = None,
+                  limit: Optional[int] = None) -> Dict:
+        """
+        Create a chart of a stored sheet grouped by one column
+        Each value column is aggregated (sum, mean, count, min or max) per
+        distinct value of the group column; 'count' with value_cols=[]
+        counts rows. With pivot_col, the one value column is aggregated per
+        (group, pivot value) pair and each pivot value becomes a series.
+        sort_by 'label' or 'value' (the first series, descending) orders
+        the groups and limit keeps the first ones. Only the aggregated
+        groups leave the server, never the raw rows
+        """
+        if agg not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation: {agg}. Use one of {', '.join(AGGREGATIONS)}")
+        if sort_by not in (None, 'label', 'value'):
+            raise ValueError(f"Unknown sort: {sort_by}. Use 'label' or 'value'")
+
+        group_cols = [group_col] if pivot_col is None else [group_col, pivot_col]
+        grouped = excel_service.group_columns(workbook_id, sheet_index, group_cols, value_cols)
+        codes, keys = grouped['groups'][0]
+        headers, series = grouped['headers'], grouped['series']
+        measure = f"{', '.join(headers)} ({agg})"
+        if not headers:
+            if agg != 'count':
+                raise ValueError("No value columns to aggregate")
+            # Count rows: every row has a value
+            headers, series, measure = ['count'], [np.zeros(len(codes))], 'count'
+
+        if pivot_col is None:
+            columns = headers
+            results = [group_reduce(codes, len(keys), values, agg) for values in series]
+            default_title = f"{measure} by {grouped['group_headers'][0]}"
+        else:
+            if len(series) != 1:
+                raise ValueError("A pivot aggregates exactly one value column, pass it in value_cols")
+            pivot, columns = grouped['groups'][1]
+            if len(columns) > PIVOT_MAX_SERIES:
+                raise ValueError(f"Pivot column has {len(columns)} distinct values, at most {PIVOT_MAX_SERIES} are allowed")
+            grid = group_reduce(pivot_codes(codes, pivot, len(columns)), len(keys) * len(columns), series[0], agg)
+            results = list(grid.reshape(len(keys), len(columns)).T)
+            default_title = f"{measure} by {' and '.join(grouped['group_headers'])}"
+
+        order = self._group_order(keys, results, sort_by, limit)
+        if order is not None:
+            keys = [keys[idx] for idx in order.tolist()]
+            results = [values[order] for values in results]
 
         return {
             'type': chart_type,
-            'title': f'{chart_type.capitalize()} Chart',
-            'data': chart_data,
+            'title': title or default_title,
+            'data': _chart_entries(keys, columns, results),
             'columns': columns,
         }
 
+    @staticmethod
+    def _group_order(keys: List[str], results: List[np.ndarray], sort_by: Optional[str],
+                     limit: Optional[int]) -> Optional[np.ndarray]:
+        """Order of the groups to chart, None to keep them all in order of first appearance"""
+        if sort_by is None and not limit:
+            return None
+
+        if sort_by == 'label':
+            order = _label_order(keys)
+        elif sort_by == 'value' and results:
+            # Largest first, groups without a value last
+            order = np.argsort(-np.nan_to_num(results[0], nan=-np.inf), kind='stable')
+        else:
+            order = np.arange(len(keys))
+        return order[:limit] if limit else order
+
 
 # Global instance
 chart_service = ChartService()
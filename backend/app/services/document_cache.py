@@ -0,0 +1,125 @@
+"""
+Parse-once cache of scraped pages
+
+A fetched page is parsed a single time into a ParsedDocument holding
+every table and list on it. Later requests for another table or list of
+the same page, and requests for the page index, are answered from the
+cache. Entries are keyed by a hash of the page content, so a changed page
+is parsed again while an unchanged one never is.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# Rough per-cell cost of a str in a row list, for size accounting
+CELL_OVERHEAD = 60
+
+
+class ParsedDocument:
+    """Every table and list of a page, in document order"""
+
+    def __init__(self, tables: List[dict], lists: List[dict]):
+        # {'rows', 'caption', 'id', 'heading'} per table; rows padded to equal width
+        self.tables = tables
+        # {'tag', 'items', 'id', 'heading'} per ul/ol list
+        self.lists = lists
+
+    def table_rows(self, table_index: int) -> List[List[str]]:
+        if table_index >= len(self.tables):
+            raise ValueError(f"Table index {table_index} not found. Only {len(self.tables)} tables available.")
+        rows = self.tables[table_index]['rows']
+        if not rows:
+            raise ValueError("No data found in table")
+        return rows
+
+    def list_items(self, list_index: int) -> List[str]:
+        if list_index >= len(self.lists):
+            raise ValueError(f"List index {list_index} not found. Only {len(self.lists)} lists available.")
+        return self.lists[list_index]['items']
+
+    def index(self, sample_rows: int = 3) -> dict:
+        """Position, shape, header and a few sample rows of every table and list"""
+        return {
+            'tables': [
+                {
+                    'index': idx,
+                    'n_rows': len(table['rows']),
+                    'n_cols': len(table['rows'][0]) if table['rows'] else 0,
+                    'caption': table['caption'],
+                    'id': table['id'],
+                    'heading': table['heading'],
+                    'header': table['rows'][0] if table['rows'] else [],
+                    'sample_rows': table['rows'][1:1 + sample_rows],
+                }
+                for idx, table in enumerate(self.tables)
+            ],
+            'lists': [
+                {
+                    'index': idx,
+                    'tag': lst['tag'],
+                    'n_items': len(lst['items']),
+                    'id': lst['id'],
+                    'heading': lst['heading'],
+                    'sample_items': lst['items'][:sample_rows],
+                }
+                for idx, lst in enumerate(self.lists)
+            ],
+        }
+
+    def nbytes(self) -> int:
+        """Approximate memory footprint, for cache accounting"""
+        size = 0
+        for table in self.tables:
+            for row in table['rows']:
+                size += sum(map(len, row)) + CELL_OVERHEAD * len(row)
+        for lst in self.lists:
+            size += sum(map(len, lst['items'])) + CELL_OVERHEAD * len(lst['items'])
+        return size
+
+
+class DocumentCache:
+    """Size-bounded LRU cache of parsed documents keyed by content hash"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[ParsedDocument]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, document: ParsedDocument):
+        size = document.nbytes()
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._entries[key] = (document, size)
+            self._size += size
+
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
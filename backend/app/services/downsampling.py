@@ -0,0 +1,77 @@
+"""
+Downsampling of chart series to a target point count
+
+Both methods pick which points to keep rather than averaging them, so
+every point shown is a real row of the data, in its original order.
+Largest-Triangle-Three-Buckets keeps the points that span the largest
+triangles with their neighbours, which preserves the peaks, dips and
+trends of a line. Min/max bucketing keeps the lowest and highest point of
+each bucket, so no extreme bar goes missing. Points are positioned by
+row index; NaN values never win a bucket.
+"""
+from typing import List
+import numpy as np
+
+
+def lttb_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the n_out points Largest-Triangle-Three-Buckets keeps, first and last included"""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    valid = ~np.isnan(y)
+    filled = np.where(valid, y, 0.0)
+    x = np.arange(n, dtype=np.float64)
+
+    # n_out - 2 buckets over the points between the first and the last
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    inner = slice(0, n - 1)
+    counts = np.add.reduceat(valid[inner].astype(np.int64), starts)
+    sums = np.add.reduceat(filled[inner], starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_y = sums / counts
+    avg_x = (starts + ends - 1) / 2
+    # Each bucket is weighed against the average of the next one, the last against the last point
+    next_x = np.append(avg_x[1:], n - 1)
+    next_y = np.append(avg_y[1:], filled[-1])
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0] = 0
+    out[-1] = n - 1
+    a = 0
+    for bucket, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        ax, ay = x[a], y[a]
+        cx, cy = next_x[bucket], next_y[bucket]
+        area = np.abs((ax - cx) * (y[start:end] - ay) - (ax - x[start:end]) * (cy - ay))
+        area[np.isnan(area)] = -1.0
+        a = start + int(area.argmax())
+        out[bucket + 1] = a
+    return out
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the lowest and highest point of each of n_out / 2 equal buckets, in order"""
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+
+    buckets = n_out // 2
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    grid = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    lows = np.where(np.isnan(grid), np.inf, grid).argmin(axis=1) + offsets
+    highs = np.where(np.isnan(grid), -np.inf, grid).argmax(axis=1) + offsets
+    return np.unique(np.concatenate([lows[lows < n], highs[highs < n]]))
+
+
+def downsample_indices(series: List[np.ndarray], n_out: int, method: str = 'lttb') -> np.ndarray:
+    """
+    Rows to keep of several series sharing the same rows: each series gets
+    an equal share of n_out and the rows any of them keeps are kept
+    """
+    pick = minmax_indices if method == 'minmax' else lttb_indices
+    share = max(n_out // max(len(series), 1), 3)
+    return np.unique(np.concatenate([pick(values, share) for values in series]))
@@ -1,148 +1,698 @@
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment
 from openpyxl.chart import BarChart, LineChart, PieChart, Reference
-from app.models.excel import Workbook as WorkbookModel
+from openpyxl.utils import get_column_letter
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Set, Tuple
+import numpy as np
+from app.models.excel import Workbook as WorkbookModel, PatchOperation, PatchRequest
+from app.services.sheet_store import ColumnarSheet, StoredWorkbook
+from app.services.export_cache import ExportCache
+from app.services.numeric_columns import numeric_cache
+from app.services.aggregation import factorize
+from app.services.chart_bindings import Rect, bind_chart, is_bound, range_stop, chart_series_cache
+from app.services.workbook_store import WorkbookStore, SharedWorkbookStore, SqliteSpill
+from app.services.state_backend import state_backend
+from app.services.executors import run_in_thread, run_file_in_process
+from app.config import (
+    EXPORT_CACHE_MAX_BYTES,
+    WORKBOOK_MEMORY_BUDGET_BYTES,
+    WORKBOOK_TTL_SECONDS,
+    WORKBOOK_SPILL_PATH,
+    WORKBOOK_SPILL_TTL_SECONDS,
+)
 import io
+import os
+import pickle
+import re
+import tempfile
+
+# Streaming export: chunk size sent to the client
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Rows sent with a workbook handle, and the most one range read returns
+DEFAULT_PAGE_ROWS = 200
+MAX_RANGE_ROWS = 5000
+
+# Excel sheet titles: at most 31 characters, none of []:*?/\ and unique
+# regardless of case
+MAX_SHEET_TITLE = 31
+INVALID_TITLE_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+
+def unique_sheet_title(name: str, taken: Set[str]) -> str:
+    """A valid Excel title for name, suffixed ' (2)', ' (3)'... if already in taken (lowercased)"""
+    base = INVALID_TITLE_CHARS.sub('_', name).strip().strip("'")[:MAX_SHEET_TITLE] or 'Sheet'
+    title = base
+    n = 2
+    while title.lower() in taken:
+        suffix = f' ({n})'
+        title = base[:MAX_SHEET_TITLE - len(suffix)] + suffix
+        n += 1
+    taken.add(title.lower())
+    return title
+
+
+class WorkbookConflictError(ValueError):
+    """Raised when a sync is based on an outdated workbook version"""
+
+    def __init__(self, message: str, current_version: int):
+        super().__init__(message)
+        self.current_version = current_version
 
 
 class ExcelService:
     def __init__(self):
-        self.workbooks = {}
-        self.charts = {}  # Store charts by workbook_id
+        # Columnar workbooks (and their charts) by workbook_id
+        if state_backend.shared:
+            # The shared backend is the durable copy, no local spill needed
+            cache = WorkbookStore(WORKBOOK_MEMORY_BUDGET_BYTES, WORKBOOK_TTL_SECONDS)
+            self.workbooks = SharedWorkbookStore(state_backend, cache)
+        else:
+            spill = SqliteSpill(WORKBOOK_SPILL_PATH, WORKBOOK_SPILL_TTL_SECONDS) if WORKBOOK_SPILL_PATH else None
+            self.workbooks = WorkbookStore(WORKBOOK_MEMORY_BUDGET_BYTES, WORKBOOK_TTL_SECONDS, spill)
+        self.export_cache = ExportCache(EXPORT_CACHE_MAX_BYTES)
 
     def create_workbook(self, data: WorkbookModel) -> str:
         """Create a new workbook"""
         import uuid
         workbook_id = str(uuid.uuid4())
         data.id = workbook_id
-        self.workbooks[workbook_id] = data
+        data.version = 0
+        self.workbooks.put(StoredWorkbook.from_model(workbook_id, data))
+        return workbook_id
+
+    def create_workbook_from_sheets(self, sheets: List[ColumnarSheet]) -> str:
+        """
+        Create a new workbook from already built columnar sheets
+        Sheet names are made valid, unique Excel titles
+        """
+        import uuid
+        workbook_id = str(uuid.uuid4())
+        taken = set()
+        for sheet in sheets:
+            sheet.name = unique_sheet_title(sheet.name, taken)
+        self.workbooks.put(StoredWorkbook(workbook_id, sheets))
         return workbook_id
 
     def get_workbook(self, workbook_id: str) -> WorkbookModel:
         """Get workbook by ID"""
-        return self.workbooks.get(workbook_id)
-
-    def update_cell(self, workbook_id: str, sheet_index: int, row: int, col: int, value: str):
-        """Update a cell value"""
-        workbook = self.workbooks.get(workbook_id)
-        if not workbook:
-            raise ValueError(f"Workbook {workbook_id} not found")
-
-        if sheet_index >= len(workbook.sheets):
+        stored = self.workbooks.get(workbook_id)
+        return stored.to_model() if stored else None
+
+    def get_workbook_page(self, workbook_id: str, page_rows: int = DEFAULT_PAGE_ROWS) -> dict:
+        """
+        Get a workbook handle: its id, version and sheet shapes, with only
+        the first page_rows rows of each sheet. Read the rest with read_range
+        """
+        workbook = self._require_workbook(workbook_id)
+        page_rows = max(0, min(page_rows, MAX_RANGE_ROWS))
+        return {
+            'id': workbook.id,
+            'version': workbook.version,
+            'active_sheet': workbook.active_sheet,
+            'sheets': [
+                {
+                    'name': sheet.name,
+                    'rows': sheet.read_range(0, page_rows),
+                    'n_rows': sheet.n_rows,
+                    'n_cols': sheet.n_cols,
+                }
+                for sheet in workbook.sheets
+            ],
+        }
+
+    def read_range(
+        self,
+        workbook_id: str,
+        sheet_index: int,
+        row_start: int = 0,
+        row_count: int = DEFAULT_PAGE_ROWS,
+        col_start: int = 0,
+        col_count: Optional[int] = None,
+    ) -> dict:
+        """
+        Read a window of a sheet along with the full sheet dimensions
+        The window is clipped to the sheet and to MAX_RANGE_ROWS rows
+        """
+        workbook = self._require_workbook(workbook_id)
+
+        if sheet_index < 0 or sheet_index >= len(workbook.sheets):
             raise ValueError(f"Sheet index {sheet_index} out of range")
+        if row_start < 0 or col_start < 0 or row_count < 0 or (col_count is not None and col_count < 0):
+            raise ValueError('Range start and size must not be negative')
 
         sheet = workbook.sheets[sheet_index]
+        row_count = min(row_count, MAX_RANGE_ROWS)
+        col_stop = None if col_count is None else col_start + col_count
+        return {
+            'workbook_id': workbook_id,
+            'sheet_index': sheet_index,
+            'version': workbook.version,
+            'n_rows': sheet.n_rows,
+            'n_cols': sheet.n_cols,
+            'row_start': row_start,
+            'col_start': col_start,
+            'rows': sheet.read_range(row_start, row_start + row_count, col_start, col_stop),
+        }
+
+    def chart_columns(
+        self,
+        workbook_id: str,
+        sheet_index: int,
+        label_col: int,
+        value_cols: Optional[List[int]],
+        pick_rows: Callable[[List[np.ndarray]], Optional[np.ndarray]],
+    ) -> dict:
+        """
+        Header, labels and numeric values of sheet columns for a chart
+        The first row is the header; value columns default to every column
+        but the label column. Values are parsed once per workbook version
+        and pick_rows chooses from them which data rows to keep (None for
+        all), so only the kept rows' labels are read
+        """
+        with self.workbooks.lock(workbook_id):
+            workbook = self._require_workbook(workbook_id)
+            sheet = self._chart_sheet(workbook, sheet_index, [label_col], value_cols)
+            if value_cols is None:
+                value_cols = [col for col in range(sheet.n_cols) if col != label_col]
+            if not value_cols:
+                raise ValueError("No value columns for chart")
+
+            series = self._numeric_series(workbook, sheet_index, value_cols)
+            rows = pick_rows(series)
+            labels = sheet.columns[label_col]
+            if rows is None:
+                label_values = labels.slice(1, sheet.n_rows)
+            else:
+                label_values = [labels.get(row + 1) for row in rows.tolist()]
+                series = [values[rows] for values in series]
+            return {
+                'version': workbook.version,
+                'headers': [sheet.get(0, col) for col in value_cols],
+                'labels': label_values,
+                'series': series,
+            }
+
+    def group_columns(
+        self,
+        workbook_id: str,
+        sheet_index: int,
+        group_cols: List[int],
+        value_cols: Optional[List[int]],
+    ) -> dict:
+        """
+        Group codes and numeric values of sheet columns for aggregation
+        The first row is the header; value columns default to every column
+        but the group columns. Each group column comes back as codes in
+        order of first appearance plus the value of each code (see
+        aggregation.factorize)
+        """
+        with self.workbooks.lock(workbook_id):
+            workbook = self._require_workbook(workbook_id)
+            sheet = self._chart_sheet(workbook, sheet_index, group_cols, value_cols)
+            if value_cols is None:
+                value_cols = [col for col in range(sheet.n_cols) if col not in group_cols]
+            return {
+                'version': workbook.version,
+                'group_headers': [sheet.get(0, col) for col in group_cols],
+                'groups': [factorize(sheet.columns[col]) for col in group_cols],
+                'headers': [sheet.get(0, col) for col in value_cols],
+                'series': self._numeric_series(workbook, sheet_index, value_cols),
+            }
+
+    @staticmethod
+    def _chart_sheet(workbook: StoredWorkbook, sheet_index: int, key_cols: List[int],
+                     value_cols: Optional[List[int]]) -> ColumnarSheet:
+        """A sheet to chart from, checking that it has data and the columns exist"""
+        if sheet_index < 0 or sheet_index >= len(workbook.sheets):
+            raise ValueError(f"Sheet index {sheet_index} out of range")
 
-        # Ensure row exists
-        while len(sheet.rows) <= row:
-            sheet.rows.append([''] * len(sheet.rows[0]) if sheet.rows else [''])
+        sheet = workbook.sheets[sheet_index]
+        for col in key_cols + (value_cols or []):
+            if col < 0 or col >= sheet.n_cols:
+                raise ValueError(f"Column {col} out of range")
+        if sheet.n_rows < 2:
+            raise ValueError("Insufficient data for chart")
+        return sheet
+
+    @staticmethod
+    def _numeric_series(workbook: StoredWorkbook, sheet_index: int, cols: List[int]) -> List[np.ndarray]:
+        """Numeric values of columns below the header row, parsed once per workbook version"""
+        columns = workbook.sheets[sheet_index].columns
+        return [
+            numeric_cache.numbers(workbook.id, workbook.version, sheet_index, col, columns[col])[1:]
+            for col in cols
+        ]
+
+    def _require_workbook(self, workbook_id: str) -> StoredWorkbook:
+        stored = self.workbooks.get(workbook_id)
+        if not stored:
+            raise ValueError(f"Workbook {workbook_id} not found")
+        return stored
 
-        # Ensure column exists
-        while len(sheet.rows[row]) <= col:
-            sheet.rows[row].append('')
+    def update_cell(self, workbook_id: str, sheet_index: int, row: int, col: int, value: str):
+        """Update a cell value"""
+        self.update_cell_delta(workbook_id, sheet_index, row, col, value)
+        return self.get_workbook(workbook_id)
+
+    def update_cell_delta(self, workbook_id: str, sheet_index: int, row: int, col: int, value: str) -> dict:
+        """
+        Update a cell value and return only what changed
+        The delta lists the written cell, any blank rows and columns added
+        to reach it and the new sheet shape, plus the new workbook version
+        """
+        with self.workbooks.lock(workbook_id):
+            workbook = self._require_workbook(workbook_id)
+
+            if sheet_index < 0 or sheet_index >= len(workbook.sheets):
+                raise ValueError(f"Sheet index {sheet_index} out of range")
+
+            if row < 0 or col < 0:
+                raise ValueError(f"Cell ({row}, {col}) out of range")
+
+            sheet = workbook.sheets[sheet_index]
+            delta = self._new_delta(workbook_id, sheet_index)
+            self._grow_sheet(sheet, row + 1, col + 1, delta)
+            sheet.set(row, col, value)
+            delta['cells'].append({'row': row, 'col': col, 'value': value})
+
+            delta['charts'] = self._bump_version(workbook, {sheet_index: [(row, col, 1, 1)]})
+            delta['version'] = workbook.version
+            return delta
+
+    def apply_patch(self, workbook_id: str, sheet_index: int, operations: List[PatchOperation]) -> dict:
+        """
+        Apply a batch of cell and block writes to one sheet atomically
+        Every operation is validated before anything is written, the sheet
+        is grown once for the whole batch, and a compact delta is returned:
+        single cells are echoed, blocks only by position and shape
+        """
+        with self.workbooks.lock(workbook_id):
+            workbook = self._require_workbook(workbook_id)
+
+            plan = self._plan_patch(workbook, sheet_index, operations)
+            delta = self._apply_patch(workbook, sheet_index, operations, plan)
+
+            delta['charts'] = self._bump_version(workbook, {sheet_index: self._edited_blocks(delta)})
+            delta['version'] = workbook.version
+            return delta
+
+    def sync_changes(self, workbook_id: str, base_version: int, changes: List[PatchRequest]) -> dict:
+        """
+        Sync only the cells and rows the frontend changed since base_version
+        Rejects the sync with WorkbookConflictError if the workbook moved on
+        since then. Changes to all sheets are validated before any is applied
+        """
+        with self.workbooks.lock(workbook_id):
+            workbook = self._require_workbook(workbook_id)
+
+            if base_version != workbook.version:
+                raise WorkbookConflictError(
+                    f"Workbook {workbook_id} is at version {workbook.version}, not {base_version}",
+                    workbook.version,
+                )
+
+            plans = [self._plan_patch(workbook, change.sheet_index, change.operations) for change in changes]
+            deltas = [
+                self._apply_patch(workbook, change.sheet_index, change.operations, plan)
+                for change, plan in zip(changes, plans)
+            ]
+
+            # An empty sync leaves the version (and the cached export) alone
+            charts = []
+            if any(change.operations for change in changes):
+                edits = {}
+                for delta in deltas:
+                    edits.setdefault(delta['sheet_index'], []).extend(self._edited_blocks(delta))
+                charts = self._bump_version(workbook, edits)
+            for delta in deltas:
+                delta['version'] = workbook.version
+            return {'version': workbook.version, 'deltas': deltas, 'charts': charts}
+
+    @staticmethod
+    def _plan_patch(workbook: StoredWorkbook, sheet_index: int, operations: List[PatchOperation]) -> Tuple[int, int]:
+        """Validate patch operations and work out the sheet shape they need"""
+        if sheet_index < 0 or sheet_index >= len(workbook.sheets):
+            raise ValueError(f"Sheet index {sheet_index} out of range")
 
-        sheet.rows[row][col] = value
-        return workbook
+        row_count = 0
+        col_count = 0
+        for idx, op in enumerate(operations):
+            if op.row < 0 or op.col < 0:
+                raise ValueError(f"Operation {idx}: cell ({op.row}, {op.col}) out of range")
+            if (op.value is None) == (op.values is None):
+                raise ValueError(f"Operation {idx}: exactly one of 'value' or 'values' is required")
+
+            if op.values is None:
+                row_count = max(row_count, op.row + 1)
+                col_count = max(col_count, op.col + 1)
+            else:
+                row_count = max(row_count, op.row + len(op.values))
+                col_count = max(col_count, op.col + max((len(values) for values in op.values), default=0))
+
+        return row_count, col_count
+
+    def _apply_patch(self, workbook: StoredWorkbook, sheet_index: int, operations: List[PatchOperation], plan) -> dict:
+        """Apply validated patch operations to a sheet and return their delta"""
+        row_count, col_count = plan
+        sheet = workbook.sheets[sheet_index]
+        delta = self._new_delta(workbook.id, sheet_index)
+        self._grow_sheet(sheet, row_count, col_count, delta)
+
+        for op in operations:
+            if op.values is None:
+                sheet.set(op.row, op.col, op.value)
+                delta['cells'].append({'row': op.row, 'col': op.col, 'value': op.value})
+                continue
+
+            for offset, values in enumerate(op.values):
+                for col, value in enumerate(values, start=op.col):
+                    sheet.set(op.row + offset, col, value)
+            delta['ranges'].append({
+                'row': op.row,
+                'col': op.col,
+                'rows': len(op.values),
+                'cols': max((len(values) for values in op.values), default=0),
+            })
+
+        return delta
+
+    @staticmethod
+    def _new_delta(workbook_id: str, sheet_index: int) -> dict:
+        return {
+            'workbook_id': workbook_id,
+            'sheet_index': sheet_index,
+            'version': None,
+            'cells': [],
+            'ranges': [],
+            'added_rows': None,
+            'added_cols': None,
+            'n_rows': None,
+            'n_cols': None,
+            'charts': [],
+        }
+
+    @staticmethod
+    def _edited_blocks(delta: dict) -> List[Rect]:
+        """The blocks of a sheet a patch delta wrote, as (row, col, rows, cols)"""
+        blocks = [(cell['row'], cell['col'], 1, 1) for cell in delta['cells']]
+        blocks.extend((block['row'], block['col'], block['rows'], block['cols']) for block in delta['ranges'])
+        return blocks
+
+    @staticmethod
+    def _grow_sheet(sheet: ColumnarSheet, row_count: int, col_count: int, delta: dict):
+        """Grow a sheet with blank cells in one pass, recording the growth in delta"""
+        old_rows, old_cols = sheet.n_rows, sheet.n_cols
+        added_rows, added_cols = sheet.ensure_shape(row_count, col_count)
+        if added_rows:
+            delta['added_rows'] = {'start': old_rows, 'count': added_rows}
+        if added_cols:
+            delta['added_cols'] = {'start': old_cols, 'count': added_cols}
+        delta['n_rows'] = sheet.n_rows
+        delta['n_cols'] = sheet.n_cols
 
     def export_to_excel(self, workbook_id: str) -> bytes:
         """Export workbook to Excel file"""
-        workbook_data = self.workbooks.get(workbook_id)
-        if not workbook_data:
-            raise ValueError(f"Workbook {workbook_id} not found")
-
-        wb = Workbook()
-        # Remove default sheet
-        wb.remove(wb.active)
-
-        for sheet_data in workbook_data.sheets:
-            ws = wb.create_sheet(title=sheet_data.name)
+        workbook_data = self._require_workbook(workbook_id)
 
-            for row_idx, row in enumerate(sheet_data.rows, start=1):
-                for col_idx, value in enumerate(row, start=1):
-                    cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                    # Add styling for header row
-                    if row_idx == 1:
-                        cell.font = Font(bold=True)
-                    cell.alignment = Alignment(horizontal='left')
-
-        # Save to bytes
         output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-        return output.read()
+        self._write_workbook(workbook_data, [], output)
+        return output.getvalue()
+
+    def append_rows(self, workbook_id: str, sheet_index: int, rows: List[List[str]]) -> dict:
+        """Append rows below a sheet; returns the new version and sheet shape"""
+        with self.workbooks.lock(workbook_id):
+            workbook = self._require_workbook(workbook_id)
+            if sheet_index < 0 or sheet_index >= len(workbook.sheets):
+                raise ValueError(f"Sheet index {sheet_index} out of range")
+
+            sheet = workbook.sheets[sheet_index]
+            charts = []
+            if rows:
+                start = sheet.n_rows
+                sheet.append_rows(rows)
+                charts = self._bump_version(workbook, {sheet_index: [(start, 0, len(rows), sheet.n_cols)]})
+            return {'version': workbook.version, 'n_rows': sheet.n_rows, 'n_cols': sheet.n_cols, 'charts': charts}
 
     def add_sheet(self, workbook_id: str, sheet_name: str):
         """Add a new sheet to workbook"""
-        workbook = self.workbooks.get(workbook_id)
-        if not workbook:
-            raise ValueError(f"Workbook {workbook_id} not found")
+        with self.workbooks.lock(workbook_id):
+            workbook = self._require_workbook(workbook_id)
 
-        from app.models.excel import Sheet
-        new_sheet = Sheet(name=sheet_name, rows=[['', '', '', '']])
-        workbook.sheets.append(new_sheet)
-        return workbook
+            new_sheet = ColumnarSheet.from_rows(sheet_name, [['', '', '', '']])
+            workbook.sheets.append(new_sheet)
+            self._bump_version(workbook, {})
+            return workbook.to_model()
 
     def add_chart(self, workbook_id: str, chart: dict):
         """Add a chart to the workbook"""
-        if workbook_id not in self.charts:
-            self.charts[workbook_id] = []
-        self.charts[workbook_id].append(chart)
+        with self.workbooks.lock(workbook_id):
+            workbook = self._require_workbook(workbook_id)
+            workbook.charts.append(chart)
+            self._bump_version(workbook, {})
 
     def set_workbook_charts(self, workbook_id: str, charts: list):
-        """Replace all charts for a workbook (used during export)"""
-        self.charts[workbook_id] = charts
+        """
+        Replace the workbook's static charts (used during export)
+        Charts bound to ranges are kept, and bound charts in charts are ignored
+        """
+        with self.workbooks.lock(workbook_id):
+            workbook = self._require_workbook(workbook_id)
+            charts = [chart for chart in charts if not is_bound(chart)]
+            bound = [chart for chart in workbook.charts if is_bound(chart)]
+            # The frontend resends every chart before each export; only a real
+            # change should invalidate the cached export
+            if workbook.charts == bound + charts:
+                return workbook.version
+            workbook.charts = bound + charts
+            self._bump_version(workbook, {})
+            return workbook.version
+
+    def add_bound_chart(self, workbook_id: str, sheet_index: int, **binding) -> dict:
+        """
+        Add a chart bound to a range of a sheet (see chart_bindings.bind_chart
+        for the binding's fields) and return it. Its data is derived from
+        the sheet when read and its export references the range's cells
+        """
+        with self.workbooks.lock(workbook_id):
+            workbook = self._require_workbook(workbook_id)
+            if sheet_index < 0 or sheet_index >= len(workbook.sheets):
+                raise ValueError(f"Sheet index {sheet_index} out of range")
+
+            chart = bind_chart(workbook.sheets[sheet_index], sheet_index, **binding)
+            workbook.charts.append(chart)
+            self._bump_version(workbook, {})
+            return chart
+
+    def remove_chart(self, workbook_id: str, chart_id: str):
+        """Remove a bound chart"""
+        with self.workbooks.lock(workbook_id):
+            workbook = self._require_workbook(workbook_id)
+            charts = [chart for chart in workbook.charts if chart.get('id') != chart_id]
+            if len(charts) == len(workbook.charts):
+                raise ValueError(f"Chart {chart_id} not found")
+            workbook.charts = charts
+            chart_series_cache.drop(workbook_id, chart_id)
+            self._bump_version(workbook, {})
+
+    def bound_chart_series(
+        self,
+        workbook_id: str,
+        chart_id: Optional[str],
+        pick_rows: Callable[[dict, List[np.ndarray]], Optional[np.ndarray]],
+    ) -> List[Tuple[dict, List[str], List[str], List[np.ndarray]]]:
+        """
+        Bound charts of a workbook (or the one with chart_id) as (chart,
+        series names, labels, values), skipping any whose sheet a full sync
+        removed. pick_rows chooses from a chart's values which points to
+        return (None for all), so only those are copied out
+        """
+        with self.workbooks.lock(workbook_id):
+            workbook = self._require_workbook(workbook_id)
+            charts = [
+                chart for chart in workbook.charts
+                if is_bound(chart) and (chart_id is None or chart['id'] == chart_id)
+                and chart['range']['sheet_index'] < len(workbook.sheets)
+            ]
+            if chart_id is not None and not charts:
+                raise ValueError(f"Chart {chart_id} not found")
+
+            result = []
+            for chart in charts:
+                series = chart_series_cache.series(workbook, chart)
+                labels, values = series.select(pick_rows(chart, series.values))
+                result.append((dict(chart), list(series.headers), labels, values))
+            return result
 
     def sync_workbook(self, workbook_id: str, workbook_data: WorkbookModel):
         """Sync workbook data from frontend"""
-        if workbook_id not in self.workbooks:
-            raise ValueError(f"Workbook {workbook_id} not found")
-
-        # Update the workbook data
-        workbook_data.id = workbook_id
-        self.workbooks[workbook_id] = workbook_data
-        return workbook_data
+        with self.workbooks.lock(workbook_id):
+            current = self._require_workbook(workbook_id)
+
+            sheets = [ColumnarSheet.from_model(sheet) for sheet in workbook_data.sheets]
+            unchanged = (
+                workbook_data.active_sheet == current.active_sheet
+                and len(sheets) == len(current.sheets)
+                and all(new.same_content(old) for new, old in zip(sheets, current.sheets))
+            )
+            if not unchanged:
+                # Update the workbook data
+                current.sheets = sheets
+                current.active_sheet = workbook_data.active_sheet
+                self._bump_version(current)
+
+            workbook_data.id = workbook_id
+            workbook_data.version = current.version
+            return workbook_data
+
+    def _bump_version(self, workbook: StoredWorkbook, edits: Optional[Dict[int, List[Rect]]] = None) -> List[str]:
+        """
+        Mark a workbook as changed so cached exports are no longer served
+        edits lists the blocks written, by sheet index ({} when no cell
+        changed), so bound charts recompute only the points they cover;
+        without it their series are recomputed in full when next read.
+        Returns the ids of bound charts whose points changed
+        """
+        old_version = workbook.version
+        workbook.version += 1
+        charts = [] if edits is None else chart_series_cache.advance(workbook, old_version, edits)
+        self.export_cache.invalidate(workbook.id)
+        # Re-put so the store sees the new size and this copy stays current
+        self.workbooks.put(workbook)
+        return charts
+
+    def export_etag(self, workbook_id: str) -> str:
+        """ETag for the current version of a workbook's export"""
+        workbook = self._require_workbook(workbook_id)
+        return self._etag(workbook_id, workbook.version)
+
+    @staticmethod
+    def _etag(workbook_id: str, version: int) -> str:
+        return f'W/"{workbook_id}-{version}"'
 
     def export_to_excel_with_charts(self, workbook_id: str) -> bytes:
         """Export workbook to Excel file with charts"""
-        workbook_data = self.workbooks.get(workbook_id)
-        if not workbook_data:
-            raise ValueError(f"Workbook {workbook_id} not found")
+        workbook_data = self._require_workbook(workbook_id)
+
+        cached = self.export_cache.get(workbook_id, workbook_data.version)
+        if cached is not None:
+            return cached
 
-        wb = Workbook()
-        # Remove default sheet
-        wb.remove(wb.active)
+        output = io.BytesIO()
+        self._write_workbook(workbook_data, workbook_data.charts, output)
+        data = output.getvalue()
+        self.export_cache.put(workbook_id, workbook_data.version, data)
+        return data
+
+    def stream_excel_with_charts(self, workbook_id: str,
+                                 chunk_size: int = EXPORT_CHUNK_SIZE) -> Tuple[str, AsyncIterator[bytes]]:
+        """
+        ETag and body of a workbook's Excel export, the body as an async
+        iterator of byte chunks. Both come from one locked read, so the body
+        is always the version the ETag names; blocking, call it in a thread.
+        The file is built in write-only mode by a worker process into a temp
+        file, so neither the event loop nor this process's memory carries the
+        build. Files small enough for the export cache are served from it on repeat
+        """
+        with self.workbooks.lock(workbook_id):
+            workbook = self._require_workbook(workbook_id)
+            version = workbook.version
+            cached = self.export_cache.get(workbook_id, version)
+            snapshot = None if cached is not None else pickle.dumps(workbook, protocol=pickle.HIGHEST_PROTOCOL)
+
+        async def generate():
+            data = cached
+            if data is None:
+                # If the client goes away meanwhile, the file is deleted once built
+                path = await run_file_in_process(build_export_file, snapshot)
+                try:
+                    with open(path, 'rb') as output:
+                        if os.path.getsize(path) > self.export_cache.max_bytes:
+                            for chunk in self._read_chunks(output, chunk_size):
+                                yield chunk
+                            return
+                        data = output.read()
+                finally:
+                    os.unlink(path)
+                self.export_cache.put(workbook_id, version, data)
+
+            for start in range(0, len(data), chunk_size):
+                yield data[start:start + chunk_size]
+
+        return self._etag(workbook_id, version), generate()
+
+    async def export_to_file(self, workbook_id: str) -> Tuple[int, str]:
+        """
+        Build the XLSX export of a workbook in a worker process
+        Returns the version exported and the temp file's path; the caller
+        deletes it. If cancelled, the file is deleted once it is written
+        """
+        version, snapshot = await run_in_thread(self._export_snapshot, workbook_id)
+        return version, await run_file_in_process(build_export_file, snapshot)
+
+    def _export_snapshot(self, workbook_id: str) -> Tuple[int, bytes]:
+        """Pickle a consistent copy of a workbook to hand to a worker process"""
+        with self.workbooks.lock(workbook_id):
+            workbook = self._require_workbook(workbook_id)
+            return workbook.version, pickle.dumps(workbook, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _read_chunks(output, chunk_size: int) -> Iterator[bytes]:
+        while True:
+            chunk = output.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def _write_workbook(self, workbook_data: StoredWorkbook, charts: list, output):
+        """
+        Write workbook data and charts as XLSX into output
+        Uses write-only worksheets: rows are serialized as they are appended
+        and every cell shares one of two style templates
+        """
+        wb = Workbook(write_only=True)
 
         for sheet_idx, sheet_data in enumerate(workbook_data.sheets):
             ws = wb.create_sheet(title=sheet_data.name)
 
-            for row_idx, row in enumerate(sheet_data.rows, start=1):
-                for col_idx, value in enumerate(row, start=1):
-                    cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                    # Add styling for header row
-                    if row_idx == 1:
-                        cell.font = Font(bold=True)
-                    cell.alignment = Alignment(horizontal='left')
-
-            # Add charts only to the first sheet
-            if sheet_idx == 0 and workbook_id in self.charts:
-                charts = self.charts[workbook_id]
-                for idx, chart_data in enumerate(charts):
-                    self._add_chart_to_sheet(ws, chart_data, len(sheet_data.rows), idx)
-
-        # Save to bytes
-        output = io.BytesIO()
+            # Bound charts go on their range's sheet, static ones on the first sheet
+            sheet_charts = [
+                chart for chart in charts
+                if (chart['range']['sheet_index'] if is_bound(chart) else 0) == sheet_idx
+            ]
+            for idx, chart_data in enumerate(sheet_charts):
+                self._add_chart_to_sheet(ws, chart_data, sheet_data, idx)
+
+            header_cell = WriteOnlyCell(ws)
+            header_cell.font = Font(bold=True)
+            header_cell.alignment = Alignment(horizontal='left')
+            body_cell = WriteOnlyCell(ws)
+            body_cell.alignment = Alignment(horizontal='left')
+
+            for row_idx, row in enumerate(sheet_data.iter_rows()):
+                ws.append(self._styled_row(row, header_cell if row_idx == 0 else body_cell))
+
         wb.save(output)
-        output.seek(0)
-        return output.read()
 
-    def _add_chart_to_sheet(self, ws, chart_data, data_rows, chart_idx):
-        """Add a chart to the worksheet"""
+    @staticmethod
+    def _styled_row(row, template):
+        """Yield one styled cell per value, reusing the template cell"""
+        # The write-only writer serializes each cell before pulling the next,
+        # so a single cell object can carry every value of the row
+        for value in row:
+            template.value = value
+            yield template
+
+    def _add_chart_to_sheet(self, ws, chart_data, sheet: ColumnarSheet, chart_idx):
+        """Add a chart to the worksheet, referencing the cells it charts"""
         chart_type = chart_data.get('type', 'bar')
         title = chart_data.get('title', 'Chart')
-        data = chart_data.get('data', [])
 
-        if not data or data_rows < 2:
+        cells = self._chart_cells(chart_data, sheet)
+        if cells is None:
             return
+        cat_col, value_cols, header_row, last_row = cells
 
         # Create chart based on type
         if chart_type == 'bar':
@@ -160,6 +710,7 @@ class ExcelService:
             chart = PieChart()
             chart.style = 10
             # PieChart doesn't have axes
+            value_cols = value_cols[:1]
         else:
             chart = BarChart()
             chart.style = 10
@@ -168,27 +719,62 @@ class ExcelService:
 
         chart.title = title
 
-        # Calculate data range - use column B for values (index 2)
-        # and column A for categories (index 1)
-        if data_rows > 1:
-            # Find the column with numeric data (usually column B or C)
-            value_col = 2  # B column
-            cat_col = 1     # A column
-
-            values_ref = Reference(ws, min_col=value_col, min_row=1, max_row=data_rows, max_col=value_col)
-            cats_ref = Reference(ws, min_col=cat_col, min_row=2, max_row=data_rows)
-
+        # Openpyxl columns and rows are 1-based; each series is titled by its header cell
+        for value_col in value_cols:
+            values_ref = Reference(ws, min_col=value_col + 1, min_row=header_row, max_row=last_row)
             chart.add_data(values_ref, titles_from_data=True)
-            chart.set_categories(cats_ref)
-
-            # Position chart to the right of data
-            # Position each chart vertically if there are multiple
-            start_row = 2 + (chart_idx * 15)  # Offset for multiple charts
-            chart.anchor = f'{chr(65 + value_col + 2)}{start_row}'  # Position 2 columns to the right
-            chart.width = 15
-            chart.height = 12
-
-            ws.add_chart(chart)
+        cats_ref = Reference(ws, min_col=cat_col + 1, min_row=header_row + 1, max_row=last_row)
+        chart.set_categories(cats_ref)
+
+        # Position charts to the right of the data, one below the other
+        start_row = 2 + (chart_idx * 15)
+        chart.anchor = f'{get_column_letter(sheet.n_cols + 2)}{start_row}'
+        chart.width = 15
+        chart.height = 12
+
+        ws.add_chart(chart)
+
+    @staticmethod
+    def _chart_cells(chart_data: dict, sheet: ColumnarSheet) -> Optional[Tuple[int, List[int], int, int]]:
+        """
+        Category column, value columns (0-based) and the header and last
+        rows (1-based) a chart covers, or None if it covers no data. A
+        bound chart covers its range; a static one the whole sheet, in the
+        columns whose header names its series (column B if none does)
+        """
+        if is_bound(chart_data):
+            chart_range = chart_data['range']
+            value_cols = [col for col in chart_range['value_cols'] if col < sheet.n_cols]
+            if chart_range['label_col'] >= sheet.n_cols or not value_cols:
+                return None
+            header_row, last_row = chart_range['row_start'], range_stop(sheet, chart_range)
+            if last_row <= header_row:
+                return None
+            return chart_range['label_col'], value_cols, header_row, last_row
+
+        if not chart_data.get('data') or sheet.n_rows < 2 or sheet.n_cols < 2:
+            return None
+        headers = sheet.read_range(0, 1)[0]
+        names = [name for name in chart_data.get('columns') or [] if name != 'name']
+        value_cols = [headers.index(name, 1) for name in names if name in headers[1:]] or [1]
+        return 0, value_cols, 1, sheet.n_rows
+
+
+def build_export_file(snapshot: bytes) -> str:
+    """
+    Write a pickled StoredWorkbook (with its charts) as XLSX to a temp file
+    and return the file's path; the caller deletes it. Module-level so it
+    can run in the process pool
+    """
+    workbook_data = pickle.loads(snapshot)
+    fd, path = tempfile.mkstemp(prefix='web-excel-export-', suffix='.xlsx')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            excel_service._write_workbook(workbook_data, workbook_data.charts, output)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
 
 
 # Global instance
@@ -0,0 +1,123 @@
+"""
+Bounded worker pools for blocking work
+
+Route handlers run on the event loop, so anything that blocks (sync
+libraries, heavy CPU work) is pushed to one of two pools: a thread pool
+for calls that release the GIL or are short, and a process pool for
+CPU-bound parsing and export builds that would otherwise starve the loop
+through the GIL. Chart images are drawn in a third, small process pool of
+workers that import matplotlib once, so renders never queue behind parses.
+Every pool is bounded, so a burst of work queues up instead of spawning
+unbounded threads or processes.
+"""
+import asyncio
+import importlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Optional, TypeVar
+from app.config import THREAD_POOL_SIZE, PROCESS_POOL_SIZE, CHART_RENDER_PROCESSES
+
+T = TypeVar('T')
+
+# Imported by every worker process as it starts, so the first jobs do not
+# pay for it
+PRELOAD_MODULES = ('app.services.excel_service', 'app.services.scraper_service')
+RENDER_PRELOAD_MODULES = ('app.services.chart_renderer',)
+
+thread_pool = ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE, thread_name_prefix='web-excel')
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_render_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def _spawn_pool(workers: int, modules) -> ProcessPoolExecutor:
+    # Fork is unsafe once the server runs threads, start clean workers
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_preload,
+        initargs=(modules,),
+    )
+
+
+def process_pool() -> ProcessPoolExecutor:
+    """The shared process pool, started on first use"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = _spawn_pool(PROCESS_POOL_SIZE or min(4, os.cpu_count() or 1), PRELOAD_MODULES)
+        return _process_pool
+
+
+def render_pool() -> ProcessPoolExecutor:
+    """The chart rendering process pool, started on first use"""
+    global _render_pool
+    with _process_pool_lock:
+        if _render_pool is None:
+            _render_pool = _spawn_pool(max(1, CHART_RENDER_PROCESSES), RENDER_PRELOAD_MODULES)
+        return _render_pool
+
+
+def _preload(modules):
+    for module in modules:
+        importlib.import_module(module)
+
+
+def start():
+    """Start every worker process now rather than on the first request"""
+    for pool in (process_pool(), render_pool()):
+        for _ in range(pool._max_workers):
+            pool.submit(int)
+
+
+async def run_in_thread(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run a blocking call in the thread pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(thread_pool, partial(func, *args, **kwargs))
+
+
+async def run_in_process(func: Callable[..., T], *args) -> T:
+    """
+    Run a CPU-bound function in the process pool
+    func must be a module-level function and its arguments and result
+    must be picklable
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(process_pool(), partial(func, *args))
+
+
+async def run_file_in_process(func: Callable[..., str], *args) -> str:
+    """
+    Run a function that writes a temp file and returns its path in the
+    process pool, as run_in_process. The caller deletes the file, unless
+    it is cancelled while waiting: a worker cannot be interrupted, so the
+    file is then deleted once the worker is done with it
+    """
+    future = process_pool().submit(func, *args)
+    try:
+        return await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        future.add_done_callback(_remove_result_file)
+        raise
+
+
+def _remove_result_file(future: Future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    try:
+        os.remove(future.result())
+    except FileNotFoundError:
+        pass
+
+
+def shutdown():
+    """Stop the pools, waiting for running work"""
+    thread_pool.shutdown(wait=True)
+    with _process_pool_lock:
+        for pool in (_process_pool, _render_pool):
+            if pool is not None:
+                pool.shutdown(wait=True)
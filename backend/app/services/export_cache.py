@@ -0,0 +1,67 @@
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class ExportCache:
+    """
+    Size-bounded LRU cache of generated export files
+    Entries are keyed by (workbook_id, version), so a cached file is only
+    ever served for the exact workbook state it was built from
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[Tuple[str, int], bytes]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, workbook_id: str, version: int) -> Optional[bytes]:
+        """Return cached bytes for this workbook version, or None"""
+        key = (workbook_id, version)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, workbook_id: str, version: int, data: bytes):
+        """Cache bytes for a workbook version, evicting least recently used entries"""
+        if len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            # Older versions of the same workbook can never be requested again
+            if any(key[0] == workbook_id and key[1] > version for key in self._entries):
+                return
+            self._drop(workbook_id)
+            self._entries[(workbook_id, version)] = data
+            self._size += len(data)
+
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def invalidate(self, workbook_id: str):
+        """Drop every cached version of a workbook"""
+        with self._lock:
+            self._drop(workbook_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _drop(self, workbook_id: str):
+        for key in [key for key in self._entries if key[0] == workbook_id]:
+            self._size -= len(self._entries.pop(key))
@@ -0,0 +1,348 @@
+"""
+Streaming extraction of tables and lists from pages too large to parse in memory
+
+The page is read from disk in chunks, decoded incrementally and tokenized
+by the standard library's incremental HTML parser. No tree is built: a row
+or list item is handed out as soon as it closes and only the open rows,
+cells and items are held, so memory stays flat however big the page is.
+Rows flow into columnar sheet storage a block at a time.
+
+libxml2 (lxml) is not used here even when installed: its HTML push parser
+keeps the whole input buffered, so memory would grow with the page.
+"""
+import codecs
+from html.parser import HTMLParser
+from typing import Iterator, List, Optional
+from bs4 import UnicodeDammit
+from app.services.sheet_store import ColumnarSheet, ROW_BLOCK_SIZE
+
+HEADING_TAGS = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']
+LIST_TAGS = ['ul', 'ol']
+
+# Elements whose text BeautifulSoup's get_text() leaves out
+NON_TEXT_TAGS = ('script', 'style', 'template')
+
+# Head of a page searched for its encoding, and the read size after that
+SNIFF_BYTES = 64 * 1024
+READ_CHUNK_SIZE = 256 * 1024
+
+
+def sniff_encoding(prefix: bytes) -> Optional[str]:
+    """Encoding of a page from its first bytes, declared or detected as BeautifulSoup would"""
+    # Cut at a line end so a multi-byte character is never split
+    prefix = prefix[:prefix.rfind(b'\n') + 1] or prefix
+    return UnicodeDammit(prefix, is_html=True).original_encoding
+
+
+class _Container:
+    """An open table or list, with its row, cell, item or caption being read"""
+
+    __slots__ = ('tag', 'row', 'cell', 'item', 'caption', 'captioned')
+
+    def __init__(self, tag: str):
+        self.tag = tag
+        self.row: Optional[List[str]] = None
+        self.cell: Optional[List[str]] = None
+        self.item: Optional[List[str]] = None
+        self.caption: Optional[List[str]] = None
+        # Only the first caption of a table counts
+        self.captioned = False
+
+
+class PageStreamParser(HTMLParser):
+    """
+    Turns fed HTML into events, in document order:
+    ('table', id, heading), ('list', tag, id, heading), ('caption', text),
+    ('row', cells), ('item', text) and ('end',) closing a table or list
+
+    Cell, item, caption and heading text is the stripped text nodes joined,
+    as get_text(strip=True) gives. A row or item belongs to the innermost
+    open table or list, so unlike the in-memory parse the rows of a nested
+    table are not repeated in the outer one. Unclosed cells, rows and items
+    are closed by the next one, as browsers do
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.events = []
+        self._containers: List[_Container] = []
+        # Text pieces being read into, one list per open cell, item, caption or heading
+        self._collectors: List[List[str]] = []
+        self._headings: List[List[str]] = []
+        self._heading: Optional[str] = None
+        self._pending: List[str] = []
+        self._skip = 0
+
+    # Text
+
+    def handle_data(self, data: str):
+        if not self._skip:
+            # A text node can arrive in pieces at chunk boundaries
+            self._pending.append(data)
+
+    def _flush(self):
+        """Close the pending text node; called at every tag"""
+        if self._pending:
+            text = ''.join(self._pending).strip()
+            self._pending = []
+            if text:
+                for collector in self._collectors:
+                    collector.append(text)
+
+    def _open(self) -> List[str]:
+        collector = []
+        self._collectors.append(collector)
+        return collector
+
+    def _close(self, collector: List[str]) -> str:
+        # By identity, two collectors can hold equal text
+        for idx in range(len(self._collectors) - 1, -1, -1):
+            if self._collectors[idx] is collector:
+                del self._collectors[idx]
+                break
+        return ''.join(collector)
+
+    # Tags
+
+    def handle_starttag(self, tag: str, attrs):
+        self._flush()
+        if tag in NON_TEXT_TAGS:
+            self._skip += 1
+            return
+        innermost = self._containers[-1] if self._containers else None
+
+        if tag == 'table' or tag in LIST_TAGS:
+            element_id = dict(attrs).get('id')
+            self._containers.append(_Container(tag))
+            if tag == 'table':
+                self.events.append(('table', element_id, self._heading))
+            else:
+                self.events.append(('list', tag, element_id, self._heading))
+        elif innermost is None or innermost.tag != 'table':
+            if tag == 'li' and innermost is not None:
+                self._end_item(innermost)
+                innermost.item = self._open()
+            elif tag in HEADING_TAGS:
+                self._headings.append(self._open())
+        elif tag == 'tr':
+            self._end_row(innermost)
+            innermost.row = []
+        elif tag in ('td', 'th'):
+            self._end_cell(innermost)
+            if innermost.row is None:
+                innermost.row = []
+            innermost.cell = self._open()
+        elif tag == 'caption':
+            if not innermost.captioned:
+                innermost.caption = self._open()
+                innermost.captioned = True
+        elif tag in HEADING_TAGS:
+            self._headings.append(self._open())
+
+    def handle_endtag(self, tag: str):
+        self._flush()
+        if tag in NON_TEXT_TAGS:
+            self._skip = max(0, self._skip - 1)
+            return
+        innermost = self._containers[-1] if self._containers else None
+
+        if tag == 'table' or tag in LIST_TAGS:
+            # Close everything opened inside it; a stray end tag is ignored
+            if any(container.tag == tag for container in self._containers):
+                while self._end_container().tag != tag:
+                    pass
+        elif tag in HEADING_TAGS:
+            if self._headings:
+                self._heading = self._close(self._headings.pop())
+        elif innermost is None:
+            return
+        elif innermost.tag == 'table':
+            if tag in ('td', 'th'):
+                self._end_cell(innermost)
+            elif tag == 'tr':
+                self._end_row(innermost)
+            elif tag == 'caption':
+                self._end_caption(innermost)
+        elif tag == 'li':
+            self._end_item(innermost)
+
+    def _end_cell(self, table: _Container):
+        if table.cell is not None:
+            table.row.append(self._close(table.cell))
+            table.cell = None
+
+    def _end_row(self, table: _Container):
+        self._end_cell(table)
+        if table.row:
+            self.events.append(('row', table.row))
+        table.row = None
+
+    def _end_caption(self, table: _Container):
+        if table.caption is not None:
+            self.events.append(('caption', self._close(table.caption)))
+            table.caption = None
+
+    def _end_item(self, lst: _Container):
+        if lst.item is not None:
+            self.events.append(('item', self._close(lst.item)))
+            lst.item = None
+
+    def _end_container(self) -> _Container:
+        container = self._containers.pop()
+        if container.tag == 'table':
+            self._end_caption(container)
+            self._end_row(container)
+        else:
+            self._end_item(container)
+        self.events.append(('end',))
+        return container
+
+    def close(self):
+        super().close()
+        self._flush()
+        while self._containers:
+            self._end_container()
+
+
+def iter_page(path: str) -> Iterator[tuple]:
+    """Stream a page from disk, yielding PageStreamParser events"""
+    parser = PageStreamParser()
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+        decoder = codecs.getincrementaldecoder(sniff_encoding(head) or 'utf-8')(errors='replace')
+        chunk = head
+        while chunk:
+            parser.feed(decoder.decode(chunk))
+            yield from parser.events
+            parser.events.clear()
+            chunk = f.read(READ_CHUNK_SIZE)
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    yield from parser.events
+
+
+def _container_rows(events: Iterator[tuple]) -> Iterator[List[str]]:
+    """Rows of the table or list just opened, up to its end; nested ones are skipped"""
+    depth = 0
+    for event in events:
+        kind = event[0]
+        if kind in ('table', 'list'):
+            depth += 1
+        elif kind == 'end':
+            if not depth:
+                return
+            depth -= 1
+        elif depth:
+            continue
+        elif kind == 'row':
+            yield event[1]
+        elif kind == 'item':
+            yield [event[1]]
+
+
+def _stream_sheet(path: str, kind: str, index: int, name: str) -> ColumnarSheet:
+    noun = 'Table' if kind == 'table' else 'List'
+    events = iter_page(path)
+    found = 0
+    try:
+        for event in events:
+            if event[0] == kind:
+                if found == index:
+                    return ColumnarSheet.from_row_stream(name, _container_rows(events))
+                found += 1
+    finally:
+        # Stops reading the page once the wanted table is complete
+        events.close()
+    raise ValueError(f"{noun} index {index} not found. Only {found} {noun.lower()}s available.")
+
+
+def stream_table(path: str, table_index: int) -> ColumnarSheet:
+    """
+    Parse one table of a page on disk as a stream, its rows going straight
+    into a columnar sheet. Module-level so it can run in the process pool
+    """
+    sheet = _stream_sheet(path, 'table', table_index, f"Table_{table_index + 1}")
+    if not sheet.n_rows:
+        raise ValueError("No data found in table")
+    return sheet
+
+
+def stream_list(path: str, list_index: int) -> ColumnarSheet:
+    """Parse one list of a page on disk as a stream, like stream_table"""
+    return _stream_sheet(path, 'list', list_index, f"List_{list_index + 1}")
+
+
+def stream_tables(path: str) -> List[ColumnarSheet]:
+    """Every table of a page on disk that has rows, streamed into columnar sheets named by table index"""
+    sheets = []
+    # [sheet, row block] of the open tables, None for lists, innermost last
+    stack = []
+
+    for event in iter_page(path):
+        kind = event[0]
+        if kind == 'table':
+            entry = [ColumnarSheet(f"Table_{len(sheets) + 1}"), []]
+            sheets.append(entry[0])
+            stack.append(entry)
+        elif kind == 'list':
+            stack.append(None)
+        elif kind == 'end':
+            entry = stack.pop()
+            if entry is not None:
+                entry[0].append_rows(entry[1])
+        elif kind == 'row':
+            entry = stack[-1]
+            entry[1].append(event[1])
+            if len(entry[1]) == ROW_BLOCK_SIZE:
+                entry[0].append_rows(entry[1])
+                entry[1] = []
+    return [sheet for sheet in sheets if sheet.n_rows]
+
+
+def stream_index(path: str, sample_rows: int = 3) -> dict:
+    """Same as ParsedDocument.index() for a page on disk, parsed as a stream"""
+    tables = []
+    lists = []
+    # Entries of the open tables and lists, innermost last
+    stack = []
+
+    for event in iter_page(path):
+        kind = event[0]
+        if kind == 'table':
+            entry = {
+                'index': len(tables), 'n_rows': 0, 'n_cols': 0, 'caption': None,
+                'id': event[1], 'heading': event[2], 'header': [], 'sample_rows': [],
+            }
+            tables.append(entry)
+            stack.append(entry)
+        elif kind == 'list':
+            entry = {
+                'index': len(lists), 'tag': event[1], 'n_items': 0,
+                'id': event[2], 'heading': event[3], 'sample_items': [],
+            }
+            lists.append(entry)
+            stack.append(entry)
+        elif kind == 'end':
+            stack.pop()
+        elif kind == 'caption':
+            stack[-1]['caption'] = event[1]
+        elif kind == 'row':
+            entry = stack[-1]
+            cells = event[1]
+            if not entry['n_rows']:
+                entry['header'] = cells
+            elif len(entry['sample_rows']) < sample_rows:
+                entry['sample_rows'].append(cells)
+            entry['n_rows'] += 1
+            entry['n_cols'] = max(entry['n_cols'], len(cells))
+        elif kind == 'item':
+            entry = stack[-1]
+            if entry['n_items'] < sample_rows:
+                entry['sample_items'].append(event[1])
+            entry['n_items'] += 1
+
+    # Pad like the in-memory parse, to the widest row of each table
+    for entry in tables:
+        for row in [entry['header']] + entry['sample_rows']:
+            row.extend([''] * (entry['n_cols'] - len(row)))
+    return {'tables': tables, 'lists': lists}
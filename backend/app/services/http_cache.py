@@ -0,0 +1,273 @@
+"""
+On-disk cache of scraped HTTP responses
+
+Bodies are stored as files named by the hash of their URL, with an
+SQLite index holding validators, freshness and access times. Freshness
+follows Cache-Control (no-store, no-cache, max-age), Expires and Age,
+with a heuristic lifetime for pages that send none. Stale entries with an
+ETag or Last-Modified are revalidated with a conditional request, so an
+unchanged page costs a 304 instead of a full download. The total body
+size is capped and least recently used entries are evicted.
+
+Entry files are replaced, evicted and deleted while other requests may
+still want them, so readers never open them directly: they take a private
+hard link (a copy where links are unsupported) that keeps the body they
+got intact until they remove it.
+"""
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+import httpx
+
+# Heuristic lifetime for pages with only Last-Modified: this share of
+# their age, at most a day
+LAST_MODIFIED_FRACTION = 0.1
+MAX_HEURISTIC_SECONDS = 24 * 60 * 60
+
+
+def _parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    directives = {}
+    for part in value.split(','):
+        name, _, arg = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+    return directives
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class CachedResponse:
+    """Index record of one cached response"""
+
+    __slots__ = ('url', 'path', 'etag', 'last_modified', 'expires_at', 'size')
+
+    def __init__(self, url: str, path: str, etag: Optional[str], last_modified: Optional[str],
+                 expires_at: float, size: int):
+        self.url = url
+        self.path = path
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+        self.size = size
+
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def validators(self) -> Dict[str, str]:
+        """Headers for a conditional request revalidating this response"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def read(self) -> bytes:
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+
+class HttpCache:
+    def __init__(self, directory: str, max_bytes: int, default_ttl: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(os.path.join(directory, 'index.sqlite3'), check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses '
+            '(url TEXT PRIMARY KEY, file TEXT NOT NULL, etag TEXT, last_modified TEXT, '
+            'expires_at REAL NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, url: str) -> Optional[CachedResponse]:
+        """The cached response for url, fresh or stale, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT file, etag, last_modified, expires_at, size FROM responses WHERE url = ?', (url,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET accessed_at = ? WHERE url = ?', (time.time(), url))
+            self._conn.commit()
+
+        entry = CachedResponse(url, os.path.join(self.directory, row[0]), row[1], row[2], row[3], row[4])
+        if not os.path.exists(entry.path):
+            self.delete(url)
+            self.misses += 1
+            return None
+        if entry.is_fresh():
+            self.hits += 1
+        return entry
+
+    def temp_path(self) -> str:
+        """A new file in the cache directory, for a body that store() can then move in"""
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        os.close(fd)
+        return path
+
+    def link(self, path: str) -> Optional[str]:
+        """
+        A private hard link to a body file in the cache directory, for the
+        caller to read and remove. None if the file is already gone
+        """
+        private = self.temp_path()
+        # A link cannot replace a file, drop the placeholder first
+        os.remove(private)
+        try:
+            os.link(path, private)
+        except FileNotFoundError:
+            return None
+        except OSError:
+            try:
+                shutil.copyfile(path, private)
+            except FileNotFoundError:
+                self._remove_file(private)
+                return None
+        return private
+
+    def pin(self, entry: CachedResponse) -> Optional[str]:
+        """A private link to a cached body (see link), None if it was evicted since the lookup"""
+        return self.link(entry.path)
+
+    def store(self, url: str, response: httpx.Response, body_path: str) -> Optional[CachedResponse]:
+        """
+        Cache a 200 response whose body was downloaded to body_path, if its
+        headers allow it. The file is moved into the cache and the new entry
+        returned; when nothing is stored the file is left to the caller
+        """
+        expires_at = self._expires_at(response.headers)
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if response.status_code != 200 or expires_at is None:
+            self.delete(url)
+            return None
+
+        size = os.path.getsize(body_path)
+        if size > self.max_bytes:
+            return None
+        # A response that can neither be reused nor revalidated is useless
+        if expires_at <= time.time() and not etag and not last_modified:
+            self.delete(url)
+            return None
+
+        name = hashlib.sha256(url.encode()).hexdigest()
+        path = os.path.join(self.directory, name)
+        # Same directory as temp_path(), so this is an atomic rename
+        os.replace(body_path, path)
+
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (url, file, etag, last_modified, expires_at, size, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, name, etag, last_modified, expires_at, size, time.time()),
+            )
+            self._conn.commit()
+            self._evict()
+        return CachedResponse(url, path, etag, last_modified, expires_at, size)
+
+    def refresh(self, entry: CachedResponse, response: httpx.Response):
+        """Extend a cached response after a 304"""
+        self.revalidated += 1
+        expires_at = self._expires_at(response.headers)
+        with self._lock:
+            self._conn.execute(
+                'UPDATE responses SET expires_at = ?, etag = COALESCE(?, etag), accessed_at = ? WHERE url = ?',
+                (expires_at or time.time(), response.headers.get('ETag'), time.time(), entry.url),
+            )
+            self._conn.commit()
+
+    def delete(self, url: str):
+        with self._lock:
+            row = self._conn.execute('SELECT file FROM responses WHERE url = ?', (url,)).fetchone()
+            if row is None:
+                return
+            self._conn.execute('DELETE FROM responses WHERE url = ?', (url,))
+            self._conn.commit()
+        self._remove_file(row[0])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries, size = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        return {
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'revalidated': self.revalidated,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def _expires_at(self, headers: httpx.Headers) -> Optional[float]:
+        """When a response stops being fresh, or None if it must not be stored"""
+        now = time.time()
+        cache_control = _parse_cache_control(headers.get('Cache-Control', ''))
+        if 'no-store' in cache_control:
+            return None
+        if 'no-cache' in cache_control:
+            return now
+
+        age = headers.get('Age', '')
+        age = int(age) if age.isdigit() else 0
+        max_age = cache_control.get('max-age')
+        if max_age is not None and max_age.isdigit():
+            return now + int(max_age) - age
+
+        date = _http_date(headers.get('Date')) or now
+        expires = headers.get('Expires')
+        if expires is not None:
+            # Invalid dates such as "0" mean already expired
+            expires_at = _http_date(expires)
+            return now + expires_at - date if expires_at is not None else now
+
+        last_modified = _http_date(headers.get('Last-Modified'))
+        if last_modified is not None:
+            lifetime = min((date - last_modified) * LAST_MODIFIED_FRACTION, MAX_HEURISTIC_SECONDS)
+            return now + max(lifetime, 0) - age
+        return now + self.default_ttl - age
+
+    def _evict(self):
+        """Drop least recently used responses until the cache fits; call with the lock held"""
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, name, size in self._conn.execute(
+            'SELECT url, file, size FROM responses ORDER BY accessed_at'
+        ).fetchall():
+            self._conn.execute('DELETE FROM responses WHERE url = ?', (url,))
+            self._remove_file(name)
+            self.evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self._conn.commit()
+
+    def _remove_file(self, name: str):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
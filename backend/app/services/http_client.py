@@ -0,0 +1,256 @@
+"""
+Shared HTTP client for scraping
+
+One keep-alive connection pool serves every scrape, so repeat requests to
+a host skip DNS, TCP and TLS setup. The client lives on its own event loop
+thread: the server's loop and sync callers (MCP tools) both hand requests
+to it, and the pool is never tied to a loop that goes away. Requests are
+throttled by a global in-flight cap plus a per-host concurrency limit and
+start rate, and failed or throttled requests are retried with exponential
+backoff. Bodies are read in chunks against a size limit, and downloads
+stream straight to a file instead of memory.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from concurrent.futures import Future
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+import httpx
+from app.config import (
+    SCRAPE_MAX_IN_FLIGHT,
+    SCRAPE_PER_HOST_CONCURRENCY,
+    SCRAPE_PER_HOST_RATE,
+    SCRAPE_MAX_RETRIES,
+    SCRAPE_BACKOFF_SECONDS,
+    SCRAPE_TIMEOUT_SECONDS,
+    SCRAPE_MAX_BYTES,
+)
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+# Responses worth retrying: throttled or a temporarily broken upstream
+RETRY_STATUSES = {429, 502, 503, 504}
+
+# Longest Retry-After we are willing to wait for
+MAX_RETRY_AFTER_SECONDS = 30
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Host limiters kept; past this, idle ones are dropped least recently used first
+MAX_HOST_LIMITERS = 1024
+
+
+class ResponseTooLarge(httpx.HTTPError):
+    """Raised when a response body is over the size limit"""
+
+
+class HostLimiter:
+    """Concurrency and start-rate limit for one host"""
+
+    def __init__(self, concurrency: int, rate: float):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next_start = 0.0
+        self.users = 0
+
+    def idle(self, now: float) -> bool:
+        """No request uses it and its rate window is over, so dropping it loses nothing"""
+        return self.users == 0 and self.next_start <= now
+
+    async def wait_turn(self):
+        """Sleep until this host may be sent another request"""
+        now = time.monotonic()
+        start = max(now, self.next_start)
+        self.next_start = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class HttpClient:
+    def __init__(
+        self,
+        max_in_flight: int = SCRAPE_MAX_IN_FLIGHT,
+        per_host_concurrency: int = SCRAPE_PER_HOST_CONCURRENCY,
+        per_host_rate: float = SCRAPE_PER_HOST_RATE,
+        max_retries: int = SCRAPE_MAX_RETRIES,
+        backoff_seconds: float = SCRAPE_BACKOFF_SECONDS,
+        timeout_seconds: float = SCRAPE_TIMEOUT_SECONDS,
+    ):
+        self.max_in_flight = max_in_flight
+        self.per_host_concurrency = per_host_concurrency
+        self.per_host_rate = per_host_rate
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout_seconds = timeout_seconds
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._hosts: 'OrderedDict[str, HostLimiter]' = OrderedDict()
+        self._start_lock = threading.Lock()
+
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        """Start the client's loop thread on first use"""
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='web-excel-http', daemon=True).start()
+                asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+                self._loop = loop
+            return self._loop
+
+    async def _open(self):
+        limits = httpx.Limits(
+            max_connections=self.max_in_flight,
+            max_keepalive_connections=self.max_in_flight,
+            keepalive_expiry=30,
+        )
+        self._client = httpx.AsyncClient(
+            headers=HEADERS,
+            timeout=self.timeout_seconds,
+            limits=limits,
+            follow_redirects=True,
+        )
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+
+    def _submit(self, url: str, headers: Optional[Dict[str, str]], path: Optional[str], max_bytes: int) -> Future:
+        return asyncio.run_coroutine_threadsafe(self._get(url, headers, path, max_bytes), self._ensure_started())
+
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None,
+                  max_bytes: int = SCRAPE_MAX_BYTES) -> httpx.Response:
+        """GET url with the body read, from any event loop"""
+        return await asyncio.wrap_future(self._submit(url, headers, None, max_bytes))
+
+    def get_sync(self, url: str, headers: Optional[Dict[str, str]] = None,
+                 max_bytes: int = SCRAPE_MAX_BYTES) -> httpx.Response:
+        """GET url with the body read, from sync code"""
+        return self._submit(url, headers, None, max_bytes).result()
+
+    async def download(self, url: str, path: str, headers: Optional[Dict[str, str]] = None,
+                       max_bytes: int = SCRAPE_MAX_BYTES) -> httpx.Response:
+        """
+        GET url streaming the body of a 2xx response into the file at path
+        The returned response carries status and headers but no content
+        """
+        return await asyncio.wrap_future(self._submit(url, headers, path, max_bytes))
+
+    async def _get(self, url: str, headers: Optional[Dict[str, str]], path: Optional[str],
+                   max_bytes: int) -> httpx.Response:
+        limiter = self._limiter(urlsplit(url).netloc.lower())
+        limiter.users += 1
+        try:
+            return await self._get_limited(limiter, url, headers, path, max_bytes)
+        finally:
+            limiter.users -= 1
+
+    async def _get_limited(self, limiter: HostLimiter, url: str, headers: Optional[Dict[str, str]],
+                           path: Optional[str], max_bytes: int) -> httpx.Response:
+        attempt = 0
+        while True:
+            # Wait for the host's own limits before taking a global slot, so a
+            # slow or throttled host cannot hold slots other hosts could use
+            async with limiter.semaphore:
+                await limiter.wait_turn()
+                async with self._in_flight:
+                    self.requests += 1
+                    try:
+                        response = await self._client.send(self._client.build_request('GET', url, headers=headers),
+                                                           stream=True)
+                        try:
+                            if response.status_code not in RETRY_STATUSES:
+                                await self._read_body(response, path, max_bytes)
+                        finally:
+                            await response.aclose()
+                        error = None
+                    except httpx.TransportError as e:
+                        response, error = None, e
+
+            retryable = error is not None or response.status_code in RETRY_STATUSES
+            if not retryable or attempt >= self.max_retries:
+                if error is not None:
+                    self.failures += 1
+                    raise error
+                return response
+
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(self._backoff(attempt, response))
+
+    def _limiter(self, host: str) -> HostLimiter:
+        """The host's limiter, created on first use; runs on the client's loop only"""
+        limiter = self._hosts.get(host)
+        if limiter is not None:
+            self._hosts.move_to_end(host)
+            return limiter
+
+        if len(self._hosts) >= MAX_HOST_LIMITERS:
+            now = time.monotonic()
+            idle = [name for name, other in self._hosts.items() if other.idle(now)]
+            for name in idle[:len(self._hosts) - MAX_HOST_LIMITERS + 1]:
+                del self._hosts[name]
+        limiter = self._hosts[host] = HostLimiter(self.per_host_concurrency, self.per_host_rate)
+        return limiter
+
+    @staticmethod
+    async def _read_body(response: httpx.Response, path: Optional[str], max_bytes: int):
+        """Read the body into the response, or a 2xx body into path, stopping at max_bytes"""
+        length = response.headers.get('Content-Length', '')
+        if length.isdigit() and int(length) > max_bytes:
+            raise ResponseTooLarge(f"Response is {length} bytes, the limit is {max_bytes}")
+
+        to_file = path is not None and response.is_success
+        chunks = []
+        size = 0
+        # Count decoded bytes, a compressed body can unpack far past its Content-Length
+        with open(path, 'wb') if to_file else nullcontext() as f:
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ResponseTooLarge(f"Response is over the limit of {max_bytes} bytes")
+                if to_file:
+                    # Small sequential writes, cheap enough for this I/O-only loop
+                    f.write(chunk)
+                else:
+                    chunks.append(chunk)
+        if not to_file:
+            # What aread() would have cached, so .content works as usual
+            response._content = b''.join(chunks)
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        """Delay before a retry: Retry-After if the server sent one, else jittered exponential"""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), MAX_RETRY_AFTER_SECONDS)
+        delay = self.backoff_seconds * 2 ** (attempt - 1)
+        return delay * random.uniform(0.5, 1.5)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'failures': self.failures,
+            'hosts': len(self._hosts),
+        }
+
+    def close(self):
+        """Close pooled connections and stop the loop thread"""
+        with self._start_lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+
+
+# Global instance
+http_client = HttpClient()
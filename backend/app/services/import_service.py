@@ -0,0 +1,117 @@
+"""
+Streaming import of uploaded spreadsheet files
+
+CSV/TSV files are decoded and parsed incrementally, and XLSX files are
+read with openpyxl's read-only mode, which streams the sheet XML instead
+of building a full cell tree. Rows go straight into columnar storage a
+block at a time, so neither the file nor a list of all rows is ever held
+in memory.
+"""
+import csv
+import io
+import os
+import zipfile
+from datetime import date, datetime, time
+from typing import BinaryIO, Iterable, Iterator, List
+from openpyxl import load_workbook
+from app.services.sheet_store import ColumnarSheet
+from app.services.excel_service import excel_service
+from app.config import IMPORT_MAX_BYTES, IMPORT_MAX_UNPACKED_BYTES, IMPORT_MAX_ROWS, IMPORT_MAX_COLUMNS
+
+CSV_DELIMITERS = {'.csv': ',', '.tsv': '\t', '.txt': '\t'}
+XLSX_EXTENSIONS = ('.xlsx', '.xlsm')
+
+# Fields can be long (free text), but not unbounded
+csv.field_size_limit(16 * 1024 * 1024)
+
+
+class ImportLimitError(ValueError):
+    """Raised when an upload exceeds one of the import limits"""
+
+
+def _cell_text(value) -> str:
+    """Format an XLSX cell value the way the grid shows it"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float):
+        return repr(int(value)) if value.is_integer() else repr(value)
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    return str(value)
+
+
+class ImportService:
+    def import_file(self, filename: str, file: BinaryIO, encoding: str = 'utf-8-sig') -> str:
+        """
+        Import an uploaded .csv, .tsv or .xlsx file into a new workbook
+        Returns the workbook ID. Raises ImportLimitError if the file is too
+        large and ValueError if it cannot be read
+        """
+        size = file.seek(0, io.SEEK_END)
+        file.seek(0)
+        if size > IMPORT_MAX_BYTES:
+            raise ImportLimitError(f"File is {size} bytes, the limit is {IMPORT_MAX_BYTES}")
+
+        stem, extension = os.path.splitext(os.path.basename(filename or ''))
+        extension = extension.lower()
+        if extension in CSV_DELIMITERS:
+            sheets = [self._read_csv(stem or 'Sheet1', file, CSV_DELIMITERS[extension], encoding)]
+        elif extension in XLSX_EXTENSIONS:
+            sheets = self._read_xlsx(file)
+        else:
+            raise ValueError(f"Unsupported file type '{extension}', use .csv, .tsv or .xlsx")
+
+        if not sheets:
+            raise ValueError('The file contains no sheets')
+        return excel_service.create_workbook_from_sheets(sheets)
+
+    def _read_csv(self, name: str, file: BinaryIO, delimiter: str, encoding: str) -> ColumnarSheet:
+        text = io.TextIOWrapper(file, encoding=encoding, newline='')
+        try:
+            return ColumnarSheet.from_row_stream(name, self._limited(csv.reader(text, delimiter=delimiter)))
+        except UnicodeDecodeError:
+            raise ValueError(f"File is not valid {encoding} text, pass the right encoding")
+        except csv.Error as e:
+            raise ValueError(f"Invalid CSV: {e}")
+        finally:
+            # Leave the upload open, its owner closes it
+            text.detach()
+
+    def _read_xlsx(self, file: BinaryIO) -> List[ColumnarSheet]:
+        try:
+            with zipfile.ZipFile(file) as archive:
+                unpacked = sum(info.file_size for info in archive.infolist())
+        except zipfile.BadZipFile:
+            raise ValueError('File is not a valid XLSX workbook')
+        if unpacked > IMPORT_MAX_UNPACKED_BYTES:
+            raise ImportLimitError(f"Workbook unpacks to {unpacked} bytes, the limit is {IMPORT_MAX_UNPACKED_BYTES}")
+
+        file.seek(0)
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            return [
+                ColumnarSheet.from_row_stream(ws.title, self._limited(
+                    [_cell_text(value) for value in row] for row in ws.iter_rows(values_only=True)
+                ))
+                for ws in workbook.worksheets
+            ]
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def _limited(rows: Iterable[List[str]]) -> Iterator[List[str]]:
+        """Pass rows through, stopping at the row and column limits"""
+        for count, row in enumerate(rows, 1):
+            if count > IMPORT_MAX_ROWS:
+                raise ImportLimitError(f"Sheet has more than {IMPORT_MAX_ROWS} rows")
+            if len(row) > IMPORT_MAX_COLUMNS:
+                raise ImportLimitError(f"Sheet has more than {IMPORT_MAX_COLUMNS} columns")
+            yield row
+
+
+# Global instance
+import_service = ImportService()
@@ -0,0 +1,222 @@
+"""
+Background jobs for long-running actions
+
+Scrapes, crawls, exports and agent messages can run as jobs: the request
+that starts one returns its id right away and the work continues on the
+server's event loop. A job reports progress as it goes, which clients
+read by polling or by following its event stream. Jobs wait for a slot
+in a bounded pool, with a further limit per job type so one kind of work
+cannot take every slot, and can be cancelled whether queued or running.
+Finished jobs and their results are kept for a while, then dropped.
+
+Jobs run and are tracked in the server process that accepted them.
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from app.config import JOB_MAX_WORKERS, JOB_TYPE_LIMITS, JOB_MAX_QUEUED, JOB_TTL_SECONDS
+
+FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+# Longest a cancelled job may take to unwind before cancel() returns
+CANCEL_WAIT_SECONDS = 5
+
+
+class JobQueueFullError(ValueError):
+    """Raised when too many jobs are already waiting to run"""
+
+
+def parse_type_limits(value: str) -> Dict[str, int]:
+    """'scrape=4,crawl=2' as {'scrape': 4, 'crawl': 2}"""
+    limits = {}
+    for part in value.split(','):
+        name, _, limit = part.partition('=')
+        if name.strip() and limit.strip().isdigit():
+            limits[name.strip()] = max(1, int(limit))
+    return limits
+
+
+class Job:
+    """One background job: its state, progress and result"""
+
+    def __init__(self, job_type: str):
+        self.id = str(uuid.uuid4())
+        self.type = job_type
+        self.status = 'queued'
+        self.progress: Dict[str, Any] = {}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Temp files owned by the result, removed with the job
+        self.files: List[str] = []
+        self.task: Optional[asyncio.Task] = None
+        self.revision = 0
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def report(self, stage: str, **info):
+        """Replace the job's progress; called from the job's own code on the event loop"""
+        self.progress = {'stage': stage, **info}
+        self._notify()
+
+    def _notify(self):
+        self.revision += 1
+        # Wake every watcher, later waits go on a fresh event
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def snapshot(self, with_result: bool = True) -> dict:
+        return {
+            'id': self.id,
+            'type': self.type,
+            'status': self.status,
+            'progress': self.progress,
+            'result': self.result if with_result else None,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+    async def watch(self, heartbeat: Optional[float] = None) -> AsyncIterator[Optional[dict]]:
+        """
+        Snapshots of the job as it changes, ending with its final state
+        A slow reader skips intermediate progress rather than queueing it.
+        With heartbeat, None is yielded after that many quiet seconds
+        """
+        revision = None
+        while True:
+            changed = self._changed
+            if self.revision != revision:
+                revision = self.revision
+                # The job may finish while the reader holds this snapshot,
+                # only stop after handing out the final one
+                finished = self.finished
+                yield self.snapshot()
+                if finished:
+                    return
+                continue
+            try:
+                await asyncio.wait_for(changed.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+
+    def remove_files(self):
+        for path in self.files:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.files = []
+
+
+class JobService:
+    def __init__(
+        self,
+        max_workers: int = JOB_MAX_WORKERS,
+        type_limits: Optional[Dict[str, int]] = None,
+        max_queued: int = JOB_MAX_QUEUED,
+        ttl_seconds: int = JOB_TTL_SECONDS,
+    ):
+        self.max_workers = max_workers
+        self.type_limits = parse_type_limits(JOB_TYPE_LIMITS) if type_limits is None else type_limits
+        self.max_queued = max_queued
+        self.ttl_seconds = ttl_seconds
+        self.jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._workers = asyncio.Semaphore(max_workers)
+        self._type_slots: Dict[str, asyncio.Semaphore] = {}
+
+    def submit(self, job_type: str, run: Callable[[Job], Awaitable[Any]]) -> Job:
+        """
+        Start run(job) as a background job and return the job at once
+        Call from the server's event loop; the job's result is what run returns
+        """
+        self._expire()
+        queued = sum(job.status == 'queued' for job in self.jobs.values())
+        if queued >= self.max_queued:
+            raise JobQueueFullError(f"{queued} jobs are already waiting, try again later")
+
+        job = Job(job_type)
+        self.jobs[job.id] = job
+        job.task = asyncio.get_running_loop().create_task(self._run(job, run))
+        return job
+
+    async def _run(self, job: Job, run: Callable[[Job], Awaitable[Any]]):
+        try:
+            # Type slot first, so a job held back by its type keeps no pool slot
+            async with self._slots(job.type), self._workers:
+                job.status = 'running'
+                job.started_at = time.time()
+                job._notify()
+                job.result = await run(job)
+                job.status = 'succeeded'
+        except asyncio.CancelledError:
+            job.status = 'cancelled'
+            job.remove_files()
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            job.remove_files()
+        finally:
+            job.finished_at = time.time()
+            job._notify()
+
+    def _slots(self, job_type: str) -> asyncio.Semaphore:
+        slots = self._type_slots.get(job_type)
+        if slots is None:
+            limit = self.type_limits.get(job_type, self.max_workers)
+            slots = self._type_slots[job_type] = asyncio.Semaphore(limit)
+        return slots
+
+    def get(self, job_id: str) -> Job:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise ValueError(f"Job {job_id} not found")
+        return job
+
+    def list_jobs(self) -> List[dict]:
+        """Every job still kept, oldest first, without results"""
+        self._expire()
+        return [job.snapshot(with_result=False) for job in self.jobs.values()]
+
+    async def cancel(self, job_id: str) -> Job:
+        """Cancel a queued or running job and wait briefly for it to stop"""
+        job = self.get(job_id)
+        if not job.finished:
+            job.task.cancel()
+            await asyncio.wait([job.task], timeout=CANCEL_WAIT_SECONDS)
+        return job
+
+    async def shutdown(self):
+        """Cancel every unfinished job"""
+        tasks = [job.task for job in self.jobs.values() if not job.finished]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=CANCEL_WAIT_SECONDS)
+        for job in self.jobs.values():
+            job.remove_files()
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {status: 0 for status in ('queued', 'running') + FINISHED_STATUSES}
+        for job in self.jobs.values():
+            counts[job.status] += 1
+        return {'jobs': counts, 'max_workers': self.max_workers, 'type_limits': self.type_limits}
+
+    def _expire(self):
+        """Drop jobs finished more than ttl_seconds ago"""
+        cutoff = time.time() - self.ttl_seconds
+        for job_id in [job.id for job in self.jobs.values() if job.finished and job.finished_at < cutoff]:
+            self.jobs.pop(job_id).remove_files()
+
+
+# Global instance
+job_service = JobService()
@@ -0,0 +1,225 @@
+"""
+Numeric values of sheet columns, parsed a whole column at a time
+
+Cells are strings, and charts need numbers. A column is parsed in bulk:
+plain numbers convert straight into a NumPy array, and formatted cells
+are first checked and cleaned a whole column at a time. A formatted
+number may have surrounding whitespace, a currency symbol, commas in
+valid thousands grouping and a trailing percent sign, which scales by
+1/100, so "16.7%", "1,234" and "¥5,000" read as 0.167, 1234 and 5000.
+Anything else, such as "3, 4", "1,2,3", "1_000", "１２" or "2024 01 05",
+is not a number, whatever else its column holds.
+Blank and non-numeric cells read as NaN rather than 0, so they show up
+as gaps instead of fake values.
+
+Stored columns are parsed according to their encoding: int and float
+columns are already numbers, and a dictionary-encoded column only needs
+its distinct strings parsed. Parsed columns are cached by workbook
+version, so repeated charts of an unchanged sheet parse nothing.
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import numpy as np
+from app.services.sheet_store import Column
+from app.config import NUMERIC_CACHE_MAX_BYTES
+
+# Dropped from cells that FORMATTED_NUMBER accepts: currency symbols,
+# thousands separators and whitespace (no-break and ideographic spaces included)
+IGNORED_CHARACTERS = '¥￥$€£₩₹元,' + ' \t\r\xa0\u3000'
+PERCENT_SIGNS = '%％'
+
+_SPACE = '[ \\t\\r\\xa0\\u3000]*'
+_CURRENCY = '[¥￥$€£₩₹]'
+_DIGITS = '(?:[0-9]{1,3}(?:,[0-9]{3})+|[0-9]+)(?:\\.[0-9]*)?|\\.[0-9]+'
+# A formatted number: optional sign and currency symbol (either order),
+# digits with optional thousands grouping, then an exponent, or a percent
+# sign, or 元, with whitespace only around the whole and after the symbol
+FORMATTED_NUMBER = (
+    f'{_SPACE}(?:[-+]?(?:{_CURRENCY}{_SPACE})?|{_CURRENCY}{_SPACE}[-+])'
+    f'(?:{_DIGITS})(?:[eE][-+]?[0-9]+|[{PERCENT_SIGNS}]|元)?{_SPACE}'
+)
+# A line of the joined column that is not a formatted number
+_NOT_A_NUMBER = re.compile(f'^(?!{FORMATTED_NUMBER}$).*$', re.MULTILINE)
+# ASCII characters float() and NumPy accept inside numbers but
+# FORMATTED_NUMBER does not: digit separators and rarer whitespace.
+# They also accept non-ASCII digits and whitespace
+FLOAT_ONLY_CHARACTERS = '_\x0b\x0c\x1c\x1d\x1e\x1f'
+
+# Cells converted at a time once a column turned out to hold non-numbers
+FALLBACK_CHUNK = 4096
+
+
+def parse_numbers(values: List[str]) -> np.ndarray:
+    """Cells as float64, NaN for blank or non-numeric cells"""
+    if not values:
+        return np.empty(0, dtype=np.float64)
+
+    numbers = None
+    # Columns of plain numbers convert in one step. Cells NumPy would read
+    # but FORMATTED_NUMBER rejects, such as "１２" or "1_000", send the
+    # column the checked way, so no cell reads differently for its neighbours
+    if _plain('\n'.join(values)):
+        try:
+            numbers = np.array(values, dtype=np.float64)
+        except ValueError:
+            pass
+    if numbers is None:
+        numbers = _parse_formatted(values)
+    numbers[~np.isfinite(numbers)] = np.nan
+    return numbers
+
+
+def _plain(text: str) -> bool:
+    """Whether float() reads the numbers in text exactly as FORMATTED_NUMBER would"""
+    return text.isascii() and not any(char in text for char in FLOAT_ONLY_CHARACTERS)
+
+
+def _parse_formatted(values: List[str]) -> np.ndarray:
+    """
+    Clean formatted cells, then convert them
+    The cells are checked and cleaned as one newline-joined string, where
+    the regex substitution and each str.replace is a single C-level pass
+    over the whole column
+    """
+    cells = _clean('\n'.join(values)).split('\n')
+    if len(cells) != len(values):
+        # Some cell holds a newline itself, which no number does
+        cells = ['nan' if '\n' in value else _clean(value) for value in values]
+    cells = [cell or 'nan' for cell in cells]
+    try:
+        return np.array(cells, dtype=np.float64)
+    except ValueError:
+        return _parse_mixed(cells)
+
+
+def _clean(text: str) -> str:
+    """
+    Replace lines that are not formatted numbers by nan, then drop ignored
+    characters and turn a percent sign ending a line into e-2
+    """
+    ignored = [char for char in IGNORED_CHARACTERS if char in text]
+    if ignored or not _plain(text):
+        # Without these, lines that are not numbers fail to convert anyway,
+        # except for ones only float() accepts
+        text = _NOT_A_NUMBER.sub('nan', text)
+    for char in ignored:
+        text = text.replace(char, '')
+    if '%' in text or '％' in text:
+        # Shift the exponent rather than divide, so "16.7%" is exactly 0.167
+        text = (text + '\n').replace('％', '%').replace('%\n', 'e-2\n')[:-1]
+    return text
+
+
+def _parse_mixed(cells: List[str]) -> np.ndarray:
+    """Convert cleaned cells of which some are not numbers, chunk by chunk"""
+    numbers = np.empty(len(cells), dtype=np.float64)
+    for start in range(0, len(cells), FALLBACK_CHUNK):
+        chunk = cells[start:start + FALLBACK_CHUNK]
+        try:
+            numbers[start:start + len(chunk)] = np.array(chunk, dtype=np.float64)
+        except ValueError:
+            numbers[start:start + len(chunk)] = [_to_float(cell) for cell in chunk]
+    return numbers
+
+
+def _to_float(cell: str) -> float:
+    try:
+        return float(cell)
+    except ValueError:
+        return np.nan
+
+
+def column_numbers(column: Column) -> np.ndarray:
+    """Numeric values of every cell of a stored column"""
+    if column.kind == 'str':
+        # Parse each distinct string once, then look cells up by code
+        codes = np.frombuffer(column.data, dtype=f'u{column.data.itemsize}')
+        return parse_numbers(column.pool)[codes]
+
+    if column.kind == 'text':
+        return parse_numbers(column.values())
+
+    numbers = np.frombuffer(column.data, dtype=column.data.typecode).astype(np.float64)
+    if column.overrides:
+        rows = list(column.overrides)
+        numbers[rows] = parse_numbers([column.overrides[idx] for idx in rows])
+    return numbers
+
+
+class NumericColumnCache:
+    """
+    Size-bounded LRU cache of parsed sheet columns
+    Entries are keyed by (workbook_id, sheet_index, col) and hold
+    the workbook version they were parsed from, so an edited sheet is
+    parsed again instead of served stale
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[Tuple[str, int, int], Tuple[int, np.ndarray]]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def numbers(self, workbook_id: str, version: int, sheet_index: int, col: int,
+                column: Column) -> np.ndarray:
+        """
+        Numeric values of a column, parsed at most once per workbook
+        version. The array is shared and read-only
+        """
+        key = (workbook_id, sheet_index, col)
+        cached = self._get(key, version)
+        if cached is not None:
+            return cached
+
+        numbers = column_numbers(column)
+        numbers.flags.writeable = False
+        self._put(key, version, numbers)
+        return numbers
+
+    def _get(self, key: Tuple[str, int, int], version: int) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _put(self, key: Tuple[str, int, int], version: int, numbers: np.ndarray):
+        if numbers.nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1].nbytes
+                # A newer parse of the same column already landed
+                if old[0] > version:
+                    self._entries[key] = old
+                    self._size += old[1].nbytes
+                    return
+            self._entries[key] = (version, numbers)
+            self._size += numbers.nbytes
+
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= evicted.nbytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+# Global instance
+numeric_cache = NumericColumnCache(NUMERIC_CACHE_MAX_BYTES)
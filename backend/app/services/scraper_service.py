@@ -1,86 +1,643 @@
-import requests
-from bs4 import BeautifulSoup
-from typing import List, Dict
+import asyncio
+import hashlib
+import os
+import tempfile
+import httpx
+from bs4 import BeautifulSoup, SoupStrainer, UnicodeDammit
+from typing import AsyncIterator, Callable, Dict, List, Optional
+from urllib.parse import unquote, urljoin, urlsplit
 from app.models.excel import Sheet
+from app.services.sheet_store import ColumnarSheet
+from app.services.executors import run_in_process, run_in_thread
+from app.services.http_client import http_client
+from app.services.http_cache import CachedResponse, HttpCache
+from app.services.document_cache import DocumentCache, ParsedDocument
+from app.services.html_stream import (
+    HEADING_TAGS,
+    LIST_TAGS,
+    NON_TEXT_TAGS,
+    stream_index,
+    stream_list,
+    stream_table,
+    stream_tables,
+)
+from app.services.excel_service import excel_service
+from app.config import (
+    HTTP_CACHE_DIR,
+    HTTP_CACHE_MAX_BYTES,
+    HTTP_CACHE_DEFAULT_TTL_SECONDS,
+    DOCUMENT_CACHE_MAX_BYTES,
+    HTML_PARSER,
+    SCRAPE_IN_MEMORY_PARSE_BYTES,
+    SCRAPE_BATCH_CONCURRENCY,
+    SCRAPE_BATCH_MAX_TARGETS,
+    SCRAPE_CRAWL_MAX_PAGES,
+)
+
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:
+    # Optional speedup, pages are parsed with html.parser without it
+    etree = lxml_html = None
+
+try:
+    from cssselect import SelectorError
+    from lxml.cssselect import CSSSelector
+except ImportError:
+    # Next links are then looked up with BeautifulSoup
+    CSSSelector = None
+
+
+DOCUMENT_TAGS = HEADING_TAGS + ['table'] + LIST_TAGS
+
+# Where a crawl finds the next page when no selector is given
+NEXT_LINK_SELECTOR = 'a[rel~=next], link[rel~=next]'
+
+# Pages a crawl follows unless told otherwise
+DEFAULT_CRAWL_PAGES = 50
+
+
+def _pad_rows(rows: List[List[str]]) -> List[List[str]]:
+    """Ensure all rows have the same number of columns"""
+    max_cols = max((len(row) for row in rows), default=0)
+    for row in rows:
+        while len(row) < max_cols:
+            row.append('')
+    return rows
+
+
+def _lxml_text(elem) -> str:
+    """Same result as BeautifulSoup's get_text(strip=True)"""
+    return ''.join(text.strip() for text in elem.itertext())
+
+
+def _parse_document_lxml(content: bytes) -> ParsedDocument:
+    """
+    Fast path: libxml2 builds the tree in C and only the wanted elements
+    are visited from Python
+    """
+    # Detect the encoding the same way BeautifulSoup does, so both paths
+    # read a page identically
+    encoding = UnicodeDammit(content, is_html=True).original_encoding
+    root = lxml_html.document_fromstring(content, parser=lxml_html.HTMLParser(encoding=encoding))
+    # Empty them rather than remove them: removing merges each tail into the
+    # text before it, and the two then strip as one string instead of two
+    for elem in list(root.iter(*NON_TEXT_TAGS)):
+        elem.clear(keep_tail=True)
+
+    tables = []
+    lists = []
+    heading = None
+    for elem in root.iter(*DOCUMENT_TAGS):
+        if elem.tag in HEADING_TAGS:
+            heading = _lxml_text(elem)
+        elif elem.tag == 'table':
+            rows = []
+            for row in elem.iter('tr'):
+                cells = [_lxml_text(cell) for cell in row.iter('td', 'th')]
+                if cells:
+                    rows.append(cells)
+            caption = next(elem.iter('caption'), None)
+            tables.append({
+                'rows': _pad_rows(rows),
+                'caption': _lxml_text(caption) if caption is not None else None,
+                'id': elem.get('id'),
+                'heading': heading,
+            })
+        else:
+            lists.append({
+                'tag': elem.tag,
+                'items': [_lxml_text(item) for item in elem.iter('li')],
+                'id': elem.get('id'),
+                'heading': heading,
+            })
+    return ParsedDocument(tables, lists)
+
+
+def _parse_document_soup(content: bytes) -> ParsedDocument:
+    """Pure-Python path, used when lxml is missing or cannot read the page"""
+    # Only build the elements we extract, the rest of the page is skipped
+    soup = BeautifulSoup(content, 'html.parser', parse_only=SoupStrainer(DOCUMENT_TAGS))
+    tables = []
+    lists = []
+    heading = None
+
+    # One pass in document order, remembering the heading above each element
+    for elem in soup.find_all(DOCUMENT_TAGS):
+        if elem.name in HEADING_TAGS:
+            heading = elem.get_text(strip=True)
+        elif elem.name == 'table':
+            rows = []
+            for row in elem.find_all('tr'):
+                cells = [cell.get_text(strip=True) for cell in row.find_all(['td', 'th'])]
+                if cells:
+                    rows.append(cells)
+            caption = elem.find('caption')
+            tables.append({
+                'rows': _pad_rows(rows),
+                'caption': caption.get_text(strip=True) if caption else None,
+                'id': elem.get('id'),
+                'heading': heading,
+            })
+        else:
+            lists.append({
+                'tag': elem.name,
+                'items': [item.get_text(strip=True) for item in elem.find_all('li')],
+                'id': elem.get('id'),
+                'heading': heading,
+            })
+    return ParsedDocument(tables, lists)
+
+
+def parse_document(content: bytes) -> ParsedDocument:
+    """
+    Parse a page once and extract every table and ul/ol list on it
+    Module-level so it can run in the process pool
+    """
+    if lxml_html is not None and HTML_PARSER != 'html.parser':
+        try:
+            return _parse_document_lxml(content)
+        except (etree.LxmlError, ValueError, LookupError):
+            # Empty or unreadable for libxml2, html.parser is more forgiving
+            pass
+    return _parse_document_soup(content)
+
+
+def parse_structured(content: bytes, selector: Optional[str]) -> List[str]:
+    """Text of the elements matching a CSS selector, or of the whole page"""
+    soup = BeautifulSoup(content, 'html.parser')
+
+    if selector:
+        elements = soup.select(selector)
+        return [elem.get_text(strip=True) for elem in elements]
+    else:
+        # Extract all text content
+        return [soup.get_text(strip=True)]
+
+
+def find_next_link(content: bytes, selector: Optional[str]) -> Optional[str]:
+    """
+    href of the first element matching selector, by default a rel="next"
+    link. Module-level so it can run in the process pool
+    """
+    selector = selector or NEXT_LINK_SELECTOR
+    if CSSSelector is not None and HTML_PARSER != 'html.parser':
+        # A plain lxml tree is many times cheaper than a BeautifulSoup one
+        try:
+            matches = CSSSelector(selector)(lxml_html.fromstring(content))
+            return matches[0].get('href') if matches else None
+        except (SelectorError, etree.LxmlError, ValueError):
+            # Selectors only soupsieve supports, or pages lxml cannot read
+            pass
+
+    elem = BeautifulSoup(content, 'html.parser').select_one(selector)
+    return elem.get('href') if elem is not None else None
+
+
+def _row_key(row: List[str]) -> List[str]:
+    """A row without trailing blanks, so padding to different widths compares equal"""
+    end = len(row)
+    while end and not row[end - 1]:
+        end -= 1
+    return row[:end]
+
+
+def document_table_sheets(document: ParsedDocument, table_index: Optional[int]) -> List[ColumnarSheet]:
+    """One table of a parsed page as a columnar sheet, or every table with rows when table_index is None"""
+    if table_index is None:
+        return [
+            ColumnarSheet.from_rows(f"Table_{idx + 1}", table['rows'])
+            for idx, table in enumerate(document.tables) if table['rows']
+        ]
+    return [ColumnarSheet.from_rows(f"Table_{table_index + 1}", document.table_rows(table_index))]
+
+
+def _page_label(url: str) -> str:
+    """Short name for a page: the last part of its path, or its host"""
+    parts = urlsplit(url)
+    segment = unquote(parts.path.rstrip('/').rsplit('/', 1)[-1])
+    return os.path.splitext(segment)[0] or parts.hostname or 'Page'
+
+
+class PageBody:
+    """
+    A fetched page body on disk, private to this request and deleted on
+    close: a download, or a link to an HTTP cache entry that stays intact
+    when the entry is evicted or replaced
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = os.path.getsize(path)
+
+    def read(self) -> bytes:
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def close(self):
+        _remove_file(self.path)
+
+    def __enter__(self) -> 'PageBody':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
 
 
 class ScraperService:
-    def scrape_table(self, url: str, table_index: int = 0) -> Sheet:
+    def __init__(self):
+        self.cache = (
+            HttpCache(HTTP_CACHE_DIR, HTTP_CACHE_MAX_BYTES, HTTP_CACHE_DEFAULT_TTL_SECONDS)
+            if HTTP_CACHE_DIR else None
+        )
+        self.documents = DocumentCache(DOCUMENT_CACHE_MAX_BYTES)
+
+    async def fetch(self, url: str) -> PageBody:
         """
-        Scrape a table from a webpage
-        Returns a Sheet object that can be used to create an Excel workbook
+        Download a page through the shared, rate-limited HTTP client
+        The body is streamed to disk, never held in memory, and pages over
+        SCRAPE_MAX_BYTES are refused. Fresh cached copies are served without
+        a request, stale ones are revalidated and reused on 304
         """
+        cached = await run_in_thread(self.cache.lookup, url) if self.cache else None
+        if cached is not None and cached.is_fresh():
+            pinned = await run_in_thread(self.cache.pin, cached)
+            if pinned is not None:
+                return PageBody(pinned)
+            cached = None
+
+        body = await self._download(url, cached)
+        if body is None:
+            # The cached copy was evicted between the 304 and pinning it
+            body = await self._download(url, None)
+        return body
+
+    async def _download(self, url: str, cached: Optional[CachedResponse]) -> Optional[PageBody]:
+        """
+        Download a page, revalidating a cached copy if given, and store it in
+        the cache. None if the copy was confirmed by a 304 but is gone
+        """
+        if self.cache:
+            path = self.cache.temp_path()
+        else:
+            fd, path = tempfile.mkstemp(prefix='web-excel-page-')
+            os.close(fd)
+
+        body = None
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
+            try:
+                response = await http_client.download(url, path, cached.validators() if cached else None)
+                if cached is not None and response.status_code == 304:
+                    await run_in_thread(self.cache.refresh, cached, response)
+                    pinned = await run_in_thread(self.cache.pin, cached)
+                    body = PageBody(pinned) if pinned is not None else None
+                    return body
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                raise ValueError(f"Failed to fetch URL: {str(e)}")
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-            tables = soup.find_all('table')
+            if self.cache:
+                # Link before storing, the new entry can be replaced or evicted at once
+                private = await run_in_thread(self._store, url, response, path)
+                body = PageBody(private)
+            else:
+                body = PageBody(path)
+            return body
+        finally:
+            if body is None or body.path != path:
+                _remove_file(path)
 
-            if table_index >= len(tables):
-                raise ValueError(f"Table index {table_index} not found. Only {len(tables)} tables available.")
+    def _store(self, url: str, response: httpx.Response, path: str) -> str:
+        """Cache a downloaded body and return a private link to it"""
+        private = self.cache.link(path)
+        self.cache.store(url, response, path)
+        return private
 
-            table = tables[table_index]
-            rows = []
+    @staticmethod
+    def _streamed(body: PageBody) -> bool:
+        """Whether a page is too big to parse in memory and is parsed as a stream"""
+        return body.size > SCRAPE_IN_MEMORY_PARSE_BYTES
 
-            # Extract table data
-            for row in table.find_all('tr'):
-                cells = []
-                for cell in row.find_all(['td', 'th']):
-                    text = cell.get_text(strip=True)
-                    cells.append(text)
-                if cells:
-                    rows.append(cells)
+    async def _parse(self, body: PageBody) -> ParsedDocument:
+        """
+        Parse a page in memory, or reuse the parse of identical content
+        Every table and list of the page comes out of one parse
+        """
+        content = await run_in_thread(body.read)
+        key = hashlib.sha256(content).hexdigest()
+        document = self.documents.get(key)
+        if document is None:
+            # HTML parsing is CPU bound, keep it off the event loop
+            document = await run_in_process(parse_document, content)
+            self.documents.put(key, document)
+        return document
 
-            if not rows:
-                raise ValueError("No data found in table")
+    async def page_index(self, url: str, sample_rows: int = 3) -> dict:
+        """Shape, header and sample rows of every table and list on a page"""
+        with await self.fetch(url) as body:
+            if self._streamed(body):
+                index = await run_in_process(stream_index, body.path, sample_rows)
+            else:
+                index = (await self._parse(body)).index(sample_rows)
+        return {'url': url, **index}
 
-            # Ensure all rows have the same number of columns
-            max_cols = max(len(row) for row in rows)
-            for row in rows:
-                while len(row) < max_cols:
-                    row.append('')
+    async def _table_sheets(self, body: PageBody, table_index: Optional[int]) -> List[ColumnarSheet]:
+        """
+        Sheets of one table of a fetched page, or of all its tables when
+        table_index is None. Rows of pages too big to parse in memory flow
+        from the parser into the sheets as they are read
+        """
+        if self._streamed(body):
+            if table_index is None:
+                sheets = await run_in_process(stream_tables, body.path)
+            else:
+                sheets = [await run_in_process(stream_table, body.path, table_index)]
+        else:
+            document = await self._parse(body)
+            sheets = await run_in_thread(document_table_sheets, document, table_index)
+        if not sheets:
+            raise ValueError("No table with data found on the page")
+        return sheets
 
-            sheet_name = f"Table_{table_index + 1}"
-            return Sheet(name=sheet_name, rows=rows)
+    async def scrape_table_sheet(self, url: str, table_index: int = 0,
+                                 progress: Optional[Callable[..., None]] = None) -> ColumnarSheet:
+        """
+        Scrape a table from a webpage into a columnar sheet
+        progress, if given, is called with each stage reached ('fetching', 'parsing')
+        """
+        if progress is not None:
+            progress('fetching', url=url)
+        with await self.fetch(url) as body:
+            if progress is not None:
+                progress('parsing', url=url, bytes=body.size)
+            try:
+                return (await self._table_sheets(body, table_index))[0]
+            except Exception as e:
+                raise ValueError(f"Failed to scrape table: {str(e)}")
 
-        except requests.RequestException as e:
-            raise ValueError(f"Failed to fetch URL: {str(e)}")
-        except Exception as e:
-            raise ValueError(f"Failed to scrape table: {str(e)}")
+    async def scrape_list_sheet(self, url: str, list_index: int = 0) -> ColumnarSheet:
+        """Scrape a list (ul/ol) from a webpage into a columnar sheet"""
+        with await self.fetch(url) as body:
+            streamed = self._streamed(body)
+            document = None if streamed else await self._parse(body)
+            try:
+                if streamed:
+                    return await run_in_process(stream_list, body.path, list_index)
+                items = document.list_items(list_index)
+                return ColumnarSheet.from_rows(f"List_{list_index + 1}", [[item] for item in items])
+            except Exception as e:
+                raise ValueError(f"Failed to scrape list: {str(e)}")
 
-    def scrape_list(self, url: str, list_index: int = 0) -> Sheet:
+    async def scrape_table(self, url: str, table_index: int = 0) -> Sheet:
+        """
+        Scrape a table from a webpage
+        Returns a Sheet object that can be used to create an Excel workbook
+        """
+        sheet = await self.scrape_table_sheet(url, table_index)
+        return sheet.to_model()
+
+    async def scrape_list(self, url: str, list_index: int = 0) -> Sheet:
         """
         Scrape a list (ul/ol) from a webpage
         """
+        sheet = await self.scrape_list_sheet(url, list_index)
+        return sheet.to_model()
+
+    async def scrape_batch(self, targets: List[Dict], concurrency: Optional[int] = None,
+                           progress: Optional[Callable[..., None]] = None) -> Dict:
+        """
+        Scrape many url/table targets concurrently into one multi-sheet workbook
+        Each target is {'url', 'table_index', 'sheet_name'}, with table_index
+        None for every table on the page. A page is fetched and parsed once
+        however many targets point at it. A failed target is reported in the
+        results and does not fail the batch. progress, if given, is called
+        as each page is done and before the workbook is built
+        """
+        if not targets:
+            raise ValueError("No scrape targets given")
+        if len(targets) > SCRAPE_BATCH_MAX_TARGETS:
+            raise ValueError(f"{len(targets)} targets given, a batch takes at most {SCRAPE_BATCH_MAX_TARGETS}")
+
+        by_url: Dict[str, List[int]] = {}
+        for idx, target in enumerate(targets):
+            by_url.setdefault(target['url'], []).append(idx)
+        # Sheets, or the exception, per target
+        outcomes: List = [None] * len(targets)
+        semaphore = asyncio.Semaphore(max(1, concurrency or SCRAPE_BATCH_CONCURRENCY))
+        pages_done = 0
+
+        async def scrape_page(url: str, indices: List[int]):
+            nonlocal pages_done
+            async with semaphore:
+                try:
+                    body = await self.fetch(url)
+                except Exception as e:
+                    for idx in indices:
+                        outcomes[idx] = e
+                else:
+                    with body:
+                        for idx in indices:
+                            try:
+                                outcomes[idx] = await self._table_sheets(body, targets[idx].get('table_index', 0))
+                            except Exception as e:
+                                outcomes[idx] = e
+            pages_done += 1
+            if progress is not None:
+                progress('scraping', pages_done=pages_done, pages=len(by_url))
+
+        await asyncio.gather(*(scrape_page(url, indices) for url, indices in by_url.items()))
+        if progress is not None:
+            progress('building', sheets=sum(not isinstance(outcome, Exception) for outcome in outcomes))
+
+        sheets = []
+        results = []
+        for target, outcome in zip(targets, outcomes):
+            result = {'url': target['url'], 'table_index': target.get('table_index', 0)}
+            if isinstance(outcome, Exception):
+                result.update(status='error', error=str(outcome))
+            else:
+                label = target.get('sheet_name') or _page_label(target['url'])
+                for sheet in outcome:
+                    sheet.name = label if target.get('sheet_name') and len(outcome) == 1 else f"{label}_{sheet.name}"
+                result.update(status='ok', sheets=outcome)
+                sheets.extend(outcome)
+            results.append(result)
+
+        workbook_id = await run_in_thread(excel_service.create_workbook_from_sheets, sheets) if sheets else None
+        for result in results:
+            if result['status'] == 'ok':
+                # Names as made unique by the workbook
+                result['rows'] = sum(sheet.n_rows for sheet in result['sheets'])
+                result['sheets'] = [sheet.name for sheet in result['sheets']]
+        return {
+            'workbook_id': workbook_id,
+            'succeeded': sum(result['status'] == 'ok' for result in results),
+            'failed': sum(result['status'] == 'error' for result in results),
+            'results': results,
+        }
+
+    async def _next_link(self, body: PageBody, url: str, selector: Optional[str]) -> Optional[str]:
+        """Absolute URL of a page's next-page link, or None"""
+        if self._streamed(body):
+            raise ValueError(f"Page is {body.size} bytes, too large to look for a next link in")
+        content = await run_in_thread(body.read)
+        href = await run_in_process(find_next_link, content, selector)
+        return urljoin(url, href) if href else None
+
+    async def _crawl_rows(self, body: PageBody, table_index: int) -> List[List[str]]:
+        if self._streamed(body):
+            sheet = await run_in_process(stream_table, body.path, table_index)
+            return sheet.rows()
+        return (await self._parse(body)).table_rows(table_index)
+
+    async def crawl(
+        self,
+        url: Optional[str] = None,
+        table_index: int = 0,
+        next_selector: Optional[str] = None,
+        url_pattern: Optional[str] = None,
+        start_page: int = 1,
+        max_pages: int = DEFAULT_CRAWL_PAGES,
+        sheet_name: Optional[str] = None,
+    ) -> AsyncIterator[Dict]:
+        """
+        Crawl a paginated listing into one sheet, yielding a progress event per page
+        Pages come from url_pattern with {page} replaced by start_page,
+        start_page + 1... or from url and then its next links (next_selector,
+        by default rel="next"). The next page is downloaded while the current
+        one is parsed. Rows go into the workbook as each page is parsed, so
+        it can be read while the crawl runs, and header rows repeated on
+        later pages are dropped. Ends with a 'done' event saying why the
+        crawl stopped. Errors on the first page are raised
+        """
+        if url_pattern:
+            if '{page}' not in url_pattern:
+                raise ValueError("url_pattern must contain {page}")
+            url = url_pattern.replace('{page}', str(start_page))
+        elif not url:
+            raise ValueError("Either url or url_pattern is required")
+        max_pages = max(1, min(max_pages, SCRAPE_CRAWL_MAX_PAGES))
+
+        visited = set()
+        header = None
+        previous = None
+        workbook_id = None
+        total_rows = 0
+        pages = 0
+        stopped = 'max_pages'
+        error = None
+        pending = asyncio.create_task(self.fetch(url))
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
+            for page in range(max_pages):
+                visited.add(url)
+                try:
+                    body = await pending
+                except ValueError as e:
+                    if not page:
+                        raise
+                    stopped, error = 'fetch_error', str(e)
+                    break
+                finally:
+                    pending = None
 
-            soup = BeautifulSoup(response.content, 'html.parser')
-            lists = soup.find_all(['ul', 'ol'])
+                with body:
+                    # Start downloading the next page before parsing this one
+                    next_url = None
+                    if page + 1 < max_pages:
+                        if url_pattern:
+                            next_url = url_pattern.replace('{page}', str(start_page + page + 1))
+                        else:
+                            try:
+                                next_url = await self._next_link(body, url, next_selector)
+                            except Exception as e:
+                                error = f"Failed to find the next link: {str(e)}"
+                        if next_url is not None and next_url not in visited:
+                            pending = asyncio.create_task(self.fetch(next_url))
 
-            if list_index >= len(lists):
-                raise ValueError(f"List index {list_index} not found. Only {len(lists)} lists available.")
+                    try:
+                        rows = await self._crawl_rows(body, table_index)
+                    except Exception as e:
+                        if not page:
+                            raise ValueError(f"Failed to scrape table: {str(e)}")
+                        stopped, error = 'no_table', str(e)
+                        break
 
-            list_elem = lists[list_index]
-            rows = []
+                if rows == previous:
+                    stopped = 'repeated_page'
+                    break
+                previous = rows
+
+                if header is None:
+                    header = _row_key(rows[0])
+                    new_rows = rows[:1] + [row for row in rows[1:] if _row_key(row) != header]
+                    sheet = await run_in_thread(
+                        ColumnarSheet.from_rows, sheet_name or f"Table_{table_index + 1}", new_rows
+                    )
+                    workbook_id = await run_in_thread(excel_service.create_workbook_from_sheets, [sheet])
+                    version = 0
+                else:
+                    new_rows = [row for row in rows if _row_key(row) != header]
+                    shape = await run_in_thread(excel_service.append_rows, workbook_id, 0, new_rows)
+                    version = shape['version']
+                total_rows += len(new_rows)
+                pages += 1
+
+                yield {
+                    'event': 'page',
+                    'page': pages,
+                    'url': url,
+                    'rows': len(new_rows),
+                    'total_rows': total_rows,
+                    'next': next_url,
+                    'workbook_id': workbook_id,
+                    'version': version,
+                }
+
+                if page + 1 < max_pages:
+                    if next_url is None:
+                        stopped = 'last_page'
+                        break
+                    if next_url in visited:
+                        stopped = 'repeated_url'
+                        break
+                url = next_url
+        finally:
+            if pending is not None:
+                self._discard_fetch(pending)
 
-            for item in list_elem.find_all('li'):
-                text = item.get_text(strip=True)
-                rows.append([text])
+        yield {
+            'event': 'done',
+            'pages': pages,
+            'total_rows': total_rows,
+            'workbook_id': workbook_id,
+            'stopped': stopped,
+            'error': error,
+        }
 
-            sheet_name = f"List_{list_index + 1}"
-            return Sheet(name=sheet_name, rows=rows)
+    @staticmethod
+    def _discard_fetch(task: 'asyncio.Task'):
+        """Drop a prefetch that is no longer needed, deleting its download"""
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled() and task.exception() is None:
+            task.result().close()
 
-        except Exception as e:
-            raise ValueError(f"Failed to scrape list: {str(e)}")
+    async def extract_structured_data(self, url: str, selector: Optional[str] = None) -> List[str]:
+        """Extract the text of elements matching a CSS selector from a webpage"""
+        with await self.fetch(url) as body:
+            if body.size > SCRAPE_IN_MEMORY_PARSE_BYTES:
+                raise ValueError(
+                    f"Page is {body.size} bytes, selectors work on pages up to {SCRAPE_IN_MEMORY_PARSE_BYTES} bytes"
+                )
+            content = await run_in_thread(body.read)
+        return await run_in_process(parse_structured, content, selector)
 
 
 # Global instance
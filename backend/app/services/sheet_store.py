@@ -0,0 +1,446 @@
+"""
+Compact column-wise storage for sheet data
+
+Cells are kept per column in typed arrays instead of one Python str per
+cell. Columns whose cells are canonical integers or floats are stored as
+int64/float64 arrays. Low-cardinality string columns are dictionary
+encoded: every distinct string is kept once and cells hold a 4-byte code.
+Mostly-unique string columns (names, ids) are packed into one UTF-8
+buffer plus an int64 end offset per cell. Values are exactly
+round-tripped: a cell only goes into a numeric array if formatting the
+number gives back the original string, and everything else (headers,
+blanks, "总计", later edits of packed text) is kept as a sparse override.
+Overrides are also indexed by sorted row, so reading a block of rows
+only visits the overrides inside it.
+"""
+from array import array
+from bisect import bisect_left, insort
+from itertools import accumulate, chain, islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from app.models.excel import Sheet, Workbook as WorkbookModel
+
+# A numeric column turns into a string column once more than this share
+# of its cells (and at least MIN_OVERRIDES of them) are not numbers
+MAX_OVERRIDE_RATIO = 0.125
+MIN_OVERRIDES = 16
+
+# Rows materialized at a time when iterating a sheet
+ROW_BLOCK_SIZE = 4096
+
+# Rough per-object cost of a pooled string or an override (str header
+# plus dict slot), used for memory accounting
+OBJECT_OVERHEAD = 100
+
+
+def _as_int(value: str) -> Optional[int]:
+    """Return value as an int if it round-trips exactly and fits int64"""
+    digits = value[1:] if value[:1] == '-' else value
+    if not digits.isdigit() or not digits.isascii() or len(digits) > 18:
+        return None
+    # No leading zeros and no "-0", those would not round-trip
+    if digits[0] == '0' and (len(digits) > 1 or value[0] == '-'):
+        return None
+    return int(value)
+
+
+def _as_float(value: str) -> Optional[float]:
+    """Return value as a float if it round-trips exactly"""
+    if not value:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return number if repr(number) == value else None
+
+
+_PARSERS = {'int': _as_int, 'float': _as_float}
+_FORMATTERS = {'int': str, 'float': repr}
+_TYPECODES = {'int': 'q', 'float': 'd', 'str': 'I', 'text': 'q'}
+
+
+class Column:
+    """One sheet column stored as compactly as its values allow"""
+
+    __slots__ = ('kind', 'data', 'overrides', 'override_rows', 'pool', 'lookup', 'blob', 'pool_bytes')
+
+    def __init__(self, kind: str = 'str'):
+        self.kind = kind
+        self.data = array(_TYPECODES[kind])
+        self.overrides: Dict[int, str] = {}
+        # Keys of overrides in order, None until first needed
+        self.override_rows: Optional[List[int]] = None
+        # String pool for dictionary encoding, code 0 is the blank cell
+        self.pool: List[str] = ['']
+        self.lookup: Dict[str, int] = {'': 0}
+        self.pool_bytes = 0
+        # Packed UTF-8 cells for 'text' columns, data holds end offsets
+        self.blob = b''
+
+    @classmethod
+    def from_values(cls, values: List[str]) -> 'Column':
+        """Build a column, picking the most compact encoding for the values"""
+        budget = max(MIN_OVERRIDES, int(len(values) * MAX_OVERRIDE_RATIO))
+
+        for kind in ('int', 'float'):
+            column = cls(kind)
+            parse = _PARSERS[kind]
+            append = column.data.append
+            overrides = column.overrides
+            for idx, value in enumerate(values):
+                number = parse(value)
+                if number is None:
+                    overrides[idx] = value
+                    if len(overrides) > budget:
+                        break
+                    append(0)
+                else:
+                    append(number)
+            else:
+                return column
+
+        if len(set(values)) > len(values) // 2:
+            return cls._packed(values)
+
+        column = cls('str')
+        column.data = array('I', map(column._code, values))
+        return column
+
+    @classmethod
+    def _packed(cls, values: List[str]) -> 'Column':
+        column = cls('text')
+        encoded = [value.encode() for value in values]
+        column.blob = b''.join(encoded)
+        column.data = array('q', accumulate(map(len, encoded)))
+        return column
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def get(self, idx: int) -> str:
+        if self.kind == 'str':
+            return self.pool[self.data[idx]]
+        override = self.overrides.get(idx)
+        if override is not None:
+            return override
+        if self.kind == 'text':
+            begin = self.data[idx - 1] if idx else 0
+            return self.blob[begin:self.data[idx]].decode()
+        return _FORMATTERS[self.kind](self.data[idx])
+
+    def set(self, idx: int, value: str):
+        if self.kind == 'str':
+            self.data[idx] = self._code(value)
+            return
+
+        number = _PARSERS[self.kind](value) if self.kind != 'text' else None
+        if number is not None:
+            self.data[idx] = number
+            if self.overrides.pop(idx, None) is not None:
+                rows = self._indexed_rows()
+                if rows is not None:
+                    del rows[bisect_left(rows, idx)]
+            return
+
+        if idx not in self.overrides:
+            rows = self._indexed_rows()
+            if rows is not None:
+                insort(rows, idx)
+        self.overrides[idx] = value
+        self._check_overrides()
+
+    def extend(self, values: List[str]):
+        """Append cells, keeping the current encoding where the values allow it"""
+        if self.kind == 'str':
+            self.data.extend(map(self._code, values))
+            # Mostly-unique values are smaller packed, as in from_values
+            if len(self.pool) > len(self.data) // 2 + 1:
+                packed = self._packed(self.values())
+                self.kind, self.data, self.blob = 'text', packed.data, packed.blob
+                self.pool, self.lookup, self.pool_bytes = [''], {'': 0}, 0
+            return
+
+        if self.kind == 'text':
+            encoded = [value.encode() for value in values]
+            # Grow in place while appending, bytes would be copied every time
+            if not isinstance(self.blob, bytearray):
+                self.blob = bytearray(self.blob)
+            offsets = accumulate(map(len, encoded), initial=self.data[-1] if self.data else 0)
+            next(offsets)
+            self.data.extend(offsets)
+            self.blob += b''.join(encoded)
+            return
+
+        parse = _PARSERS[self.kind]
+        append = self.data.append
+        overrides = self.overrides
+        count = len(overrides)
+        for idx, value in enumerate(values, len(self.data)):
+            number = parse(value)
+            if number is None:
+                overrides[idx] = value
+                append(0)
+            else:
+                append(number)
+        self._appended_overrides(count)
+        self._check_overrides()
+
+    def extend_blank(self, count: int):
+        """Append count blank cells"""
+        if self.kind == 'text':
+            # Empty cells: the end offset just repeats
+            end = self.data[-1] if self.data else 0
+            self.data.extend(array('q', [end]) * count)
+            return
+
+        start = len(self.data)
+        self.data.extend(array(self.data.typecode, bytes(self.data.itemsize * count)))
+        if self.kind != 'str':
+            before = len(self.overrides)
+            self.overrides.update(dict.fromkeys(range(start, start + count), ''))
+            self._appended_overrides(before)
+            self._check_overrides()
+
+    def slice(self, start: int, stop: int) -> List[str]:
+        """Cell values for rows [start, stop)"""
+        chunk = self.data[start:stop]
+        if self.kind == 'str':
+            pool = self.pool
+            return [pool[code] for code in chunk]
+
+        if self.kind == 'text':
+            blob = self.blob
+            begins = chain([self.data[start - 1] if start else 0], chunk[:-1])
+            values = [blob[begin:end].decode() for begin, end in zip(begins, chunk)]
+        else:
+            values = list(map(_FORMATTERS[self.kind], chunk))
+        if self.overrides:
+            rows = self._sorted_rows()
+            overrides = self.overrides
+            for idx in rows[bisect_left(rows, start):bisect_left(rows, stop)]:
+                values[idx - start] = overrides[idx]
+        return values
+
+    def values(self) -> List[str]:
+        return self.slice(0, len(self.data))
+
+    def nbytes(self) -> int:
+        """Approximate memory footprint, for memory accounting"""
+        size = len(self.data) * self.data.itemsize + len(self.blob) + self.pool_bytes
+        size += len(self.overrides) * OBJECT_OVERHEAD
+        return size
+
+    def _code(self, value: str) -> int:
+        code = self.lookup.get(value)
+        if code is None:
+            code = len(self.pool)
+            self.pool.append(value)
+            self.lookup[value] = code
+            self.pool_bytes += len(value) + OBJECT_OVERHEAD
+        return code
+
+    def _indexed_rows(self) -> Optional[List[int]]:
+        # Columns pickled before the index existed have no override_rows
+        return getattr(self, 'override_rows', None)
+
+    def _sorted_rows(self) -> List[int]:
+        """Keys of overrides in order, indexing them on first use"""
+        rows = self._indexed_rows()
+        if rows is None:
+            rows = self.override_rows = sorted(self.overrides)
+        return rows
+
+    def _appended_overrides(self, count: int):
+        """Index the overrides added after the first count, all past every row already there"""
+        rows = self._indexed_rows()
+        added = len(self.overrides) - count
+        if rows is not None and added:
+            rows.extend(reversed(list(islice(reversed(self.overrides), added))))
+
+    def _check_overrides(self):
+        """Re-encode the column once too many cells live in overrides"""
+        if len(self.overrides) <= max(MIN_OVERRIDES, len(self.data) * MAX_OVERRIDE_RATIO):
+            return
+
+        values = self.values()
+        if self.kind == 'text':
+            packed = self._packed(values)
+            self.data, self.blob, self.overrides, self.override_rows = packed.data, packed.blob, {}, None
+            return
+
+        self.kind = 'str'
+        self.overrides, self.override_rows = {}, None
+        self.data = array('I', map(self._code, values))
+
+
+class ColumnarSheet:
+    """A rectangular sheet stored column by column"""
+
+    __slots__ = ('name', 'n_rows', 'columns', 'dirty', 'edits', 'logged')
+
+    def __init__(self, name: str, n_rows: int = 0, columns: Optional[List[Column]] = None):
+        self.name = name
+        self.n_rows = n_rows
+        self.columns = columns or []
+        # Changes since the last save to a shared backend: column indices to
+        # write whole (None when every column has to be written), and cell
+        # writes (row, col, value) to other columns, saved as an edit log
+        self.dirty: Optional[Set[int]] = None
+        self.edits: List[Tuple[int, int, str]] = []
+        # Edits the backend holds in each column's log, on top of its last
+        # whole write
+        self.logged: Dict[int, int] = {}
+
+    @classmethod
+    def from_rows(cls, name: str, rows: List[List[str]]) -> 'ColumnarSheet':
+        """Build a sheet from row lists; short rows are padded with blanks"""
+        width = max((len(row) for row in rows), default=0)
+        columns = [
+            Column.from_values([row[col] if col < len(row) else '' for row in rows])
+            for col in range(width)
+        ]
+        return cls(name, len(rows), columns)
+
+    @classmethod
+    def from_row_stream(cls, name: str, rows: Iterable[List[str]]) -> 'ColumnarSheet':
+        """Build a sheet from a row iterator, holding ROW_BLOCK_SIZE rows at a time"""
+        sheet = cls(name)
+        block = []
+        for row in rows:
+            block.append(row)
+            if len(block) == ROW_BLOCK_SIZE:
+                sheet.append_rows(block)
+                block = []
+        sheet.append_rows(block)
+        return sheet
+
+    @classmethod
+    def from_model(cls, sheet: Sheet) -> 'ColumnarSheet':
+        return cls.from_rows(sheet.name, sheet.rows)
+
+    @property
+    def n_cols(self) -> int:
+        return len(self.columns)
+
+    def get(self, row: int, col: int) -> str:
+        return self.columns[col].get(row)
+
+    def set(self, row: int, col: int, value: str):
+        self.columns[col].set(row, value)
+        if self.dirty is not None and col not in self.dirty:
+            self.edits.append((row, col, value))
+
+    def ensure_shape(self, n_rows: int, n_cols: int) -> Tuple[int, int]:
+        """
+        Grow the sheet with blank cells to at least n_rows x n_cols
+        Returns how many rows and columns were added. Nothing needs saving
+        for it: a shared backend pads columns out to the sheet's shape on load
+        """
+        added_rows = max(0, n_rows - self.n_rows)
+        added_cols = max(0, n_cols - self.n_cols)
+
+        if added_rows:
+            for column in self.columns:
+                column.extend_blank(added_rows)
+            self.n_rows = n_rows
+
+        for _ in range(added_cols):
+            column = Column('str')
+            column.extend_blank(self.n_rows)
+            self.columns.append(column)
+
+        return added_rows, added_cols
+
+    def append_rows(self, rows: List[List[str]]):
+        """Append rows below the sheet; ragged rows are padded with blanks"""
+        if not rows:
+            return
+        width = max(self.n_cols, max(map(len, rows)))
+        if self.dirty is not None:
+            # Saved like cell writes to blank rows, blanks need no entry
+            self.edits.extend(
+                (row_idx, col, value)
+                for row_idx, row in enumerate(rows, self.n_rows)
+                for col, value in enumerate(row) if value and col not in self.dirty
+            )
+        for col in range(width):
+            values = [row[col] if col < len(row) else '' for row in rows]
+            if col < self.n_cols:
+                self.columns[col].extend(values)
+            elif not self.n_rows:
+                # The first block picks each column's encoding
+                self.columns.append(Column.from_values(values))
+            else:
+                column = Column('str')
+                column.extend_blank(self.n_rows)
+                column.extend(values)
+                self.columns.append(column)
+        self.n_rows += len(rows)
+
+    def iter_rows(self, start: int = 0, stop: Optional[int] = None) -> Iterator[List[str]]:
+        """Yield rows as lists, materializing ROW_BLOCK_SIZE rows at a time"""
+        stop = self.n_rows if stop is None else min(stop, self.n_rows)
+        for block_start in range(start, stop, ROW_BLOCK_SIZE):
+            block_stop = min(block_start + ROW_BLOCK_SIZE, stop)
+            if not self.columns:
+                yield from ([] for _ in range(block_start, block_stop))
+                continue
+            block = [column.slice(block_start, block_stop) for column in self.columns]
+            yield from map(list, zip(*block))
+
+    def rows(self) -> List[List[str]]:
+        return list(self.iter_rows())
+
+    def read_range(self, start: int, stop: int, col_start: int = 0, col_stop: Optional[int] = None) -> List[List[str]]:
+        """Rows [start, stop) cut to columns [col_start, col_stop), clipped to the sheet"""
+        stop = min(stop, self.n_rows)
+        if start >= stop:
+            return []
+        columns = self.columns[col_start:col_stop]
+        if not columns:
+            return [[] for _ in range(start, stop)]
+        return list(map(list, zip(*(column.slice(start, stop) for column in columns))))
+
+    def same_content(self, other: 'ColumnarSheet') -> bool:
+        return (
+            self.name == other.name
+            and self.n_rows == other.n_rows
+            and self.n_cols == other.n_cols
+            and all(a.values() == b.values() for a, b in zip(self.columns, other.columns))
+        )
+
+    def nbytes(self) -> int:
+        return sum(column.nbytes() for column in self.columns)
+
+    def to_model(self) -> Sheet:
+        # Cells are already plain strings, skip pydantic validation
+        return Sheet.model_construct(name=self.name, rows=self.rows())
+
+
+class StoredWorkbook:
+    """Server-side workbook record: columnar sheets plus metadata"""
+
+    __slots__ = ('id', 'version', 'active_sheet', 'sheets', 'charts')
+
+    def __init__(self, workbook_id: str, sheets: List[ColumnarSheet], active_sheet: int = 0, version: int = 0):
+        self.id = workbook_id
+        self.version = version
+        self.active_sheet = active_sheet
+        self.sheets = sheets
+        self.charts: List[dict] = []  # Chart configs included in exports
+
+    @classmethod
+    def from_model(cls, workbook_id: str, workbook: WorkbookModel) -> 'StoredWorkbook':
+        sheets = [ColumnarSheet.from_model(sheet) for sheet in workbook.sheets]
+        return cls(workbook_id, sheets, workbook.active_sheet, workbook.version)
+
+    def nbytes(self) -> int:
+        return sum(sheet.nbytes() for sheet in self.sheets)
+
+    def to_model(self) -> WorkbookModel:
+        return WorkbookModel.model_construct(
+            id=self.id,
+            sheets=[sheet.to_model() for sheet in self.sheets],
+            active_sheet=self.active_sheet,
+            version=self.version,
+        )
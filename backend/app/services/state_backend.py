@@ -0,0 +1,401 @@
+"""
+Shared state backends
+
+By default all state lives in the worker process. A shared backend keeps
+workbooks and small agent values in a SQLite file or a Redis-protocol
+server instead, so several uvicorn workers can serve the same workbook.
+Workbooks are stored as a small JSON meta record (version, charts, sheet
+shapes) plus one pickled blob per column. Cell writes are not saved by
+rewriting their column: each save appends them to the column's edit log,
+and loading replays the log over the column's blob. Once a log grows past
+a share of the column's rows, the column is written whole and its log
+dropped, so a single-cell edit costs O(1) to save, amortized. Columns
+shorter than their sheet, or missing, are padded with blank cells on load,
+so growing a sheet with blanks writes nothing. Workers validate their
+cached copy with a single version lookup before using it.
+"""
+import fcntl
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+from app.services.sheet_store import Column, ColumnarSheet, StoredWorkbook
+from app.config import STATE_BACKEND_URL, SHARED_STATE_TTL_SECONDS
+
+# Redis locks expire after this long in case a worker dies while holding one
+LOCK_TIMEOUT_SECONDS = 30
+
+# A column is written whole, dropping its edit log, once the log would
+# hold more edits than this, or than this share of the column's rows
+EDIT_LOG_MIN_EDITS = 256
+EDIT_LOG_MAX_RATIO = 1 / 16
+
+# Column blobs and edit log batches by (sheet, col); a column's batches
+# by the workbook version that saved them
+ColumnBlobs = Dict[Tuple[int, int], bytes]
+EditBatches = Dict[Tuple[int, int], List[Tuple[int, bytes]]]
+
+
+def _log_limit(n_rows: int) -> int:
+    return max(EDIT_LOG_MIN_EDITS, int(n_rows * EDIT_LOG_MAX_RATIO))
+
+
+def dump_workbook(workbook: StoredWorkbook) -> Tuple[str, ColumnBlobs, ColumnBlobs]:
+    """
+    Split a workbook's changes since its last save into its meta record,
+    the blobs of columns to write whole (their edit logs are dropped) and
+    one edit log batch for each other column with cell writes
+    """
+    meta = json.dumps({
+        'id': workbook.id,
+        'version': workbook.version,
+        'active_sheet': workbook.active_sheet,
+        'charts': workbook.charts,
+        'sheets': [
+            {'name': sheet.name, 'n_rows': sheet.n_rows, 'n_cols': sheet.n_cols}
+            for sheet in workbook.sheets
+        ],
+    }, ensure_ascii=False)
+
+    columns = {}
+    edits = {}
+    for sheet_idx, sheet in enumerate(workbook.sheets):
+        whole = set(range(sheet.n_cols)) if sheet.dirty is None else set(sheet.dirty)
+        by_col = defaultdict(list)
+        if sheet.dirty is not None:
+            for row, col, value in sheet.edits:
+                by_col[col].append((row, value))
+
+        limit = _log_limit(sheet.n_rows)
+        for col, cell_edits in by_col.items():
+            if sheet.logged.get(col, 0) + len(cell_edits) > limit:
+                whole.add(col)
+            else:
+                edits[(sheet_idx, col)] = pickle.dumps(cell_edits, protocol=pickle.HIGHEST_PROTOCOL)
+        for col in whole:
+            columns[(sheet_idx, col)] = pickle.dumps(sheet.columns[col], protocol=pickle.HIGHEST_PROTOCOL)
+    return meta, columns, edits
+
+
+def load_workbook(meta: str, columns: ColumnBlobs, edits: EditBatches) -> StoredWorkbook:
+    """Rebuild a workbook from its meta record, column blobs and edit logs"""
+    data = json.loads(meta)
+    sheets = []
+    for sheet_idx, sheet in enumerate(data['sheets']):
+        n_rows = sheet['n_rows']
+        sheet_columns = []
+        logged = {}
+        for col in range(sheet['n_cols']):
+            blob = columns.get((sheet_idx, col))
+            column = pickle.loads(blob) if blob is not None else Column('str')
+            if len(column) < n_rows:
+                column.extend_blank(n_rows - len(column))
+            for _, batch in sorted(edits.get((sheet_idx, col), ())):
+                cell_edits = pickle.loads(batch)
+                for row, value in cell_edits:
+                    column.set(row, value)
+                logged[col] = logged.get(col, 0) + len(cell_edits)
+            sheet_columns.append(column)
+
+        loaded = ColumnarSheet(sheet['name'], n_rows, sheet_columns)
+        loaded.dirty = set()
+        loaded.logged = logged
+        sheets.append(loaded)
+
+    workbook = StoredWorkbook(data['id'], sheets, data['active_sheet'], data['version'])
+    workbook.charts = data['charts']
+    return workbook
+
+
+def mark_clean(workbook: StoredWorkbook, columns: ColumnBlobs):
+    """After saving dump_workbook's output: nothing is pending, edit log sizes are as written"""
+    for sheet_idx, sheet in enumerate(workbook.sheets):
+        if sheet.dirty is None:
+            sheet.logged = {}
+        else:
+            for row, col, value in sheet.edits:
+                if (sheet_idx, col) not in columns:
+                    sheet.logged[col] = sheet.logged.get(col, 0) + 1
+            for _, col in [key for key in columns if key[0] == sheet_idx]:
+                sheet.logged.pop(col, None)
+        sheet.dirty = set()
+        sheet.edits = []
+
+
+class MemoryStateBackend:
+    """Process-local state, the default for a single worker"""
+
+    shared = False
+
+    def __init__(self):
+        self._values = {}
+
+    def get_value(self, key: str) -> Optional[str]:
+        return self._values.get(key)
+
+    def set_value(self, key: str, value: Optional[str]):
+        self._values[key] = value
+
+
+class SqliteStateBackend:
+    """
+    State shared by all workers on one host through a SQLite file
+    Writers to the same workbook are serialized with flock on a lock file
+    """
+
+    shared = True
+
+    def __init__(self, path: str, ttl_seconds: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(
+            'CREATE TABLE IF NOT EXISTS workbooks '
+            '(id TEXT PRIMARY KEY, version INTEGER NOT NULL, meta TEXT NOT NULL, updated_at REAL NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS columns '
+            '(workbook_id TEXT NOT NULL, sheet INTEGER NOT NULL, col INTEGER NOT NULL, data BLOB NOT NULL, '
+            'PRIMARY KEY (workbook_id, sheet, col));'
+            'CREATE TABLE IF NOT EXISTS edits '
+            '(workbook_id TEXT NOT NULL, sheet INTEGER NOT NULL, col INTEGER NOT NULL, version INTEGER NOT NULL, '
+            'data BLOB NOT NULL, PRIMARY KEY (workbook_id, sheet, col, version));'
+            'CREATE INDEX IF NOT EXISTS workbooks_updated_at ON workbooks (updated_at);'
+            'CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT);'
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread, the sqlite3 module does not share them
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get_value(self, key: str) -> Optional[str]:
+        row = self._conn().execute('SELECT value FROM kv WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_value(self, key: str, value: Optional[str]):
+        with self._conn() as conn:
+            conn.execute('INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)', (key, value))
+
+    def workbook_version(self, workbook_id: str) -> Optional[int]:
+        row = self._conn().execute('SELECT version FROM workbooks WHERE id = ?', (workbook_id,)).fetchone()
+        return row[0] if row else None
+
+    def load_workbook(self, workbook_id: str) -> Optional[StoredWorkbook]:
+        conn = self._conn()
+        row = conn.execute('SELECT meta FROM workbooks WHERE id = ?', (workbook_id,)).fetchone()
+        if row is None:
+            return None
+        columns = {
+            (sheet, col): data
+            for sheet, col, data in conn.execute(
+                'SELECT sheet, col, data FROM columns WHERE workbook_id = ?', (workbook_id,)
+            )
+        }
+        edits = defaultdict(list)
+        for sheet, col, version, data in conn.execute(
+            'SELECT sheet, col, version, data FROM edits WHERE workbook_id = ?', (workbook_id,)
+        ):
+            edits[(sheet, col)].append((version, data))
+        return load_workbook(row[0], columns, edits)
+
+    def save_workbook(self, workbook: StoredWorkbook):
+        meta, columns, edits = dump_workbook(workbook)
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO workbooks (id, version, meta, updated_at) VALUES (?, ?, ?, ?)',
+                (workbook.id, workbook.version, meta, now),
+            )
+            # Drop columns and logs of sheets or columns that no longer exist
+            for table in ('columns', 'edits'):
+                conn.execute(
+                    f'DELETE FROM {table} WHERE workbook_id = ? AND sheet >= ?', (workbook.id, len(workbook.sheets))
+                )
+                for sheet_idx, sheet in enumerate(workbook.sheets):
+                    conn.execute(
+                        f'DELETE FROM {table} WHERE workbook_id = ? AND sheet = ? AND col >= ?',
+                        (workbook.id, sheet_idx, sheet.n_cols),
+                    )
+            # A column written whole already holds every edit of its log
+            conn.executemany(
+                'DELETE FROM edits WHERE workbook_id = ? AND sheet = ? AND col = ?',
+                [(workbook.id, sheet, col) for sheet, col in columns],
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO columns (workbook_id, sheet, col, data) VALUES (?, ?, ?, ?)',
+                [(workbook.id, sheet, col, data) for (sheet, col), data in columns.items()],
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO edits (workbook_id, sheet, col, version, data) VALUES (?, ?, ?, ?, ?)',
+                [(workbook.id, sheet, col, workbook.version, data) for (sheet, col), data in edits.items()],
+            )
+            self._expire(conn, now)
+        mark_clean(workbook, columns)
+
+    def delete_workbook(self, workbook_id: str):
+        with self._conn() as conn:
+            conn.execute('DELETE FROM workbooks WHERE id = ?', (workbook_id,))
+            conn.execute('DELETE FROM columns WHERE workbook_id = ?', (workbook_id,))
+            conn.execute('DELETE FROM edits WHERE workbook_id = ?', (workbook_id,))
+
+    @contextmanager
+    def lock(self, workbook_id: str) -> Iterator[None]:
+        # Lock files are striped so their number stays bounded
+        stripe = zlib.crc32(workbook_id.encode()) % 256
+        with open(f'{self.path}.lock.{stripe}', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _expire(self, conn: sqlite3.Connection, now: float):
+        expired = [row[0] for row in conn.execute(
+            'SELECT id FROM workbooks WHERE updated_at < ?', (now - self.ttl_seconds,)
+        )]
+        for workbook_id in expired:
+            conn.execute('DELETE FROM workbooks WHERE id = ?', (workbook_id,))
+            conn.execute('DELETE FROM columns WHERE workbook_id = ?', (workbook_id,))
+            conn.execute('DELETE FROM edits WHERE workbook_id = ?', (workbook_id,))
+
+
+class RedisStateBackend:
+    """
+    State shared through any Redis-protocol server (Redis, Valkey, KeyDB...)
+    Needs the optional redis package
+    """
+
+    shared = True
+
+    def __init__(self, url: str, ttl_seconds: int):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('The redis package is required for a redis:// state backend: pip install redis')
+
+        self.ttl_seconds = ttl_seconds
+        self._client = redis.Redis.from_url(url)
+
+    @staticmethod
+    def _meta_key(workbook_id: str) -> str:
+        return f'web-excel:workbook:{workbook_id}:meta'
+
+    @staticmethod
+    def _columns_key(workbook_id: str) -> str:
+        return f'web-excel:workbook:{workbook_id}:columns'
+
+    @staticmethod
+    def _edits_key(workbook_id: str) -> str:
+        return f'web-excel:workbook:{workbook_id}:edits'
+
+    def get_value(self, key: str) -> Optional[str]:
+        value = self._client.get(f'web-excel:kv:{key}')
+        return value.decode() if value is not None else None
+
+    def set_value(self, key: str, value: Optional[str]):
+        if value is None:
+            self._client.delete(f'web-excel:kv:{key}')
+        else:
+            self._client.set(f'web-excel:kv:{key}', value)
+
+    def workbook_version(self, workbook_id: str) -> Optional[int]:
+        version = self._client.hget(self._meta_key(workbook_id), 'version')
+        return int(version) if version is not None else None
+
+    def load_workbook(self, workbook_id: str) -> Optional[StoredWorkbook]:
+        pipe = self._client.pipeline(transaction=True)
+        pipe.hget(self._meta_key(workbook_id), 'meta')
+        pipe.hgetall(self._columns_key(workbook_id))
+        pipe.hgetall(self._edits_key(workbook_id))
+        meta, blobs, batches = pipe.execute()
+        if meta is None:
+            return None
+        columns = {}
+        for field, data in blobs.items():
+            sheet, col = field.decode().split(':')
+            columns[(int(sheet), int(col))] = data
+        edits = defaultdict(list)
+        for field, data in batches.items():
+            sheet, col, version = map(int, field.decode().split(':'))
+            edits[(sheet, col)].append((version, data))
+        return load_workbook(meta.decode(), columns, edits)
+
+    def save_workbook(self, workbook: StoredWorkbook):
+        meta, columns, edits = dump_workbook(workbook)
+        meta_key = self._meta_key(workbook.id)
+        columns_key = self._columns_key(workbook.id)
+        edits_key = self._edits_key(workbook.id)
+
+        # Fields of sheets or columns that no longer exist
+        stale = []
+        for field in self._client.hkeys(columns_key):
+            sheet, col = map(int, field.decode().split(':'))
+            if sheet >= len(workbook.sheets) or col >= workbook.sheets[sheet].n_cols:
+                stale.append(field)
+        # Log batches of those, and of columns written whole now
+        stale_edits = []
+        if columns or stale:
+            for field in self._client.hkeys(edits_key):
+                sheet, col, _ = map(int, field.decode().split(':'))
+                if (sheet, col) in columns or sheet >= len(workbook.sheets) or col >= workbook.sheets[sheet].n_cols:
+                    stale_edits.append(field)
+
+        pipe = self._client.pipeline(transaction=True)
+        pipe.hset(meta_key, mapping={'version': workbook.version, 'meta': meta})
+        if stale:
+            pipe.hdel(columns_key, *stale)
+        if stale_edits:
+            pipe.hdel(edits_key, *stale_edits)
+        if columns:
+            pipe.hset(columns_key, mapping={f'{sheet}:{col}': data for (sheet, col), data in columns.items()})
+        if edits:
+            pipe.hset(edits_key, mapping={
+                f'{sheet}:{col}:{workbook.version}': data for (sheet, col), data in edits.items()
+            })
+        for key in (meta_key, columns_key, edits_key):
+            pipe.expire(key, self.ttl_seconds)
+        pipe.execute()
+        mark_clean(workbook, columns)
+
+    def delete_workbook(self, workbook_id: str):
+        self._client.delete(self._meta_key(workbook_id), self._columns_key(workbook_id), self._edits_key(workbook_id))
+
+    @contextmanager
+    def lock(self, workbook_id: str) -> Iterator[None]:
+        with self._client.lock(f'web-excel:lock:{workbook_id}', timeout=LOCK_TIMEOUT_SECONDS):
+            yield
+
+
+def create_state_backend(url: str, ttl_seconds: int):
+    """
+    Build the backend named by url:
+    memory://, sqlite:///path/to/state.sqlite3 or redis://host:port/db
+    """
+    parsed = urlparse(url)
+    if parsed.scheme in ('', 'memory'):
+        return MemoryStateBackend()
+    if parsed.scheme == 'sqlite':
+        return SqliteStateBackend(parsed.path, ttl_seconds)
+    if parsed.scheme in ('redis', 'rediss', 'unix'):
+        return RedisStateBackend(url, ttl_seconds)
+    raise ValueError(f"Unsupported state backend: {url}")
+
+
+# Global instance
+state_backend = create_state_backend(STATE_BACKEND_URL, SHARED_STATE_TTL_SECONDS)
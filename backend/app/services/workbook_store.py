@@ -0,0 +1,272 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from app.services.sheet_store import StoredWorkbook
+
+# Writers to the same workbook share one of this many locks
+LOCK_STRIPES = 64
+
+
+class SqliteSpill:
+    """On-disk store for workbooks evicted from memory"""
+
+    def __init__(self, path: str, ttl_seconds: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS workbooks '
+            '(id TEXT PRIMARY KEY, data BLOB NOT NULL, spilled_at REAL NOT NULL)'
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def save(self, workbook: StoredWorkbook):
+        data = pickle.dumps(workbook, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            now = time.time()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO workbooks (id, data, spilled_at) VALUES (?, ?, ?)',
+                (workbook.id, data, now),
+            )
+            self._conn.execute('DELETE FROM workbooks WHERE spilled_at < ?', (now - self.ttl_seconds,))
+            self._conn.commit()
+
+    def load(self, workbook_id: str) -> Optional[StoredWorkbook]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data, spilled_at FROM workbooks WHERE id = ?', (workbook_id,)
+            ).fetchone()
+        if row is None or row[1] < time.time() - self.ttl_seconds:
+            return None
+        return pickle.loads(row[0])
+
+    def delete(self, workbook_id: str):
+        with self._lock:
+            self._conn.execute('DELETE FROM workbooks WHERE id = ?', (workbook_id,))
+            self._conn.commit()
+
+
+class WorkbookStore:
+    """
+    In-memory workbook store bounded by a memory budget
+    Least recently used workbooks are evicted once the budget is exceeded,
+    and any workbook idle for longer than ttl_seconds is evicted too.
+    With a spill store, evicted workbooks are written to disk and reloaded
+    transparently by get(); without one they are dropped. A workbook is
+    only spilled while holding its write lock, so one being changed stays put
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: int, spill: Optional[SqliteSpill] = None):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.spill = spill
+        # workbook_id -> (workbook, size, last access), oldest first
+        self._entries: 'OrderedDict[str, list]' = OrderedDict()
+        self._size = 0
+        self._spilled = set()
+        # Workbooks being saved to the spill store, and their bytes
+        self._evicting = set()
+        self._evicting_bytes = 0
+        self._lock = threading.RLock()
+        self._write_locks = [threading.RLock() for _ in range(LOCK_STRIPES)]
+        self.evictions = 0
+        self.reloads = 0
+
+    def lock(self, workbook_id: str) -> threading.RLock:
+        """Lock to hold while reading, changing and putting back a workbook"""
+        return self._write_locks[zlib.crc32(workbook_id.encode()) % LOCK_STRIPES]
+
+    def get(self, workbook_id: str) -> Optional[StoredWorkbook]:
+        """Get a workbook, reloading it from the spill store if it was evicted"""
+        with self._lock:
+            victims = self._expire(keep=workbook_id)
+            entry = self._entries.get(workbook_id)
+            if entry is not None:
+                entry[2] = time.monotonic()
+                self._entries.move_to_end(workbook_id)
+                workbook = entry[0]
+            elif self.spill is None or workbook_id not in self._spilled:
+                workbook = None
+            else:
+                workbook = self.spill.load(workbook_id)
+                if workbook is None:
+                    self._spilled.discard(workbook_id)
+                else:
+                    self.reloads += 1
+                    victims += self._put(workbook)
+        self._spill_out(victims)
+        return workbook
+
+    def put(self, workbook: StoredWorkbook):
+        """Insert or refresh a workbook, e.g. after it changed size"""
+        with self._lock:
+            victims = self._put(workbook)
+        self._spill_out(victims)
+
+    def _put(self, workbook: StoredWorkbook) -> List[tuple]:
+        old = self._entries.pop(workbook.id, None)
+        if old is not None:
+            self._size -= old[1]
+
+        size = workbook.nbytes()
+        self._entries[workbook.id] = [workbook, size, time.monotonic()]
+        self._size += size
+
+        # A memory copy supersedes anything spilled earlier
+        if workbook.id in self._spilled:
+            self._spilled.discard(workbook.id)
+            self.spill.delete(workbook.id)
+
+        # Never evict the workbook that is being worked on
+        return self._take_victims(
+            lambda entry: self._size - self._evicting_bytes > self.max_bytes, keep=workbook.id
+        )
+
+    def delete(self, workbook_id: str):
+        with self._lock:
+            entry = self._entries.pop(workbook_id, None)
+            if entry is not None:
+                self._size -= entry[1]
+            if workbook_id in self._spilled:
+                self._spilled.discard(workbook_id)
+                self.spill.delete(workbook_id)
+
+    def __contains__(self, workbook_id: str) -> bool:
+        with self._lock:
+            return workbook_id in self._entries or workbook_id in self._spilled
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'in_memory': len(self._entries),
+                'spilled': len(self._spilled),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'reloads': self.reloads,
+            }
+
+    def _expire(self, keep: str) -> List[tuple]:
+        deadline = time.monotonic() - self.ttl_seconds
+        return self._take_victims(lambda entry: entry[2] < deadline, keep)
+
+    def _take_victims(self, wanted, keep: Optional[str] = None) -> List[tuple]:
+        """
+        Evict least recently used workbooks for as long as wanted(entry) holds;
+        call with the store lock held. Without a spill store they are dropped
+        here. Otherwise they are returned with their write lock taken, for
+        _spill_out() to save once the store lock is released; a workbook whose
+        write lock another thread holds is in use and is skipped
+        """
+        victims = []
+        for workbook_id, entry in list(self._entries.items()):
+            if not wanted(entry):
+                break
+            if workbook_id == keep or workbook_id in self._evicting:
+                continue
+            if self.spill is None:
+                self._drop(workbook_id)
+                self.evictions += 1
+                continue
+            lock = self.lock(workbook_id)
+            if not lock.acquire(blocking=False):
+                continue
+            self._evicting.add(workbook_id)
+            self._evicting_bytes += entry[1]
+            victims.append((workbook_id, entry[0], entry[1], lock))
+        return victims
+
+    def _spill_out(self, victims: List[tuple]):
+        """Save evicted workbooks to the spill store, then drop them from memory"""
+        error = None
+        for workbook_id, workbook, size, lock in victims:
+            try:
+                self.spill.save(workbook)
+                saved = True
+            except Exception as exc:
+                # Keep it in memory; the next eviction retries
+                error = error or exc
+                saved = False
+            with self._lock:
+                self._evicting.discard(workbook_id)
+                self._evicting_bytes -= size
+                entry = self._entries.get(workbook_id)
+                if entry is not None and entry[0] is workbook:
+                    if saved:
+                        self._drop(workbook_id)
+                        self._spilled.add(workbook_id)
+                        self.evictions += 1
+                elif saved:
+                    # Deleted or replaced while it was being saved
+                    self.spill.delete(workbook_id)
+            lock.release()
+        if error is not None:
+            raise error
+
+    def _drop(self, workbook_id: str):
+        _, size, _ = self._entries.pop(workbook_id)
+        self._size -= size
+
+
+class SharedWorkbookStore:
+    """
+    Workbook store backed by a shared state backend
+    The backend holds the authoritative copy; each process keeps recently
+    used workbooks in a local WorkbookStore and reuses them for as long as
+    their version matches the backend's
+    """
+
+    def __init__(self, backend, cache: WorkbookStore):
+        self.backend = backend
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, workbook_id: str) -> Optional[StoredWorkbook]:
+        version = self.backend.workbook_version(workbook_id)
+        if version is None:
+            self.cache.delete(workbook_id)
+            return None
+
+        cached = self.cache.get(workbook_id)
+        if cached is not None and cached.version == version:
+            self.hits += 1
+            return cached
+
+        # Another worker changed it (or it is not cached here yet)
+        self.misses += 1
+        workbook = self.backend.load_workbook(workbook_id)
+        if workbook is None:
+            return None
+        self.cache.put(workbook)
+        return workbook
+
+    def put(self, workbook: StoredWorkbook):
+        self.backend.save_workbook(workbook)
+        self.cache.put(workbook)
+
+    def delete(self, workbook_id: str):
+        self.backend.delete_workbook(workbook_id)
+        self.cache.delete(workbook_id)
+
+    def __contains__(self, workbook_id: str) -> bool:
+        return self.backend.workbook_version(workbook_id) is not None
+
+    @contextmanager
+    def lock(self, workbook_id: str) -> Iterator[None]:
+        """Hold across processes while reading, changing and putting back a workbook"""
+        with self.cache.lock(workbook_id), self.backend.lock(workbook_id):
+            yield
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.cache.stats(), 'hits': self.hits, 'misses': self.misses}
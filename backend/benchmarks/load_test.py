@@ -0,0 +1,136 @@
+"""
+Event loop responsiveness under load
+
+Probes /health at a fixed interval on an idle server, then again while
+table scrapes, chat scrapes and a large export all run at once, and
+prints the probe latencies. Scrapes target a local upstream, started
+here, that waits before answering with a large table and forbids
+caching, so every scrape really downloads and parses the page.
+
+Start the backend first, then run from the backend directory:
+    uvicorn app.main:app --port 8000
+    python benchmarks/load_test.py --base-url http://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import io
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+import httpx
+
+
+def start_upstream(delay: float, rows: int) -> ThreadingHTTPServer:
+    """A local page server answering every request after delay seconds with a rows-row table"""
+    body = ('<html><body><table><tr><th>id</th><th>name</th><th>value</th></tr>' + ''.join(
+        f'<tr><td>{idx}</td><td>item {idx}</td><td>{idx * 7 % 1000}</td></tr>' for idx in range(rows)
+    ) + '</table></body></html>').encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Cache-Control', 'no-store')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def workbook_csv(rows: int, cols: int) -> bytes:
+    out = io.StringIO()
+    out.write(','.join(f'col{col}' for col in range(cols)) + '\n')
+    for row in range(rows):
+        out.write(','.join(str(row * cols + col) for col in range(cols)) + '\n')
+    return out.getvalue().encode()
+
+
+async def probe(client: httpx.AsyncClient, interval: float, stop: asyncio.Event) -> List[float]:
+    """Latencies of /health requests sent every interval seconds until stop is set"""
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get('/health')
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+def summary(latencies: List[float]) -> str:
+    ms = sorted(latency * 1000 for latency in latencies)
+    p99 = ms[min(len(ms) - 1, int(len(ms) * 0.99))]
+    return f'n={len(ms):5d}  p50 {statistics.median(ms):7.1f}ms  p99 {p99:7.1f}ms  max {ms[-1]:8.1f}ms'
+
+
+async def run(args):
+    upstream = start_upstream(args.delay, args.rows)
+    page = f'http://127.0.0.1:{upstream.server_port}/table'
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=None) as client:
+        response = await client.post(
+            '/api/excel/import',
+            files={'file': ('load.csv', workbook_csv(args.export_rows, args.export_cols), 'text/csv')},
+        )
+        response.raise_for_status()
+        workbook_id = response.json()['id']
+
+        stop = asyncio.Event()
+        idle = asyncio.create_task(probe(client, args.interval, stop))
+        await asyncio.sleep(args.idle_seconds)
+        stop.set()
+        print('idle    ', summary(await idle))
+
+        async def export():
+            async with client.stream('GET', f'/api/excel/export/{workbook_id}') as response:
+                response.raise_for_status()
+                async for _ in response.aiter_bytes():
+                    pass
+
+        load = [
+            *(client.post('/api/scrape/table', json={'url': f'{page}?scrape={idx}'}) for idx in range(args.scrapes)),
+            *(client.post('/api/chat', json={'message': f'帮我抓取 {page}?chat={idx} 的表格数据'})
+              for idx in range(args.chat_scrapes)),
+            export(),
+        ]
+        stop = asyncio.Event()
+        loaded = asyncio.create_task(probe(client, args.interval, stop))
+        start = time.perf_counter()
+        results = await asyncio.gather(*load, return_exceptions=True)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        print('loaded  ', summary(await loaded))
+        print(f'load batch took {elapsed:.1f}s')
+
+        failed = [result for result in results if isinstance(result, Exception)
+                  or (isinstance(result, httpx.Response) and result.is_error)]
+        if failed:
+            print(f'{len(failed)} of {len(results)} requests failed: {failed}')
+
+    upstream.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--interval', type=float, default=0.02, help='seconds between /health probes')
+    parser.add_argument('--idle-seconds', type=float, default=5.0)
+    parser.add_argument('--delay', type=float, default=5.0, help='seconds the upstream waits per request')
+    parser.add_argument('--rows', type=int, default=20_000, help='rows of the scraped table')
+    parser.add_argument('--scrapes', type=int, default=4)
+    parser.add_argument('--chat-scrapes', type=int, default=2)
+    parser.add_argument('--export-rows', type=int, default=60_000)
+    parser.add_argument('--export-cols', type=int, default=8)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+HTML parsing: lxml path against the html.parser fallback
+
+Builds Wikipedia-like fixture pages (linked cells, footnote markers,
+inline scripts and styles, a navigation list) of a few sizes, checks that
+both engines extract identical tables and lists from them, and times each
+engine in a fresh process. Peak is the growth of the process's peak
+resident size during the parse.
+
+Run from the backend directory:
+    python benchmarks/parse_benchmark.py
+    python benchmarks/parse_benchmark.py --keep fixtures/   # also write the fixture pages
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# name: (tables, rows per table)
+FIXTURES = {
+    'small': (3, 200),
+    'large': (4, 5000),
+}
+
+ENGINES = ('lxml', 'html.parser')
+
+
+def fixture_page(n_tables: int, n_rows: int) -> bytes:
+    """A deterministic Wikipedia-like page"""
+    parts = [
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Fixture</title>',
+        '<style>.x { color: red }</style><script>var config = {"a": 1};</script></head><body>',
+        '<ul id="nav">' + ''.join(f'<li><a href="/page/{idx}">Page {idx}</a></li>' for idx in range(40)) + '</ul>',
+    ]
+    for table in range(n_tables):
+        parts.append(f'<h2>Section {table}</h2><p>Intro <b>text</b> for section {table}.</p>')
+        parts.append(f'<table class="wikitable" id="t{table}"><caption>Table {table}</caption>')
+        parts.append('<tr><th>Rank</th><th>Name</th><th>Country</th><th>Value</th><th>Share</th></tr>')
+        for row in range(n_rows):
+            parts.append(
+                f'<tr><td>{row + 1}</td>'
+                f'<td><a href="/wiki/Item_{row}" title="Item {row}">Item {row}</a>'
+                f'<sup class="reference"><a href="#cite-{row}">[{row % 9 + 1}]</a></sup></td>'
+                f'<td><span class="flag"></span> <a href="/wiki/C{row % 50}">Country {row % 50}</a></td>'
+                f'<td>{row * 37 % 100000:,}<script>track({row})</script></td>'
+                f'<td>{row % 100}.{row % 10}%</td></tr>'
+            )
+        parts.append('</table>')
+        parts.append('<ol class="references">' + ''.join(
+            f'<li id="cite-{idx}">Reference <i>{idx}</i></li>' for idx in range(20)
+        ) + '</ol>')
+    parts.append('</body></html>')
+    return ''.join(parts).encode()
+
+
+def parse(engine: str, content: bytes):
+    from app.services.scraper_service import _parse_document_lxml, _parse_document_soup
+    return (_parse_document_lxml if engine == 'lxml' else _parse_document_soup)(content)
+
+
+def peak_kb() -> int:
+    """
+    Peak resident size of this process: VmHWM where /proc has it, since
+    ru_maxrss keeps the parent's peak across fork and exec
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_one(engine: str, path: str):
+    """Parse one fixture in this (fresh) process and print time, rows and peak RSS growth as JSON"""
+    with open(path, 'rb') as f:
+        content = f.read()
+    # Import and warm up outside the measurement
+    parse(engine, b'<table><tr><td>x</td></tr></table>')
+    before = peak_kb()
+    start = time.perf_counter()
+    document = parse(engine, content)
+    elapsed = time.perf_counter() - start
+    peak = peak_kb() - before
+    rows = sum(len(table['rows']) for table in document.tables) + sum(len(lst['items']) for lst in document.lists)
+    print(json.dumps({'seconds': elapsed, 'rows': rows, 'peak_kb': peak}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--keep', help='directory to write the fixture pages to')
+    parser.add_argument('--run', nargs=2, metavar=('ENGINE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run_one(*args.run)
+        return
+
+    directory = args.keep or tempfile.mkdtemp(prefix='web-excel-parse-')
+    os.makedirs(directory, exist_ok=True)
+    print(f'{"fixture":22s} {"engine":12s} {"time":>9s} {"rows/s":>9s} {"peak":>8s}')
+    for name, (n_tables, n_rows) in FIXTURES.items():
+        content = fixture_page(n_tables, n_rows)
+        path = os.path.join(directory, f'{name}.html')
+        with open(path, 'wb') as f:
+            f.write(content)
+
+        lxml_doc, soup_doc = parse('lxml', content), parse('html.parser', content)
+        identical = lxml_doc.tables == soup_doc.tables and lxml_doc.lists == soup_doc.lists
+        label = f'{len(content) / 1024:,.0f}KB, {n_tables}x{n_rows}'
+        for engine in ENGINES:
+            out = subprocess.run([sys.executable, __file__, '--run', engine, path],
+                                 capture_output=True, text=True, check=True).stdout
+            result = json.loads(out)
+            print(f'{label:22s} {engine:12s} {result["seconds"] * 1000:7.0f}ms '
+                  f'{result["rows"] / result["seconds"]:9,.0f} {result["peak_kb"] / 1024:+7.0f}MB')
+            label = ''
+        print(f'{"":22s} identical output: {identical}')
+
+    if not args.keep:
+        for name in FIXTURES:
+            os.remove(os.path.join(directory, f'{name}.html'))
+        os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
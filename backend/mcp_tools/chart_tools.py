@@ -4,9 +4,11 @@ These tools can be used by the AI Agent to create and manage charts
 """
 from typing import Dict, Any, List
 from app.services.chart_service import chart_service
+from app.services.chart_renderer import chart_renderer
 
 
-def create_chart(chart_type: str, data: List[Dict], title: str = None, columns: List[str] = None) -> Dict[str, Any]:
+def create_chart(chart_type: str, data: List[Dict], title: str = None, columns: List[str] = None,
+                 max_points: int = None) -> Dict[str, Any]:
     """
     Create a chart configuration
 
@@ -15,6 +17,8 @@ def create_chart(chart_type: str, data: List[Dict], title: str = None, columns:
         data: Chart data as list of dictionaries
         title: Optional chart title
         columns: Optional column names for the chart
+        max_points: Optional target point count; longer bar and line data
+                    is downsampled to about this many points, keeping its shape
 
     Returns:
         Chart configuration
@@ -27,7 +31,7 @@ def create_chart(chart_type: str, data: List[Dict], title: str = None, columns:
         ...     columns=["value"]
         ... )
     """
-    chart = chart_service.create_chart(chart_type, data, title, columns)
+    chart = chart_service.create_chart(chart_type, data, title, columns, max_points)
     return chart
 
 
@@ -54,69 +58,128 @@ def update_chart_data(chart_id: str, new_data: List[Dict]) -> Dict[str, Any]:
 def export_chart(chart_config: Dict[str, Any], format: str = 'png') -> bytes:
     """
     Export chart as image file
+    Identical charts are rendered once and then served from a cache
 
     Args:
         chart_config: Chart configuration
-        format: Export format ('png', 'svg', etc.)
+        format: Export format ('png', 'svg' or 'pdf')
 
     Returns:
         Chart image as bytes
     """
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as plt
-    import io
+    return chart_renderer.render(chart_config, format)
 
-    fig, ax = plt.subplots(figsize=(10, 6))
 
-    chart_type = chart_config.get('type', 'bar')
-    data = chart_config.get('data', [])
+def create_chart_from_excel_sheet(sheet_data: List[List[str]], chart_type: str = 'bar',
+                                  max_points: int = None) -> Dict[str, Any]:
+    """
+    Create a chart directly from Excel sheet data
 
-    if chart_type == 'bar':
-        x_values = [item.get('name', '') for item in data]
-        y_values = [item.get(list(item.keys())[1], 0) for item in data]
+    Args:
+        sheet_data: Excel sheet data as 2D array
+        chart_type: Type of chart to create
+        max_points: Optional target point count for long bar and line data
 
-        ax.bar(x_values, y_values)
-    elif chart_type == 'line':
-        x_values = [item.get('name', '') for item in data]
-        y_values = [item.get(list(item.keys())[1], 0) for item in data]
+    Returns:
+        Chart configuration
+    """
+    chart = chart_service.prepare_chart_data_from_excel(sheet_data, chart_type, max_points)
+    return chart
 
-        ax.plot(x_values, y_values, marker='o')
-    elif chart_type == 'pie':
-        labels = [item.get('name', '') for item in data]
-        sizes = [item.get('value', 0) for item in data]
 
-        ax.pie(sizes, labels=labels, autopct='%1.1f%%')
 
-    plt.tight_layout()
+def create_chart_from_workbook(workbook_id: str, sheet_index: int = 0, chart_type: str = 'bar',
+                               label_col: int = 0, value_cols: List[int] = None, title: str = None,
+                               max_points: int = None) -> Dict[str, Any]:
+    """
+    Create a chart from columns of a stored workbook sheet
+    Values like "16.7%", "1,234" or "¥5,000" are read as numbers, and
+    charting an unchanged sheet again reuses the parsed columns
 
-    output = io.BytesIO()
-    plt.savefig(output, format=format)
-    output.seek(0)
-    plt.close()
+    Args:
+        workbook_id: ID of the workbook
+        sheet_index: Index of the sheet (0-based); its first row is headers
+        chart_type: Type of chart to create
+        label_col: Column holding the labels (0-based)
+        value_cols: Columns holding the values, every other column if omitted
+        title: Optional chart title
+        max_points: Optional target point count for long bar and line data
 
-    return output.read()
+    Returns:
+        Chart configuration
+    """
+    return chart_service.chart_from_sheet(
+        workbook_id, sheet_index, chart_type, label_col, value_cols, title, max_points
+    )
 
 
-def create_chart_from_excel_sheet(sheet_data: List[List[str]], chart_type: str = 'bar') -> Dict[str, Any]:
+def aggregate_chart(workbook_id: str, group_col: int = 0, value_cols: List[int] = None, agg: str = 'sum',
+                    pivot_col: int = None, sheet_index: int = 0, chart_type: str = 'bar', title: str = None,
+                    sort_by: str = None, limit: int = None) -> Dict[str, Any]:
     """
-    Create a chart directly from Excel sheet data
+    Create a chart of a stored workbook sheet grouped by one column
+    The sheet is aggregated on the server, so only one point per group
+    is returned however many rows the sheet has
 
     Args:
-        sheet_data: Excel sheet data as 2D array
+        workbook_id: ID of the workbook
+        group_col: Column to group rows by (0-based); the first row is headers
+        value_cols: Columns to aggregate, every other column if omitted;
+                    [] with agg 'count' counts rows
+        agg: 'sum', 'mean', 'count', 'min' or 'max'
+        pivot_col: Optional second column; each of its values becomes a series
+                   of the single value column
+        sheet_index: Index of the sheet (0-based)
         chart_type: Type of chart to create
+        title: Optional chart title
+        sort_by: Optional group order, 'label' or 'value' (largest first)
+        limit: Optional number of groups to keep after sorting
 
     Returns:
         Chart configuration
+
+    Example:
+        >>> aggregate_chart(workbook_id, group_col=0, value_cols=[2], agg="sum",
+        ...                 sort_by="value", limit=10)
     """
-    chart = chart_service.prepare_chart_data_from_excel(sheet_data, chart_type)
-    return chart
+    return chart_service.aggregate(
+        workbook_id, sheet_index, group_col, value_cols, agg, pivot_col, chart_type, title, sort_by, limit
+    )
 
 
+def bind_chart_to_range(workbook_id: str, sheet_index: int = 0, chart_type: str = 'bar', title: str = None,
+                        label_col: int = 0, value_cols: List[int] = None, row_start: int = 1,
+                        row_stop: int = None, max_points: int = None) -> Dict[str, Any]:
+    """
+    Create a chart bound to a range of a stored workbook sheet
+    The chart is stored with the workbook: editing cells in the range
+    updates it, and Excel exports chart the range's cells
+
+    Args:
+        workbook_id: ID of the workbook
+        sheet_index: Index of the sheet (0-based)
+        chart_type: Type of chart to create
+        title: Optional chart title
+        label_col: Column holding the labels (0-based)
+        value_cols: Columns holding the values, the mostly numeric ones if omitted
+        row_start: First data row (0-based); the row above holds the series names
+        row_stop: Row after the last data row, the end of the sheet if omitted
+        max_points: Optional target point count for long bar and line data
+
+    Returns:
+        Chart configuration with its id and current data
+    """
+    return chart_service.bind_chart(
+        workbook_id, sheet_index, chart_type, title, label_col, value_cols, row_start, row_stop, max_points
+    )
+
 # Register MCP tools
 MCP_TOOLS = {
     'create_chart': create_chart,
     'update_chart_data': update_chart_data,
     'export_chart': export_chart,
     'create_chart_from_excel_sheet': create_chart_from_excel_sheet,
+    'create_chart_from_workbook': create_chart_from_workbook,
+    'aggregate_chart': aggregate_chart,
+    'bind_chart_to_range': bind_chart_to_range,
 }
@@ -4,7 +4,7 @@ These tools can be used by the AI Agent to perform Excel-related tasks
 """
 from typing import Dict, Any
 from app.services.excel_service import excel_service
-from app.models.excel import Workbook
+from app.models.excel import Workbook, PatchOperation
 
 
 def create_excel_workbook(sheets_data: list) -> str:
@@ -49,7 +49,26 @@ def read_excel_data(workbook_id: str) -> Dict[str, Any]:
     return workbook.dict()
 
 
-def update_cell(workbook_id: str, sheet_index: int, row: int, col: int, value: str) -> Dict[str, Any]:
+def read_excel_range(workbook_id: str, sheet_index: int, row_start: int = 0, row_count: int = 200,
+                     col_start: int = 0, col_count: int = None) -> Dict[str, Any]:
+    """
+    Read a window of a sheet instead of the whole workbook
+
+    Args:
+        workbook_id: ID of the workbook
+        sheet_index: Index of the sheet (0-based)
+        row_start: First row to read (0-based)
+        row_count: Number of rows to read (at most 5000)
+        col_start: First column to read (0-based)
+        col_count: Number of columns to read, all remaining ones if omitted
+
+    Returns:
+        The rows of the window plus the sheet's n_rows, n_cols and version
+    """
+    return excel_service.read_range(workbook_id, sheet_index, row_start, row_count, col_start, col_count)
+
+
+def update_cell(workbook_id: str, sheet_index: int, row: int, col: int, value: str, delta: bool = False) -> Dict[str, Any]:
     """
     Update a specific cell in the workbook
 
@@ -59,14 +78,41 @@ def update_cell(workbook_id: str, sheet_index: int, row: int, col: int, value: s
         row: Row index (0-based)
         col: Column index (0-based)
         value: New value for the cell
+        delta: Return only the changes instead of the whole workbook
 
     Returns:
-        Updated workbook data
+        Updated workbook data, or the change delta when delta=True
     """
+    if delta:
+        return excel_service.update_cell_delta(workbook_id, sheet_index, row, col, value)
+
     workbook = excel_service.update_cell(workbook_id, sheet_index, row, col, value)
     return workbook.dict()
 
 
+def patch_cells(workbook_id: str, sheet_index: int, operations: list) -> Dict[str, Any]:
+    """
+    Write many cells or blocks of cells in one atomic batch
+
+    Args:
+        workbook_id: ID of the workbook
+        sheet_index: Index of the sheet (0-based)
+        operations: List of writes, each either {"row", "col", "value"} for
+            one cell or {"row", "col", "values"} for a 2D block anchored there
+
+    Returns:
+        Change delta with the new workbook version
+
+    Example:
+        >>> patch_cells(workbook_id, 0, [
+        ...     {"row": 0, "col": 0, "value": "Total"},
+        ...     {"row": 1, "col": 0, "values": [["A", "1"], ["B", "2"]]},
+        ... ])
+    """
+    ops = [PatchOperation(**op) for op in operations]
+    return excel_service.apply_patch(workbook_id, sheet_index, ops)
+
+
 def add_sheet(workbook_id: str, sheet_name: str) -> Dict[str, Any]:
     """
     Add a new sheet to the workbook
@@ -101,7 +147,9 @@ def export_excel_file(workbook_id: str, filename: str = None) -> bytes:
 MCP_TOOLS = {
     'create_excel_workbook': create_excel_workbook,
     'read_excel_data': read_excel_data,
+    'read_excel_range': read_excel_range,
     'update_cell': update_cell,
+    'patch_cells': patch_cells,
     'add_sheet': add_sheet,
     'export_excel_file': export_excel_file,
 }
@@ -2,7 +2,8 @@
 MCP Tools for web scraping
 These tools can be used by the AI Agent to scrape data from web pages
 """
-from typing import Dict, Any
+import asyncio
+from typing import Dict, Any, List
 from app.services.scraper_service import scraper_service
 
 
@@ -20,7 +21,7 @@ def scrape_web_table(url: str, table_index: int = 0) -> Dict[str, Any]:
     Example:
         >>> scrape_web_table("https://example.com", table_index=0)
     """
-    sheet = scraper_service.scrape_table(url, table_index)
+    sheet = asyncio.run(scraper_service.scrape_table(url, table_index))
     return sheet.dict()
 
 
@@ -35,10 +36,81 @@ def scrape_web_list(url: str, list_index: int = 0) -> Dict[str, Any]:
     Returns:
         Sheet data with scraped list content
     """
-    sheet = scraper_service.scrape_list(url, list_index)
+    sheet = asyncio.run(scraper_service.scrape_list(url, list_index))
     return sheet.dict()
 
 
+def scrape_web_tables_batch(targets: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Scrape many tables, from one or many webpages, into one multi-sheet workbook
+
+    Args:
+        targets: List of {"url": ..., "table_index": 0, "sheet_name": ...};
+                 table_index null scrapes every table on the page,
+                 sheet_name is optional
+
+    Returns:
+        workbook_id of the new workbook (None if every target failed) and a
+        per-target result with its sheet names and row count, or its error
+
+    Example:
+        >>> scrape_web_tables_batch([{"url": "https://example.com", "table_index": None}])
+    """
+    return asyncio.run(scraper_service.scrape_batch(targets))
+
+
+def crawl_web_table(
+    url: str = None,
+    table_index: int = 0,
+    next_selector: str = None,
+    url_pattern: str = None,
+    start_page: int = 1,
+    max_pages: int = 50,
+) -> Dict[str, Any]:
+    """
+    Scrape a table spread over many pages into one sheet
+
+    Args:
+        url: URL of the first page; later pages are found by their next link
+        table_index: Index of the table on each page
+        next_selector: CSS selector of the next-page link (default: rel="next" links)
+        url_pattern: URL with {page} for the page number, instead of url and next links
+        start_page: Page number of the first page with url_pattern
+        max_pages: Most pages to crawl
+
+    Returns:
+        workbook_id, pages crawled, total rows, why the crawl stopped, and rows added per page
+
+    Example:
+        >>> crawl_web_table(url_pattern="https://example.com/list?page={page}", max_pages=10)
+    """
+    async def run():
+        pages = []
+        async for event in scraper_service.crawl(url, table_index, next_selector, url_pattern,
+                                                 start_page, max_pages):
+            if event['event'] == 'page':
+                pages.append({'url': event['url'], 'rows': event['rows']})
+            else:
+                return {**event, 'page_rows': pages}
+
+    return asyncio.run(run())
+
+
+def get_page_index(url: str, sample_rows: int = 3) -> Dict[str, Any]:
+    """
+    List every table and list on a webpage, to pick which one to scrape
+
+    Args:
+        url: URL of the webpage
+        sample_rows: Number of sample rows (or items) to include per table (or list)
+
+    Returns:
+        Index, size, caption, nearest heading, header and sample rows of each
+        table, and index, size and sample items of each list
+    """
+    return asyncio.run(scraper_service.page_index(url, sample_rows))
+
+
 def extract_structured_data(url: str, selector: str = None) -> list:
     """
     Extract structured data from webpage using CSS selectors
@@ -50,26 +122,15 @@ def extract_structured_data(url: str, selector: str = None) -> list:
     Returns:
         List of extracted data
     """
-    import requests
-    from bs4 import BeautifulSoup
-
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-    }
-    response = requests.get(url, headers=headers, timeout=10)
-    soup = BeautifulSoup(response.content, 'html.parser')
-
-    if selector:
-        elements = soup.select(selector)
-        return [elem.get_text(strip=True) for elem in elements]
-    else:
-        # Extract all text content
-        return [soup.get_text(strip=True)]
+    return asyncio.run(scraper_service.extract_structured_data(url, selector))
 
 
 # Register MCP tools
 MCP_TOOLS = {
     'scrape_web_table': scrape_web_table,
     'scrape_web_list': scrape_web_list,
+    'scrape_web_tables_batch': scrape_web_tables_batch,
+    'crawl_web_table': crawl_web_table,
+    'get_page_index': get_page_index,
     'extract_structured_data': extract_structured_data,
 }
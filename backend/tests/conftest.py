@@ -0,0 +1,30 @@
+import os
+import tempfile
+
+import pytest
+
+# Keep spilled workbooks and cached pages out of the shared temp locations;
+# app.config reads these once, at import
+_STATE_DIR = tempfile.mkdtemp(prefix='web-excel-tests-')
+os.environ.setdefault('WEB_EXCEL_SPILL_PATH', os.path.join(_STATE_DIR, 'spill.sqlite3'))
+os.environ.setdefault('WEB_EXCEL_HTTP_CACHE_DIR', os.path.join(_STATE_DIR, 'http-cache'))
+os.environ.setdefault('WEB_EXCEL_STATE_BACKEND', 'memory://')
+
+
+@pytest.fixture(scope='session')
+def client():
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def create_workbook(client):
+    """Create a workbook through the API from a list of rows and return its id"""
+    def create(rows, name='Sheet1'):
+        response = client.post('/api/excel/workbook', json={'name': 'Book', 'sheets': [{'name': name, 'rows': rows}]})
+        assert response.status_code == 200
+        return response.json()['id']
+    return create
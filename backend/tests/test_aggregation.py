@@ -0,0 +1,119 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from app.services.aggregation import AGGREGATIONS, factorize, group_reduce
+from app.services.sheet_store import Column
+
+SALES = [
+    ['region', 'product', 'units', 'price'],
+    ['north', 'tea', '3', '1.5'],
+    ['south', 'cake', '5', '2'],
+    ['north', 'cake', '1', 'n/a'],
+    ['', 'tea', '9', '1'],
+    ['east', 'tea', '', '4'],
+    ['south', 'tea', '2', '3'],
+]
+
+
+def _reference(groups, values, how):
+    """Aggregate per group the slow way, skipping blank groups and missing values"""
+    buckets = {}
+    for group, value in zip(groups, values):
+        if group and not math.isnan(value):
+            buckets.setdefault(group, []).append(value)
+    if how == 'count':
+        return {group: float(len(found)) for group, found in buckets.items()}
+    reduce = {'sum': sum, 'min': min, 'max': max, 'mean': lambda found: sum(found) / len(found)}[how]
+    return {group: reduce(found) for group, found in buckets.items()}
+
+
+@pytest.mark.parametrize('how', AGGREGATIONS)
+@pytest.mark.parametrize('labels', [
+    ['a', 'b', 'c', ''],
+    [str(idx) for idx in range(40)] + [''],
+    [f'item {idx}' for idx in range(400)],
+])
+def test_group_reduce_matches_the_reference(how, labels):
+    rng = random.Random(len(labels))
+    groups = [rng.choice(labels) for _ in range(2000)]
+    values = [rng.choice([math.nan, rng.uniform(-100, 100)]) for _ in groups]
+
+    codes, keys = factorize(Column.from_values(['header'] + groups))
+    result = group_reduce(codes, len(keys), np.array(values), how)
+    expected = _reference(groups, values, how)
+
+    assert keys == list(dict.fromkeys(group for group in groups if group))
+    for key, value in zip(keys, result.tolist()):
+        if key in expected:
+            assert value == pytest.approx(expected[key])
+        elif how == 'count':
+            assert value == 0.0
+        else:
+            assert math.isnan(value)
+
+
+def _aggregate(client, workbook_id, **request):
+    return client.post('/api/chart/aggregate', json={'workbook_id': workbook_id, **request})
+
+
+def test_group_by_sums_numeric_cells_only(client, create_workbook):
+    workbook_id = create_workbook(SALES)
+
+    chart = _aggregate(client, workbook_id, group_col=0, value_cols=[2, 3]).json()['data']
+    assert chart['columns'] == ['units', 'price']
+    assert chart['data'] == [
+        {'name': 'north', 'units': 4.0, 'price': 1.5},
+        {'name': 'south', 'units': 7.0, 'price': 5.0},
+        {'name': 'east', 'units': None, 'price': 4.0},
+    ]
+    assert chart['title'] == 'units, price (sum) by region'
+
+
+def test_count_of_rows_per_group(client, create_workbook):
+    workbook_id = create_workbook(SALES)
+
+    chart = _aggregate(client, workbook_id, group_col=1, value_cols=[], agg='count').json()['data']
+    assert chart['data'] == [{'name': 'tea', 'count': 4.0}, {'name': 'cake', 'count': 2.0}]
+
+
+def test_pivot_makes_a_series_per_value(client, create_workbook):
+    workbook_id = create_workbook(SALES)
+
+    chart = _aggregate(client, workbook_id, group_col=0, pivot_col=1, value_cols=[2], agg='max').json()['data']
+    assert chart['columns'] == ['tea', 'cake']
+    assert chart['data'] == [
+        {'name': 'north', 'tea': 3.0, 'cake': 1.0},
+        {'name': 'south', 'tea': 2.0, 'cake': 5.0},
+        {'name': 'east', 'tea': None, 'cake': None},
+    ]
+
+    response = _aggregate(client, workbook_id, group_col=0, pivot_col=1, value_cols=[2, 3])
+    assert response.status_code == 400
+
+
+def test_groups_sorted_by_value_and_limited(client, create_workbook):
+    workbook_id = create_workbook(SALES)
+
+    chart = _aggregate(client, workbook_id, group_col=0, value_cols=[2], sort_by='value', limit=2).json()['data']
+    assert [point['name'] for point in chart['data']] == ['south', 'north']
+
+
+@pytest.mark.parametrize('labels, expected', [
+    (['10', '9', '100', '-1', '2.5'], ['-1', '2.5', '9', '10', '100']),
+    (['2024-10', '2024-2', '2023-12'], ['2023-12', '2024-2', '2024-10']),
+    (['b', '10', 'a', '9'], ['9', '10', 'a', 'b']),
+])
+def test_groups_sorted_by_label_read_numbers_as_numbers(client, create_workbook, labels, expected):
+    workbook_id = create_workbook([['label', 'value']] + [[label, '1'] for label in labels])
+
+    chart = _aggregate(client, workbook_id, group_col=0, value_cols=[1], sort_by='label').json()['data']
+    assert [point['name'] for point in chart['data']] == expected
+
+
+def test_unknown_aggregation_or_sort_is_400(client, create_workbook):
+    workbook_id = create_workbook(SALES)
+    assert _aggregate(client, workbook_id, agg='median').status_code == 400
+    assert _aggregate(client, workbook_id, sort_by='size').status_code == 400
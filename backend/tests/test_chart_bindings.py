@@ -0,0 +1,123 @@
+import random
+
+import numpy as np
+
+from app.models.excel import PatchOperation, Workbook, Sheet
+from app.services.chart_bindings import ChartSeries, chart_series_cache
+from app.services.excel_service import excel_service
+
+ROWS = [['month', 'sales', 'cost', 'note']] + [[f'm{idx}', str(idx * 10), str(idx), 'x'] for idx in range(1, 21)]
+
+
+def _bind(client, workbook_id, **request):
+    response = client.post(f'/api/excel/{workbook_id}/charts', json=request)
+    assert response.status_code == 200
+    return response.json()['data']
+
+
+def _chart(client, workbook_id, chart_id):
+    return client.get(f'/api/excel/{workbook_id}/charts/{chart_id}').json()
+
+
+def _set(client, workbook_id, row, col, value):
+    response = client.put(
+        f'/api/excel/workbook/{workbook_id}/cell?delta=true',
+        json={'sheet_index': 0, 'row': row, 'col': col, 'value': value},
+    )
+    return response.json()['delta']
+
+
+def test_bound_chart_derives_its_data_from_the_range(client, create_workbook):
+    workbook_id = create_workbook(ROWS)
+    chart = _bind(client, workbook_id, type='line', row_stop=4)
+
+    assert chart['range']['value_cols'] == [1, 2]
+    assert chart['columns'] == ['sales', 'cost']
+    assert chart['data'] == [
+        {'name': 'm1', 'sales': 10.0, 'cost': 1.0},
+        {'name': 'm2', 'sales': 20.0, 'cost': 2.0},
+        {'name': 'm3', 'sales': 30.0, 'cost': 3.0},
+    ]
+
+
+def test_edits_in_the_range_patch_the_chart(client, create_workbook):
+    workbook_id = create_workbook(ROWS)
+    chart_id = _bind(client, workbook_id)['id']
+    before = chart_series_cache.stats()
+
+    assert _set(client, workbook_id, 2, 1, 'n/a')['charts'] == [chart_id]
+    assert _set(client, workbook_id, 0, 2, 'spend')['charts'] == [chart_id]
+    assert _set(client, workbook_id, 5, 3, 'ignored')['charts'] == []
+
+    chart = _chart(client, workbook_id, chart_id)
+    assert chart['columns'] == ['sales', 'spend']
+    assert chart['data'][1] == {'name': 'm2', 'sales': None, 'spend': 2.0}
+    after = chart_series_cache.stats()
+    assert after['misses'] == before['misses']
+    assert after['patched_points'] > before['patched_points']
+
+
+def test_open_ended_range_follows_appended_rows(client, create_workbook):
+    workbook_id = create_workbook(ROWS)
+    open_id = _bind(client, workbook_id)['id']
+    fixed_id = _bind(client, workbook_id, row_stop=21)['id']
+
+    workbook = excel_service.workbooks.get(workbook_id)
+    result = excel_service.append_rows(workbook_id, 0, [['m21', '210', '21', ''], ['m22', '220', '22', '']])
+
+    assert result['charts'] == [open_id]
+    assert len(_chart(client, workbook_id, open_id)['data']) == 22
+    assert _chart(client, workbook_id, open_id)['data'][-1] == {'name': 'm22', 'sales': 220.0, 'cost': 22.0}
+    assert len(_chart(client, workbook_id, fixed_id)['data']) == 20
+    assert workbook.version == result['version']
+
+
+def test_full_sync_recomputes_the_chart(client, create_workbook):
+    workbook_id = create_workbook(ROWS)
+    chart_id = _bind(client, workbook_id)['id']
+
+    rows = [row[:] for row in ROWS[:3]]
+    rows[1][1] = '999'
+    response = client.put(f'/api/excel/{workbook_id}/sync', json={'sheets': [{'name': 'Sheet1', 'rows': rows}]})
+    assert response.status_code == 200
+
+    data = _chart(client, workbook_id, chart_id)['data']
+    assert data == [{'name': 'm1', 'sales': 999.0, 'cost': 1.0}, {'name': 'm2', 'sales': 20.0, 'cost': 2.0}]
+
+
+def test_removed_chart_is_gone(client, create_workbook):
+    workbook_id = create_workbook(ROWS)
+    chart_id = _bind(client, workbook_id)['id']
+
+    assert client.delete(f'/api/excel/{workbook_id}/charts/{chart_id}').status_code == 200
+    assert client.get(f'/api/excel/{workbook_id}/charts/{chart_id}').status_code == 404
+    assert client.delete(f'/api/excel/{workbook_id}/charts/{chart_id}').status_code == 404
+
+
+def test_patched_series_match_a_full_recompute():
+    rng = random.Random(3)
+    rows = [['label', 'a', 'b']] + [[f'r{idx}', str(rng.randint(0, 99)), f'{rng.random():.3f}'] for idx in range(500)]
+    workbook_id = excel_service.create_workbook(Workbook(sheets=[Sheet(name='Sheet1', rows=rows)]))
+    chart = excel_service.add_bound_chart(workbook_id, 0, value_cols=[1, 2])
+    excel_service.bound_chart_series(workbook_id, chart['id'], lambda chart, series: None)
+    misses = chart_series_cache.stats()['misses']
+
+    for _ in range(200):
+        row, col = rng.randrange(0, 520), rng.randrange(0, 4)
+        if rng.random() < 0.8:
+            operation = PatchOperation(row=row, col=col, value=rng.choice(['', 'x', str(rng.randint(-50, 50)), '1,5']))
+        else:
+            block = [[str(rng.randint(0, 9)) for _ in range(2)] for _ in range(rng.randint(1, 30))]
+            operation = PatchOperation(row=row, col=col, values=block)
+        excel_service.apply_patch(workbook_id, 0, [operation])
+
+        workbook = excel_service.workbooks.get(workbook_id)
+        kept = chart_series_cache.series(workbook, chart)
+        fresh = ChartSeries.compute(workbook.sheets[0], chart['range'], workbook.version)
+        assert kept.labels == fresh.labels
+        assert kept.headers == fresh.headers
+        for kept_values, fresh_values in zip(kept.values, fresh.values):
+            assert np.array_equal(kept_values, fresh_values, equal_nan=True)
+
+    # Every edit was patched in, none needed a full recompute
+    assert chart_series_cache.stats()['misses'] == misses
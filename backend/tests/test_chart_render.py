@@ -0,0 +1,62 @@
+import asyncio
+
+from app.services.chart_renderer import ChartRenderer, chart_key
+
+CHART = {'type': 'bar', 'title': 'Sales', 'data': [{'name': 'a', 'value': 1}, {'name': 'b', 'value': 3}]}
+
+
+def test_render_answers_with_a_content_etag(client):
+    response = client.post('/api/chart/render', json=CHART)
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'image/png'
+    assert response.content.startswith(b'\x89PNG')
+    assert response.headers['ETag'] == f'"{chart_key(CHART, "png")}"'
+
+
+def test_render_revalidation_is_304(client):
+    etag = client.post('/api/chart/render', json=CHART).headers['ETag']
+
+    for if_none_match in (etag, f'W/{etag}', f'"other", {etag}', '*'):
+        response = client.post('/api/chart/render', json=CHART, headers={'If-None-Match': if_none_match})
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+
+    changed = dict(CHART, title='Other')
+    assert client.post('/api/chart/render', json=changed, headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_same_chart_is_drawn_once(client):
+    chart = dict(CHART, title='Drawn once')
+    before = client.get('/api/chart/render/stats').json()
+    first = client.post('/api/chart/render', json=chart)
+    second = client.post('/api/chart/render', json=chart)
+    after = client.get('/api/chart/render/stats').json()
+
+    assert first.content == second.content
+    assert after['renders'] - before['renders'] == 1
+    assert after['hits'] - before['hits'] == 1
+
+
+def test_render_formats(client):
+    svg = client.post('/api/chart/render?format=svg', json=CHART)
+    assert svg.headers['content-type'] == 'image/svg+xml'
+    assert svg.headers['ETag'] != client.post('/api/chart/render', json=CHART).headers['ETag']
+    assert client.post('/api/chart/render?format=gif', json=CHART).status_code == 400
+
+
+def test_cancelled_waiter_leaves_a_joined_render_running():
+    renderer = ChartRenderer(1024 * 1024)
+    chart = dict(CHART, title='Joined')
+
+    async def render_twice():
+        leaving = asyncio.ensure_future(renderer.render_async(chart))
+        staying = asyncio.ensure_future(renderer.render_async(chart))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        return await staying, leaving.cancelled()
+
+    image, cancelled = asyncio.run(render_twice())
+    assert cancelled
+    assert image.startswith(b'\x89PNG')
+    assert renderer.stats()['joined'] == 1
+    assert renderer.stats()['failures'] == 0
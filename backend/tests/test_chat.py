@@ -0,0 +1,17 @@
+from app.services.agent_service import agent_service
+
+
+def test_demo_workbook_is_made_the_current_one(client):
+    response = client.post('/api/chat', json={'message': 'demo'})
+    assert response.status_code == 200
+    body = response.json()
+    assert body['type'] == 'excel'
+    handle = body['data']
+    assert handle['sheets'][0]['rows'][0] == ['月份', '销售额', '成本', '利润', '增长率']
+    assert agent_service.current_workbook_id == handle['id']
+
+    chart = client.post('/api/chat', json={'message': '创建折线图'}).json()
+    assert chart['type'] == 'chart'
+    # The closing total row is left out of the bound chart
+    assert [point['name'] for point in chart['data']['data']][-1] == '六月'
+
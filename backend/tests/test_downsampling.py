@@ -0,0 +1,116 @@
+import math
+
+import numpy as np
+import pytest
+
+from app.services.chart_service import chart_service
+from app.services.downsampling import downsample_indices, lttb_indices, minmax_indices
+
+
+def _reference_lttb(y, n_out):
+    """Largest-Triangle-Three-Buckets as originally described, one point at a time"""
+    n = len(y)
+    every = (n - 2) / (n_out - 2)
+    kept = [0]
+    a = 0
+    for bucket in range(n_out - 2):
+        start = math.floor(bucket * every) + 1
+        end = math.floor((bucket + 1) * every) + 1
+        next_start, next_end = end, min(math.floor((bucket + 2) * every) + 1, n)
+        if bucket == n_out - 3:
+            cx, cy = n - 1, y[-1]
+        else:
+            cx = sum(range(next_start, next_end)) / (next_end - next_start)
+            cy = sum(y[next_start:next_end]) / (next_end - next_start)
+        best, best_area = start, -1.0
+        for idx in range(start, end):
+            area = abs((a - cx) * (y[idx] - y[a]) - (a - idx) * (cy - y[a]))
+            if area > best_area:
+                best, best_area = idx, area
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
+
+
+@pytest.mark.parametrize('n, n_out', [(1000, 50), (997, 13), (10, 9), (100, 3)])
+def test_lttb_matches_the_reference(n, n_out):
+    y = np.random.default_rng(n).normal(size=n).cumsum()
+    assert lttb_indices(y, n_out).tolist() == _reference_lttb(y.tolist(), n_out)
+
+
+def test_lttb_keeps_a_spike():
+    y = np.zeros(10_000)
+    y[4321] = 100.0
+    kept = lttb_indices(y, 100)
+    assert len(kept) == 100
+    assert kept[0] == 0 and kept[-1] == 9_999
+    assert 4321 in kept
+    assert np.all(np.diff(kept) > 0)
+
+
+def test_nan_points_never_win_a_bucket():
+    y = np.arange(1000, dtype=np.float64)
+    y[1::3] = np.nan
+    y[500] = -50.0
+    for kept in (lttb_indices(y, 60), minmax_indices(y, 60)):
+        assert not np.isnan(y[kept]).any()
+        assert 500 in kept
+
+
+def test_runs_of_nan_stay_gaps():
+    y = np.arange(1000, dtype=np.float64)
+    y[300:500] = np.nan
+    for kept in (lttb_indices(y, 60), minmax_indices(y, 60)):
+        inside = kept[(kept >= 300) & (kept < 500)]
+        assert len(inside) and np.isnan(y[inside]).all()
+
+
+def test_minmax_keeps_every_buckets_extremes():
+    y = np.random.default_rng(1).normal(size=1000)
+    kept = minmax_indices(y, 20)
+    for bucket in np.array_split(np.arange(1000), 10):
+        assert bucket[y[bucket].argmax()] in kept
+        assert bucket[y[bucket].argmin()] in kept
+    assert len(kept) <= 20
+    assert np.all(np.diff(kept) > 0)
+
+
+def test_short_series_are_kept_whole():
+    y = np.arange(10, dtype=np.float64)
+    assert lttb_indices(y, 10).tolist() == list(range(10))
+    assert minmax_indices(y, 50).tolist() == list(range(10))
+
+
+def test_series_sharing_rows_keep_each_others_peaks():
+    first = np.zeros(1000)
+    second = np.zeros(1000)
+    first[111] = 9.0
+    second[888] = -9.0
+    kept = downsample_indices([first, second], 40, 'minmax')
+    assert 111 in kept and 888 in kept
+
+
+def test_create_chart_downsamples_bar_and_line_but_not_pie():
+    data = [{'name': str(idx), 'value': float(idx % 7)} for idx in range(5000)]
+    data[2500]['value'] = 1000.0
+
+    for chart_type in ('bar', 'line'):
+        points = chart_service.create_chart(chart_type, data, max_points=100)['data']
+        assert len(points) <= 100
+        assert {'name': '2500', 'value': 1000.0} in points
+        assert [int(point['name']) for point in points] == sorted(int(point['name']) for point in points)
+
+    assert len(chart_service.create_chart('pie', data, max_points=100)['data']) == 5000
+    assert len(chart_service.create_chart('line', data)['data']) == 5000
+
+
+def test_chart_endpoint_downsamples(client):
+    data = [{'name': str(idx), 'value': idx % 7} for idx in range(5000)]
+    response = client.post('/api/chart', json={'type': 'line', 'data': data, 'max_points': 100})
+    assert response.status_code == 200
+    points = response.json()['data']['data']
+    assert 3 <= len(points) <= 100
+    assert points[0] == {'name': '0', 'value': 0}
+
+    assert client.post('/api/chart', json={'type': 'line', 'data': data[:3]}).json()['data']['data'] == data[:3]
@@ -0,0 +1,40 @@
+import asyncio
+import os
+import tempfile
+import time
+
+from app.services.executors import run_file_in_process
+
+
+def write_file_slowly(directory: str, delay: float) -> str:
+    """Runs in a worker process"""
+    time.sleep(delay)
+    fd, path = tempfile.mkstemp(dir=directory)
+    os.close(fd)
+    return path
+
+
+def test_file_built_for_a_caller_is_kept(tmp_path):
+    path = asyncio.run(run_file_in_process(write_file_slowly, str(tmp_path), 0))
+    assert os.path.exists(path)
+
+
+def test_file_built_for_a_cancelled_caller_is_removed(tmp_path):
+    async def cancel_while_building():
+        # Let the worker pick up the task before cancelling, so it cannot be withdrawn
+        task = asyncio.ensure_future(run_file_in_process(write_file_slowly, str(tmp_path), 0.5))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run_file_in_process(write_file_slowly, str(tmp_path), 0))
+    for path in os.listdir(tmp_path):
+        os.remove(tmp_path / path)
+    asyncio.run(cancel_while_building())
+
+    # The worker writes the file 0.5s in, well before this
+    time.sleep(2)
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,39 @@
+from app.api.responses import etag_matches
+
+
+def test_export_is_revalidated_with_its_etag(client, create_workbook):
+    workbook_id = create_workbook([['a', 'b'], ['1', '2']])
+
+    first = client.get(f'/api/excel/export/{workbook_id}')
+    assert first.status_code == 200
+    assert first.content[:2] == b'PK'
+    etag = first.headers['ETag']
+
+    again = client.get(f'/api/excel/export/{workbook_id}', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == etag
+    assert again.content == b''
+
+
+def test_edit_changes_the_export_etag(client, create_workbook):
+    workbook_id = create_workbook([['a', 'b'], ['1', '2']])
+    etag = client.get(f'/api/excel/export/{workbook_id}').headers['ETag']
+
+    client.put(f'/api/excel/workbook/{workbook_id}/cell', json={'sheet_index': 0, 'row': 1, 'col': 1, 'value': '3'})
+
+    response = client.get(f'/api/excel/export/{workbook_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_export_of_unknown_workbook_is_404(client):
+    assert client.get('/api/excel/export/missing').status_code == 404
+    assert client.get('/api/excel/export/missing', headers={'If-None-Match': '"x"'}).status_code == 404
+
+
+def test_etag_matches_lists_wildcards_and_weak_tags():
+    assert etag_matches('"v1"', '"v1"')
+    assert etag_matches('"v0", "v1"', '"v1"')
+    assert etag_matches('W/"v1"', '"v1"')
+    assert etag_matches('*', '"v1"')
+    assert not etag_matches('"v0"', '"v1"')
@@ -0,0 +1,130 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+from app.services import scraper_service as scraper_module
+from app.services.http_cache import HttpCache
+from app.services.scraper_service import ScraperService
+
+URL = 'http://pages.test/table'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return HttpCache(str(tmp_path / 'http-cache'), max_bytes=1000, default_ttl=60)
+
+
+def _store(cache, body, url=URL, **headers):
+    path = cache.temp_path()
+    with open(path, 'wb') as f:
+        f.write(body)
+    return cache.store(url, httpx.Response(200, headers=headers), path)
+
+
+def test_responses_are_cached_by_their_headers(cache):
+    assert _store(cache, b'a', 'http://pages.test/a', **{'Cache-Control': 'max-age=60'}).is_fresh()
+    assert not _store(cache, b'b', 'http://pages.test/b', **{'Cache-Control': 'no-cache', 'ETag': '"b"'}).is_fresh()
+    assert _store(cache, b'c', 'http://pages.test/c', **{'Cache-Control': 'no-store'}) is None
+    assert _store(cache, b'd', 'http://pages.test/d', **{'Cache-Control': 'no-cache'}) is None
+
+    stale = cache.lookup('http://pages.test/b')
+    assert stale.read() == b'b'
+    assert stale.validators() == {'If-None-Match': '"b"'}
+    assert cache.lookup('http://pages.test/c') is None
+
+
+def test_least_recently_used_responses_are_evicted(cache):
+    _store(cache, b'x' * 400, 'http://pages.test/1')
+    _store(cache, b'x' * 400, 'http://pages.test/2')
+    cache.lookup('http://pages.test/1')
+    _store(cache, b'x' * 400, 'http://pages.test/3')
+
+    assert cache.lookup('http://pages.test/2') is None
+    assert cache.lookup('http://pages.test/1') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_pinned_body_outlives_its_entry(cache):
+    entry = _store(cache, b'<table></table>')
+    pinned = cache.pin(entry)
+    cache.delete(URL)
+    _store(cache, b'replaced', 'http://pages.test/other')
+
+    with open(pinned, 'rb') as f:
+        assert f.read() == b'<table></table>'
+    os.remove(pinned)
+    assert cache.pin(entry) is None
+
+
+class FakeUpstream:
+    """Stands in for http_client.download, answering 304 to matching validators"""
+
+    def __init__(self, body, **headers):
+        self.body = body
+        self.headers = headers
+        self.requests = []
+
+    async def download(self, url, path, headers=None):
+        self.requests.append(headers or {})
+        if headers and headers.get('If-None-Match') == self.headers.get('ETag'):
+            return httpx.Response(304, headers=self.headers, request=httpx.Request('GET', url))
+        with open(path, 'wb') as f:
+            f.write(self.body)
+        return httpx.Response(200, headers=self.headers, request=httpx.Request('GET', url))
+
+
+@pytest.fixture
+def scraper(cache):
+    service = ScraperService()
+    service.cache = cache
+    return service
+
+
+def _fetch(scraper, url=URL):
+    async def fetch():
+        with await scraper.fetch(url) as body:
+            return body.path, body.read()
+    return asyncio.run(fetch())
+
+
+def test_fresh_pages_are_served_from_cache_on_private_paths(scraper, cache, monkeypatch):
+    upstream = FakeUpstream(b'page', **{'Cache-Control': 'max-age=60'})
+    monkeypatch.setattr(scraper_module, 'http_client', upstream)
+
+    first_path, first = _fetch(scraper)
+    second_path, second = _fetch(scraper)
+    assert first == second == b'page'
+    assert len(upstream.requests) == 1
+    entry = cache.lookup(URL)
+    assert entry.path not in (first_path, second_path)
+    # Closing a page body removes its private link, never the cached file
+    assert not os.path.exists(second_path)
+    assert entry.read() == b'page'
+
+
+def test_stale_pages_are_revalidated(scraper, cache, monkeypatch):
+    upstream = FakeUpstream(b'page', **{'Cache-Control': 'no-cache', 'ETag': '"v1"'})
+    monkeypatch.setattr(scraper_module, 'http_client', upstream)
+
+    assert _fetch(scraper)[1] == b'page'
+    assert _fetch(scraper)[1] == b'page'
+    assert upstream.requests == [{}, {'If-None-Match': '"v1"'}]
+    assert cache.stats()['revalidated'] == 1
+
+
+def test_page_evicted_after_a_304_is_downloaded_again(scraper, cache, monkeypatch):
+    upstream = FakeUpstream(b'page', **{'Cache-Control': 'no-cache', 'ETag': '"v1"'})
+    monkeypatch.setattr(scraper_module, 'http_client', upstream)
+    _fetch(scraper)
+
+    refresh = cache.refresh
+
+    def refresh_then_evict(entry, response):
+        refresh(entry, response)
+        os.remove(entry.path)
+
+    monkeypatch.setattr(cache, 'refresh', refresh_then_evict)
+    assert _fetch(scraper)[1] == b'page'
+    assert upstream.requests == [{}, {'If-None-Match': '"v1"'}, {}]
@@ -0,0 +1,86 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+from app.services import http_client as http_client_module
+from app.services.http_client import HttpClient, ResponseTooLarge
+
+SLOW_SECONDS = 0.3
+
+
+async def _upstream(request: httpx.Request) -> httpx.Response:
+    if request.url.host == 'slow.test':
+        await asyncio.sleep(SLOW_SECONDS)
+    if request.url.path == '/flaky' and request.headers.get('x-attempt') != 'ok':
+        return httpx.Response(503, headers={'Retry-After': '0'})
+    if request.url.path == '/big':
+        return httpx.Response(200, content=b'x' * 1000)
+    return httpx.Response(200, text=request.url.host)
+
+
+def _client(**limits) -> HttpClient:
+    """A started client whose requests are answered by _upstream"""
+    client = HttpClient(per_host_rate=0, backoff_seconds=0, **limits)
+    loop = client._ensure_started()
+
+    async def mock():
+        await client._client.aclose()
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(_upstream))
+
+    asyncio.run_coroutine_threadsafe(mock(), loop).result()
+    return client
+
+
+@pytest.fixture
+def make_client():
+    clients = []
+
+    def make(**limits):
+        clients.append(_client(**limits))
+        return clients[-1]
+
+    yield make
+    for client in clients:
+        client.close()
+
+
+def test_busy_host_does_not_hold_up_other_hosts(make_client):
+    client = make_client(max_in_flight=2, per_host_concurrency=1)
+
+    with ThreadPoolExecutor(4) as pool:
+        slow = [pool.submit(client.get_sync, 'http://slow.test/') for _ in range(3)]
+        time.sleep(0.05)
+        started = time.perf_counter()
+        assert client.get_sync('http://fast.test/').text == 'fast.test'
+        assert time.perf_counter() - started < SLOW_SECONDS / 2
+        assert [future.result().status_code for future in slow] == [200] * 3
+
+
+def test_throttled_responses_are_retried(make_client):
+    client = make_client(max_retries=2)
+
+    response = client.get_sync('http://fast.test/flaky')
+    assert response.status_code == 503
+    assert client.stats()['retries'] == 2
+    assert client.get_sync('http://fast.test/flaky', headers={'x-attempt': 'ok'}).status_code == 200
+
+
+def test_bodies_over_the_limit_are_refused(make_client):
+    client = make_client()
+
+    with pytest.raises(ResponseTooLarge):
+        client.get_sync('http://fast.test/big', max_bytes=100)
+    assert len(client.get_sync('http://fast.test/big', max_bytes=1000).content) == 1000
+
+
+def test_idle_host_limiters_are_dropped(make_client, monkeypatch):
+    monkeypatch.setattr(http_client_module, 'MAX_HOST_LIMITERS', 4)
+    client = make_client()
+
+    for idx in range(10):
+        client.get_sync(f'http://host{idx}.test/')
+    assert client.stats()['hosts'] <= 4
+    assert 'host9.test' in client._hosts
@@ -0,0 +1,64 @@
+import io
+
+from openpyxl import Workbook
+
+from app.services import import_service
+
+
+def _upload(client, filename, content, **params):
+    return client.post('/api/excel/import', params=params, files={'file': (filename, content)})
+
+
+def test_csv_import_keeps_quoted_fields(client):
+    response = _upload(client, 'sales.csv', 'region,amount\n"North, east",1200\nSouth,"3,400"\n'.encode())
+    assert response.status_code == 200
+    sheet = response.json()['data']['sheets'][0]
+    assert sheet['name'] == 'sales'
+    assert sheet['rows'] == [['region', 'amount'], ['North, east', '1200'], ['South', '3,400']]
+    assert (sheet['n_rows'], sheet['n_cols']) == (3, 2)
+
+
+def test_tsv_import_with_encoding(client):
+    response = _upload(client, 'data.tsv', 'név\tár\nalma\t3\n'.encode('latin-1'), encoding='latin-1')
+    assert response.status_code == 200
+    assert response.json()['data']['sheets'][0]['rows'] == [['név', 'ár'], ['alma', '3']]
+
+
+def test_xlsx_import_formats_cells_like_the_grid(client):
+    book = Workbook()
+    ws = book.active
+    ws.title = 'Prices'
+    ws.append(['item', 'price', 'in stock'])
+    ws.append(['tea', 4.0, True])
+    ws.append(['cake', 2.5, None])
+    book.create_sheet('Empty')
+    content = io.BytesIO()
+    book.save(content)
+
+    response = _upload(client, 'prices.xlsx', content.getvalue())
+    assert response.status_code == 200
+    sheets = response.json()['data']['sheets']
+    assert [sheet['name'] for sheet in sheets] == ['Prices', 'Empty']
+    assert sheets[0]['rows'] == [['item', 'price', 'in stock'], ['tea', '4', 'TRUE'], ['cake', '2.5', '']]
+
+
+def test_page_of_a_large_import_is_bounded(client):
+    rows = ''.join(f'{idx},{idx * 2}\n' for idx in range(5000))
+    response = _upload(client, 'big.csv', rows.encode())
+    sheet = response.json()['data']['sheets'][0]
+    assert sheet['n_rows'] == 5000
+    assert len(sheet['rows']) < 5000
+
+
+def test_unreadable_uploads_are_400(client):
+    assert _upload(client, 'notes.pdf', b'%PDF').status_code == 400
+    assert _upload(client, 'broken.xlsx', b'not a zip').status_code == 400
+    assert _upload(client, 'bad.csv', b'\xff\xfe\xfa').status_code == 400
+
+
+def test_uploads_over_the_limits_are_413(client, monkeypatch):
+    monkeypatch.setattr(import_service, 'IMPORT_MAX_ROWS', 3)
+    assert _upload(client, 'long.csv', b'1\n2\n3\n4\n').status_code == 413
+
+    monkeypatch.setattr(import_service, 'IMPORT_MAX_BYTES', 8)
+    assert _upload(client, 'large.csv', b'a,b\n1,2\n3,4\n').status_code == 413
@@ -0,0 +1,47 @@
+import glob
+import os
+import tempfile
+import time
+
+EXPORT_FILES = os.path.join(tempfile.gettempdir(), 'web-excel-export-*')
+
+
+def _wait(client, job_id, statuses, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f'/api/jobs/{job_id}').json()
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'job {job_id} still {job["status"]}')
+
+
+def test_export_job_file_can_be_downloaded(client, create_workbook):
+    workbook_id = create_workbook([['a', 'b'], ['1', '2']])
+
+    job_id = client.post(f'/api/jobs/export/{workbook_id}').json()['job_id']
+    job = _wait(client, job_id, ('succeeded', 'failed'))
+    assert job['status'] == 'succeeded'
+    download = client.get(job['result']['file'])
+    assert download.status_code == 200
+    assert download.content[:2] == b'PK'
+
+
+def test_cancelled_export_job_leaves_no_file(client, create_workbook):
+    rows = [[f'row {idx}', str(idx), f'{idx / 4}', 'x'] for idx in range(8000)]
+    workbook_id = create_workbook(rows)
+
+    # A finished build shows how long the cancelled one keeps its worker busy
+    started = time.monotonic()
+    done_id = client.post(f'/api/jobs/export/{workbook_id}').json()['job_id']
+    assert _wait(client, done_id, ('succeeded', 'failed'))['status'] == 'succeeded'
+    build_seconds = time.monotonic() - started
+    before = set(glob.glob(EXPORT_FILES))
+
+    job_id = client.post(f'/api/jobs/export/{workbook_id}').json()['job_id']
+    _wait(client, job_id, ('running',))
+    time.sleep(build_seconds / 4)
+    assert client.delete(f'/api/jobs/{job_id}').json()['status'] == 'cancelled'
+
+    time.sleep(build_seconds * 2 + 1)
+    assert set(glob.glob(EXPORT_FILES)) == before
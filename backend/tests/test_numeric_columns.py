@@ -0,0 +1,94 @@
+import math
+
+import numpy as np
+import pytest
+
+from app.services.numeric_columns import NumericColumnCache, column_numbers, parse_numbers
+from app.services.sheet_store import Column
+
+NUMBERS = [
+    ('42', 42.0),
+    ('-3.5', -3.5),
+    ('1e3', 1000.0),
+    ('.5', 0.5),
+    ('5.', 5.0),
+    (' 42 ', 42.0),
+    ('\xa01,000　', 1000.0),
+    ('1,234', 1234.0),
+    ('1,234,567.25', 1234567.25),
+    ('¥5,000', 5000.0),
+    ('-$1,000.50', -1000.5),
+    ('$-3', -3.0),
+    ('€ 12', 12.0),
+    ('100元', 100.0),
+    ('16.7%', 0.167),
+    ('50％', 0.5),
+    ('1,234.5%', 12.345),
+]
+
+NOT_NUMBERS = [
+    '', 'abc', '3, 4', '1,2,3', '2024 01 05', '1 000', '1,23', '12,3456', ',123', '1,,000',
+    '1,000,00', '1.2.3', '--1', '$', '%', '5%%', '12 %x', 'inf', '-inf', 'nan', '1e400', 'a\nb',
+    '１２', '٣', '1_000', '\x0c1', '2\x1f', '５０％',
+]
+
+
+def _same(actual, expected):
+    return (math.isnan(actual) and math.isnan(expected)) or actual == expected
+
+
+@pytest.mark.parametrize('cell, expected', NUMBERS + [(cell, math.nan) for cell in NOT_NUMBERS])
+def test_cell_reads_the_same_however_the_column_is_parsed(cell, expected):
+    # Alone, beside a formatted number (cleaned as one joined string) and
+    # beside a cell holding a newline (cleaned cell by cell)
+    for column, position in (([cell], 0), (['1,000', cell], 1), (['x\ny', cell, '2'], 1)):
+        numbers = parse_numbers(column)
+        assert len(numbers) == len(column)
+        assert _same(numbers[position], expected), (column, numbers)
+
+
+def test_cells_read_alike_whatever_their_neighbours():
+    cells = ['12', '１２', '1_000', '\x0c1', '7']
+    expected = [12.0, math.nan, math.nan, math.nan, 7.0]
+    for extra in ([], ['1,000'], ['$5'], ['x\ny']):
+        numbers = parse_numbers(cells + extra)[:len(cells)]
+        assert np.array_equal(numbers, expected, equal_nan=True), extra
+
+
+def test_whole_columns_of_formatted_numbers():
+    cells = [cell for cell, _ in NUMBERS] * 500
+    expected = np.array([value for _, value in NUMBERS] * 500)
+    assert np.array_equal(parse_numbers(cells), expected)
+
+
+def test_text_cells_never_merge_into_a_number():
+    numbers = parse_numbers(['3, 4', '1,000', 'a,1', '2'])
+    assert math.isnan(numbers[0]) and math.isnan(numbers[2])
+    assert numbers[1] == 1000.0 and numbers[3] == 2.0
+
+
+@pytest.mark.parametrize('values', [
+    [str(idx) for idx in range(200)],
+    [f'{idx}.5' for idx in range(200)],
+    ['1,000', '$2', 'n/a', ''] * 50,
+    [f'{idx:,}' for idx in range(0, 200_000, 1000)],
+])
+def test_column_numbers_match_parsing_the_cells(values):
+    values = list(values)
+    values[7] = 'seven'
+    column = Column.from_values(values)
+    assert np.array_equal(column_numbers(column), parse_numbers(values), equal_nan=True)
+
+
+def test_cache_parses_once_per_version():
+    cache = NumericColumnCache(1024 * 1024)
+    column = Column.from_values([str(idx) for idx in range(100)])
+
+    first = cache.numbers('book', 1, 0, 0, column)
+    assert cache.numbers('book', 1, 0, 0, column) is first
+    assert not first.flags.writeable
+
+    column.set(0, '99')
+    assert cache.numbers('book', 2, 0, 0, column)[0] == 99.0
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 2
@@ -0,0 +1,74 @@
+import pytest
+
+from app.services import scraper_service
+from app.services.scraper_service import (
+    _parse_document_lxml, _parse_document_soup, find_next_link, parse_document,
+)
+
+PAGES = {
+    'tables and lists': b"""<html><head><title>t</title></head><body>
+        <h2>Sales</h2>
+        <table id="sales"><caption> Q1 <b>2024</b> </caption>
+          <tr><th>Region</th><th>Amount</th></tr>
+          <tr><td> North </td><td>1,200</td></tr>
+          <tr><td>South</td></tr>
+        </table>
+        <h3>Notes</h3>
+        <ul><li>first</li><li> second <i>item</i></li></ul>
+        <ol id="steps"><li>one</li></ol>
+        </body></html>""",
+    'script and style tails': b"""<table><tr>
+        <td>x<script>var a = 1;</script> y</td>
+        <td><style>td { color: red }</style>z </td>
+        <td>a<template><b>hidden</b></template>b</td>
+        </tr></table>""",
+    'entities and whitespace': b"""<table><tr><td>&amp; &lt;b&gt;</td><td>&nbsp;1&#160;000&nbsp;</td>
+        <td>line
+        break</td></tr></table>""",
+    'declared encoding': '<meta charset="iso-8859-1"><table><tr><td>café</td><td>naïve</td></tr></table>'.encode('latin-1'),
+    'nested tables': b"""<table><tr><td>outer<table><tr><td>inner</td></tr></table></td></tr>
+        <tr><td>after</td></tr></table>""",
+    'no tables': b'<p>nothing here</p>',
+}
+
+
+def _summary(document):
+    return document.tables, document.lists
+
+
+@pytest.mark.parametrize('name', PAGES)
+def test_lxml_and_html_parser_read_pages_alike(name):
+    content = PAGES[name]
+    assert _summary(_parse_document_lxml(content)) == _summary(_parse_document_soup(content))
+
+
+def test_document_keeps_headings_captions_and_padding():
+    document = parse_document(PAGES['tables and lists'])
+    table = document.tables[0]
+    assert table['rows'] == [['Region', 'Amount'], ['North', '1,200'], ['South', '']]
+    assert table['caption'] == 'Q12024'
+    assert (table['id'], table['heading']) == ('sales', 'Sales')
+    assert [(lst['tag'], lst['items'], lst['heading']) for lst in document.lists] == [
+        ('ul', ['first', 'seconditem'], 'Notes'),
+        ('ol', ['one'], 'Notes'),
+    ]
+
+
+def test_text_beside_scripts_strips_in_pieces():
+    rows = parse_document(PAGES['script and style tails']).tables[0]['rows']
+    assert rows == [['xy', 'z', 'ab']]
+
+
+def test_pages_lxml_rejects_fall_back_to_html_parser():
+    assert _summary(parse_document(b'')) == ([], [])
+
+
+@pytest.mark.parametrize('parser', ['auto', 'html.parser'])
+def test_next_link_is_found_with_either_parser(monkeypatch, parser):
+    monkeypatch.setattr(scraper_service, 'HTML_PARSER', parser)
+    page = b'<a href="/p/1">1</a><a rel="next" href="/p/3">next</a><a class="more" href="/more">more</a>'
+    assert find_next_link(page, None) == '/p/3'
+    assert find_next_link(page, 'a.more') == '/more'
+    # A soupsieve-only selector still works on the lxml path
+    assert find_next_link(page, 'a:-soup-contains("more")') == '/more'
+    assert find_next_link(b'<p>end</p>', None) is None
@@ -0,0 +1,93 @@
+import pickle
+import random
+
+import pytest
+
+from app.services.sheet_store import Column, ColumnarSheet
+
+
+@pytest.mark.parametrize('values, kind', [
+    ([str(idx - 50) for idx in range(100)], 'int'),
+    ([f'{idx}.25' for idx in range(100)], 'float'),
+    (['north', 'south', 'east'] * 40, 'str'),
+    ([f'id-{idx}' for idx in range(100)], 'text'),
+])
+def test_values_round_trip_in_the_compact_encoding(values, kind):
+    column = Column.from_values(values)
+    assert column.kind == kind
+    assert column.values() == values
+    assert [column.get(idx) for idx in range(len(values))] == values
+
+
+def test_cells_numbers_cannot_hold_are_kept_verbatim():
+    values = [str(idx) for idx in range(100)]
+    values[3], values[10], values[50] = '', 'n/a', '007'
+    column = Column.from_values(values)
+
+    assert column.kind == 'int'
+    assert column.values() == values
+    assert column.slice(5, 60) == values[5:60]
+
+
+def test_edits_keep_overrides_and_slices_in_step():
+    rng = random.Random(7)
+    values = [str(idx) for idx in range(400)]
+    column = Column.from_values(values)
+    column.slice(0, 10)  # index the overrides before editing
+
+    for _ in range(300):
+        idx = rng.randrange(len(values))
+        value = rng.choice(['x', '', '12', '3.5', str(idx)])
+        column.set(idx, value)
+        values[idx] = value
+        start = rng.randrange(len(values))
+        stop = rng.randrange(start, len(values) + 1)
+        assert column.slice(start, stop) == values[start:stop]
+
+    column.extend(['y', '1', ''])
+    column.extend_blank(2)
+    assert column.values() == values + ['y', '1', '', '', '']
+
+
+def test_too_many_overrides_re_encode_the_column():
+    values = [str(idx) for idx in range(64)]
+    column = Column.from_values(values)
+    for idx in range(0, 64, 2):
+        column.set(idx, f'label {idx}')
+        values[idx] = f'label {idx}'
+
+    assert column.kind == 'str'
+    assert column.values() == values
+
+
+def test_pickled_column_with_overrides_round_trips():
+    values = [str(idx) for idx in range(100)]
+    values[7] = 'seven'
+    column = Column.from_values(values)
+    column.set(20, 'twenty')
+    values[20] = 'twenty'
+
+    restored = pickle.loads(pickle.dumps(column))
+    assert restored.values() == values
+    restored.set(30, 'thirty')
+    values[30] = 'thirty'
+    assert restored.slice(0, 100) == values
+
+
+def test_sheet_rows_round_trip_and_grow():
+    rows = [['name', 'qty', 'price'], ['apple', '3', '1.25'], ['pear', '', '0.5']]
+    sheet = ColumnarSheet.from_rows('Sheet1', rows)
+    assert sheet.rows() == rows
+    assert sheet.to_model().rows == rows
+
+    assert sheet.ensure_shape(4, 4) == (1, 1)
+    sheet.set(3, 3, 'note')
+    sheet.append_rows([['plum', '7']])
+    assert sheet.rows() == [
+        ['name', 'qty', 'price', ''],
+        ['apple', '3', '1.25', ''],
+        ['pear', '', '0.5', ''],
+        ['', '', '', 'note'],
+        ['plum', '7', '', ''],
+    ]
+    assert sheet.read_range(1, 3, 1, 3) == [['3', '1.25'], ['', '0.5']]
@@ -0,0 +1,91 @@
+import pytest
+
+from app.services import state_backend
+from app.services.sheet_store import ColumnarSheet, StoredWorkbook
+from app.services.state_backend import SqliteStateBackend
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return SqliteStateBackend(str(tmp_path / 'state.sqlite3'), ttl_seconds=3600)
+
+
+def _saved(backend, n_rows=1000):
+    rows = [['label', 'value']] + [[f'row {idx}', str(idx)] for idx in range(1, n_rows)]
+    workbook = StoredWorkbook('book', [ColumnarSheet.from_rows('Sheet1', rows)])
+    backend.save_workbook(workbook)
+    return workbook
+
+
+def _save(backend, workbook):
+    workbook.version += 1
+    backend.save_workbook(workbook)
+
+
+def _log_rows(backend):
+    return backend._conn().execute('SELECT sheet, col, version FROM edits ORDER BY version').fetchall()
+
+
+def test_cell_edits_are_saved_as_a_log(backend):
+    workbook = _saved(backend)
+    workbook.sheets[0].set(5, 1, 'x')
+    _save(backend, workbook)
+    workbook.sheets[0].set(6, 1, '7')
+    _save(backend, workbook)
+
+    assert _log_rows(backend) == [(0, 1, 1), (0, 1, 2)]
+    loaded = backend.load_workbook('book')
+    assert loaded.version == 2
+    assert loaded.sheets[0].rows() == workbook.sheets[0].rows()
+
+
+def test_long_logs_are_compacted_into_the_column(backend, monkeypatch):
+    monkeypatch.setattr(state_backend, 'EDIT_LOG_MIN_EDITS', 4)
+    workbook = _saved(backend, n_rows=20)
+    for row in range(1, 4):
+        workbook.sheets[0].set(row, 1, f'edit {row}')
+        _save(backend, workbook)
+    assert len(_log_rows(backend)) == 3
+
+    for row in range(4, 6):
+        workbook.sheets[0].set(row, 1, f'edit {row}')
+    _save(backend, workbook)
+
+    assert _log_rows(backend) == []
+    assert backend.load_workbook('book').sheets[0].rows() == workbook.sheets[0].rows()
+
+
+def test_growth_and_appended_rows_are_logged(backend):
+    workbook = _saved(backend, n_rows=10)
+    sheet = workbook.sheets[0]
+    sheet.ensure_shape(12, 3)
+    sheet.set(11, 2, 'corner')
+    sheet.append_rows([['new', '1', 'z']])
+    _save(backend, workbook)
+
+    loaded = backend.load_workbook('book')
+    assert (loaded.sheets[0].n_rows, loaded.sheets[0].n_cols) == (13, 3)
+    assert loaded.sheets[0].rows() == sheet.rows()
+
+
+def test_replaced_sheets_are_written_whole(backend):
+    workbook = _saved(backend)
+    workbook.sheets[0].set(2, 0, 'before')
+    _save(backend, workbook)
+
+    workbook.sheets = [ColumnarSheet.from_rows('Other', [['only']])]
+    _save(backend, workbook)
+
+    assert _log_rows(backend) == []
+    assert backend.load_workbook('book').sheets[0].rows() == [['only']]
+
+
+def test_deleted_workbook_leaves_nothing(backend):
+    workbook = _saved(backend)
+    workbook.sheets[0].set(1, 1, 'x')
+    _save(backend, workbook)
+    backend.delete_workbook('book')
+
+    assert backend.workbook_version('book') is None
+    assert backend.load_workbook('book') is None
+    assert _log_rows(backend) == []
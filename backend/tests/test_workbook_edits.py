@@ -0,0 +1,88 @@
+def _rows(client, workbook_id):
+    return client.get(f'/api/excel/workbook/{workbook_id}').json()['sheets'][0]['rows']
+
+
+def test_cell_delta_reports_growth_and_version(client, create_workbook):
+    workbook_id = create_workbook([['a', 'b'], ['1', '2']])
+
+    response = client.put(
+        f'/api/excel/workbook/{workbook_id}/cell?delta=true',
+        json={'sheet_index': 0, 'row': 3, 'col': 2, 'value': 'x'},
+    )
+    assert response.status_code == 200
+    delta = response.json()['delta']
+    assert delta['cells'] == [{'row': 3, 'col': 2, 'value': 'x'}]
+    assert delta['added_rows'] == {'start': 2, 'count': 2}
+    assert delta['added_cols'] == {'start': 2, 'count': 1}
+    assert (delta['n_rows'], delta['n_cols']) == (4, 3)
+    assert delta['version'] == 1
+    assert _rows(client, workbook_id)[3] == ['', '', 'x']
+
+
+def test_patch_writes_cells_and_blocks(client, create_workbook):
+    workbook_id = create_workbook([['a', 'b']])
+
+    response = client.post(f'/api/excel/workbook/{workbook_id}/patch', json={
+        'sheet_index': 0,
+        'operations': [
+            {'row': 0, 'col': 0, 'value': 'Name'},
+            {'row': 1, 'col': 0, 'values': [['Alice', '30'], ['Bob', '25']]},
+        ],
+    })
+    assert response.status_code == 200
+    delta = response.json()['delta']
+    assert delta['cells'] == [{'row': 0, 'col': 0, 'value': 'Name'}]
+    assert delta['ranges'] == [{'row': 1, 'col': 0, 'rows': 2, 'cols': 2}]
+    assert _rows(client, workbook_id) == [['Name', 'b'], ['Alice', '30'], ['Bob', '25']]
+
+
+def test_invalid_patch_writes_nothing(client, create_workbook):
+    workbook_id = create_workbook([['a', 'b']])
+
+    response = client.post(f'/api/excel/workbook/{workbook_id}/patch', json={
+        'sheet_index': 0,
+        'operations': [
+            {'row': 0, 'col': 0, 'value': 'changed'},
+            {'row': 0, 'col': 1},
+        ],
+    })
+    assert response.status_code == 400
+    assert _rows(client, workbook_id) == [['a', 'b']]
+
+
+def test_sync_applies_changes_against_current_version(client, create_workbook):
+    workbook_id = create_workbook([['a', 'b'], ['1', '2']])
+
+    response = client.patch(f'/api/excel/{workbook_id}/sync', json={
+        'base_version': 0,
+        'changes': [{'sheet_index': 0, 'operations': [{'row': 1, 'col': 1, 'value': '5'}]}],
+    })
+    assert response.status_code == 200
+    assert response.json()['version'] == 1
+    assert _rows(client, workbook_id) == [['a', 'b'], ['1', '5']]
+
+
+def test_sync_from_stale_version_is_409(client, create_workbook):
+    workbook_id = create_workbook([['a', 'b'], ['1', '2']])
+    client.put(f'/api/excel/workbook/{workbook_id}/cell', json={'sheet_index': 0, 'row': 0, 'col': 0, 'value': 'z'})
+
+    response = client.patch(f'/api/excel/{workbook_id}/sync', json={
+        'base_version': 0,
+        'changes': [{'sheet_index': 0, 'operations': [{'row': 1, 'col': 1, 'value': '5'}]}],
+    })
+    assert response.status_code == 409
+    assert response.json()['detail']['version'] == 1
+    assert _rows(client, workbook_id) == [['z', 'b'], ['1', '2']]
+
+
+def test_empty_sync_keeps_the_version(client, create_workbook):
+    workbook_id = create_workbook([['a']])
+
+    response = client.patch(f'/api/excel/{workbook_id}/sync', json={'base_version': 0, 'changes': []})
+    assert response.status_code == 200
+    assert response.json()['version'] == 0
+
+
+def test_sync_of_unknown_workbook_is_404(client):
+    response = client.patch('/api/excel/missing/sync', json={'base_version': 0, 'changes': []})
+    assert response.status_code == 404
@@ -0,0 +1,145 @@
+import threading
+import time
+
+import pytest
+
+from app.services import workbook_store
+from app.services.sheet_store import ColumnarSheet, StoredWorkbook
+from app.services.workbook_store import SqliteSpill, WorkbookStore
+
+
+def _workbook(workbook_id, n_rows=100):
+    rows = [[f'{workbook_id}-{idx}', str(idx)] for idx in range(n_rows)]
+    return StoredWorkbook(workbook_id, [ColumnarSheet.from_rows('Sheet1', rows)])
+
+
+@pytest.fixture
+def spill(tmp_path):
+    return SqliteSpill(str(tmp_path / 'spill.sqlite3'), ttl_seconds=3600)
+
+
+def _store_for(n_workbooks, spill=None, ttl_seconds=3600):
+    """A store whose budget fits n_workbooks of the size _workbook makes"""
+    return WorkbookStore(_workbook('w').nbytes() * n_workbooks, ttl_seconds, spill)
+
+
+def test_least_recently_used_workbook_is_evicted_first():
+    store = _store_for(2)
+    for workbook_id in ('a', 'b'):
+        store.put(_workbook(workbook_id))
+    store.get('a')
+    store.put(_workbook('c'))
+
+    assert 'b' not in store
+    assert store.get('a') is not None
+    assert store.get('c') is not None
+    assert store.stats()['evictions'] == 1
+
+
+def test_evicted_workbooks_are_spilled_and_reloaded(spill):
+    store = _store_for(1, spill)
+    first = _workbook('a')
+    first.sheets[0].set(5, 1, 'edited')
+    store.put(first)
+    store.put(_workbook('b'))
+
+    assert store.stats()['spilled'] == 1
+    assert 'a' in store
+    reloaded = store.get('a')
+    assert reloaded.sheets[0].rows() == first.sheets[0].rows()
+    assert store.stats()['reloads'] == 1
+    # Reloading made room by spilling the other one
+    assert store.stats()['in_memory'] == 1
+    assert 'b' in store
+
+
+def test_workbook_being_put_is_never_evicted():
+    store = WorkbookStore(1, 3600)
+    store.put(_workbook('big'))
+
+    assert store.get('big') is not None
+
+
+def test_idle_workbooks_expire(monkeypatch, spill):
+    now = [1000.0]
+    monkeypatch.setattr(workbook_store.time, 'monotonic', lambda: now[0])
+    store = _store_for(10, spill, ttl_seconds=60)
+    store.put(_workbook('a'))
+    store.put(_workbook('b'))
+
+    now[0] += 30
+    store.get('b')
+    now[0] += 45
+    assert store.get('b') is not None
+    assert store.stats()['in_memory'] == 1
+    assert store.stats()['spilled'] == 1
+    assert store.get('a') is not None
+
+
+def test_without_spill_evicted_workbooks_are_gone():
+    store = _store_for(1)
+    store.put(_workbook('a'))
+    store.put(_workbook('b'))
+
+    assert 'a' not in store
+    assert store.get('a') is None
+
+
+def test_delete_removes_spilled_copy(spill):
+    store = _store_for(1, spill)
+    store.put(_workbook('a'))
+    store.put(_workbook('b'))
+    store.delete('a')
+
+    assert 'a' not in store
+    assert spill.load('a') is None
+
+
+def test_workbook_locked_by_another_thread_is_not_evicted(spill):
+    store = _store_for(1, spill)
+    assert store.lock('a') is not store.lock('b')
+    store.put(_workbook('a'))
+    locked, done = threading.Event(), threading.Event()
+
+    def edit_a():
+        with store.lock('a'):
+            locked.set()
+            done.wait(5)
+
+    editor = threading.Thread(target=edit_a)
+    editor.start()
+    locked.wait(5)
+    store.put(_workbook('b'))
+    assert store.stats()['in_memory'] == 2
+    assert store.stats()['spilled'] == 0
+    done.set()
+    editor.join()
+
+    store.put(_workbook('b'))
+    assert store.stats()['spilled'] == 1
+    assert store.get('a') is not None
+
+
+def test_slow_spill_does_not_block_the_store(monkeypatch, spill):
+    store = _store_for(1, spill)
+    store.put(_workbook('a'))
+    saving = threading.Event()
+    save = spill.save
+
+    def slow_save(workbook):
+        saving.set()
+        time.sleep(0.5)
+        save(workbook)
+
+    monkeypatch.setattr(spill, 'save', slow_save)
+    writer = threading.Thread(target=store.put, args=(_workbook('b'),))
+    writer.start()
+    saving.wait(5)
+    started = time.monotonic()
+    assert store.get('a') is not None
+    assert store.get('b') is not None
+    assert time.monotonic() - started < 0.25
+    writer.join()
+
+    assert store.stats()['spilled'] == 1
+    assert store.get('a').sheets[0].rows() == _workbook('a').sheets[0].rows()
@@ -29,6 +29,14 @@ function App() {
       setExcelData(response.data)
       // Clear charts when new Excel data is generated
       setCharts([])
+    } else if (response.type === 'rows') {
+      // Later rows of a streamed workbook, appended as they arrive
+      setExcelData(prev => {
+        const sheets = [...prev.sheets]
+        const sheet = sheets[response.sheetIndex]
+        sheets[response.sheetIndex] = { ...sheet, rows: sheet.rows.concat(response.rows) }
+        return { ...prev, sheets }
+      })
     } else if (response.type === 'chart') {
       // Use functional update to avoid stale closure
       setCharts(prevCharts => [...prevCharts, response.data])
@@ -66,7 +66,7 @@ function ChartBuilder({ charts, data }) {
             <PieChart>
               <Pie
                 data={chartData}
-                dataKey="value"
+                dataKey={chart.columns?.find(col => col !== 'name') || 'value'}
                 nameKey="name"
                 cx="50%"
                 cy="50%"
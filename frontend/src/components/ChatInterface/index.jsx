@@ -1,5 +1,16 @@
 import { useState, useRef, useEffect } from 'react'
-import { sendMessage } from '../../services/api'
+import { streamMessage } from '../../services/api'
+
+const STAGE_TEXT = {
+  fetching: '⏳ 正在下载网页...',
+  parsing: '⏳ 正在解析表格...',
+  building: '⏳ 正在生成工作簿...',
+}
+
+const statusText = (status) =>
+  status.stage === 'scraping'
+    ? `⏳ 已抓取 ${status.pages_done}/${status.pages} 个网页...`
+    : STAGE_TEXT[status.stage] || ''
 
 function ChatInterface({ onResponse }) {
   const messagesEndRef = useRef(null)
@@ -30,18 +41,38 @@ function ChatInterface({ onResponse }) {
     setIsLoading(true)
 
     try {
-      const response = await sendMessage(input)
-
-      const assistantMessage = {
-        role: 'assistant',
-        content: response.message || '操作完成',
+      // The reply shows at once and is updated in place as the stream goes on
+      let started = false
+      let reply = ''
+      const showReply = (content) => {
+        const replace = started
+        started = true
+        setMessages((prev) => [
+          ...(replace ? prev.slice(0, -1) : prev),
+          { role: 'assistant', content },
+        ])
       }
 
-      setMessages((prev) => [...prev, assistantMessage])
-
-      if (response.data) {
-        onResponse(response)
-      }
+      await streamMessage(input, (event, data) => {
+        if (event === 'message') {
+          reply = data.message
+          showReply(reply)
+        } else if (event === 'status') {
+          showReply(`${reply}\n${statusText(data)}`)
+        } else if (event === 'workbook') {
+          // First rows of each sheet, the rest follow as 'rows' events
+          onResponse({ type: 'excel', data: data.data })
+        } else if (event === 'rows') {
+          onResponse({ type: 'rows', sheetIndex: data.sheet_index, rows: data.rows })
+        } else if (event === 'done') {
+          showReply(data.message || '操作完成')
+          if (data.data) {
+            onResponse(data)
+          }
+        } else if (event === 'error') {
+          showReply(`错误: ${data.message}`)
+        }
+      })
     } catch (error) {
       const errorMessage = {
         role: 'assistant',
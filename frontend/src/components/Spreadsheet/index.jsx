@@ -1,18 +1,79 @@
-import { useState } from 'react'
+import { useEffect, useRef, useState } from 'react'
 import api from '../../services/api'
 
+// Rows fetched per "load more" click for sheets sent as a first page only
+const PAGE_ROWS = 500
+
 function Spreadsheet({ data, onUpdate, charts = [] }) {
   const [activeSheet, setActiveSheet] = useState(data.activeSheet || 0)
   const [isExporting, setIsExporting] = useState(false)
+  const [isLoadingRows, setIsLoadingRows] = useState(false)
+  const [isImporting, setIsImporting] = useState(false)
+  const fileInput = useRef(null)
+
+  // Cells edited since the last sync, keyed by "sheet:row:col"
+  const pendingChanges = useRef(new Map())
+
+  useEffect(() => {
+    pendingChanges.current = new Map()
+  }, [data.id])
 
   const currentSheet = data.sheets[activeSheet]
 
+  // Sheets from the agent only carry their first rows; n_rows is the full size
+  const totalRows = (sheet) => sheet.n_rows ?? sheet.rows.length
+  const isFullyLoaded = (sheet) => sheet.rows.length >= totalRows(sheet)
+
+  const recordChange = (row, col, value) => {
+    pendingChanges.current.set(`${activeSheet}:${row}:${col}`, {
+      sheetIndex: activeSheet,
+      row,
+      col,
+      value,
+    })
+  }
+
   const handleCellChange = (rowIndex, colIndex, value) => {
     const newSheets = [...data.sheets]
     newSheets[activeSheet].rows[rowIndex][colIndex] = value
+    recordChange(rowIndex, colIndex, value)
     onUpdate({ ...data, sheets: newSheets })
   }
 
+  // Send only the changed cells; fall back to a full sync when the
+  // backend has no version for us or its version moved on (409)
+  const syncWorkbook = async () => {
+    const bySheet = new Map()
+    for (const { sheetIndex, row, col, value } of pendingChanges.current.values()) {
+      if (!bySheet.has(sheetIndex)) bySheet.set(sheetIndex, [])
+      bySheet.get(sheetIndex).push({ row, col, value })
+    }
+
+    let response = null
+    if (data.version !== undefined) {
+      try {
+        response = await api.patch(`/excel/${data.id}/sync`, {
+          base_version: data.version,
+          changes: [...bySheet].map(([sheet_index, operations]) => ({ sheet_index, operations })),
+        })
+        console.log(`✅ 增量同步 ${pendingChanges.current.size} 个单元格`)
+      } catch (error) {
+        if (error.response?.status !== 409) throw error
+        console.log('⚠️ 版本冲突，改为全量同步')
+      }
+    }
+    if (!response) {
+      // A full sync of a partly loaded sheet would drop the rows not loaded yet
+      if (!data.sheets.every(isFullyLoaded)) {
+        throw new Error('表格数据尚未全部加载，无法全量同步')
+      }
+      response = await api.put(`/excel/${data.id}/sync`, data)
+    }
+
+    pendingChanges.current.clear()
+    return response.data.version
+  }
+
   const handleExport = async () => {
     try {
       setIsExporting(true)
@@ -24,17 +85,21 @@ function Spreadsheet({ data, onUpdate, charts = [] }) {
 
       // First, sync the current workbook data to backend
       console.log('📤 步骤1: 同步表格数据到后端...')
-      await api.put(`/excel/${data.id}/sync`, data)
+      let version = await syncWorkbook()
       console.log('✅ 表格数据同步完成')
 
-      // Then set all charts for the workbook (replaces any existing charts)
-      if (charts.length > 0) {
-        console.log(`📤 步骤2: 发送${charts.length}个图表到后端...`)
-        await api.post(`/excel/${data.id}/charts/batch`, charts)
+      // Then set the static charts for the workbook (replaces the existing
+      // ones); charts bound to ranges are already stored with the workbook
+      const staticCharts = charts.filter(chart => !chart.range)
+      if (staticCharts.length > 0) {
+        console.log(`📤 步骤2: 发送${staticCharts.length}个图表到后端...`)
+        const chartResponse = await api.post(`/excel/${data.id}/charts/batch`, staticCharts)
+        version = chartResponse.data.version
         console.log('✅ 图表发送完成')
       } else {
-        console.log('⚠️ 没有图表需要导出')
+        console.log('⚠️ 没有需要发送的图表')
       }
+      onUpdate({ ...data, version })
 
       // Then export with charts
       console.log('📤 步骤3: 导出Excel文件...')
@@ -63,15 +128,60 @@ function Spreadsheet({ data, onUpdate, charts = [] }) {
     }
   }
 
+  const handleLoadMoreRows = async () => {
+    try {
+      setIsLoadingRows(true)
+      const response = await api.get(`/excel/workbook/${data.id}/sheet/${activeSheet}/range`, {
+        params: { row_start: currentSheet.rows.length, row_count: PAGE_ROWS },
+      })
+      const newSheets = [...data.sheets]
+      newSheets[activeSheet] = {
+        ...currentSheet,
+        rows: [...currentSheet.rows, ...response.data.rows],
+        n_rows: response.data.n_rows,
+      }
+      onUpdate({ ...data, sheets: newSheets })
+    } catch (error) {
+      console.error('❌ 加载失败:', error)
+      alert('加载失败: ' + error.message)
+    } finally {
+      setIsLoadingRows(false)
+    }
+  }
+
+  const handleImport = async (event) => {
+    const file = event.target.files[0]
+    event.target.value = ''
+    if (!file) return
+
+    try {
+      setIsImporting(true)
+      const form = new FormData()
+      form.append('file', file)
+      const response = await api.post('/excel/import', form, {
+        headers: { 'Content-Type': 'multipart/form-data' },
+      })
+      setActiveSheet(0)
+      onUpdate(response.data.data)
+    } catch (error) {
+      console.error('❌ 导入失败:', error)
+      alert('导入失败: ' + (error.response?.data?.detail || error.message))
+    } finally {
+      setIsImporting(false)
+    }
+  }
+
   const handleAddRow = () => {
     const newSheets = [...data.sheets]
     const newRow = new Array(currentSheet.rows[0].length).fill('')
+    newRow.forEach((_, colIndex) => recordChange(currentSheet.rows.length, colIndex, ''))
     newSheets[activeSheet].rows = [...currentSheet.rows, newRow]
     onUpdate({ ...data, sheets: newSheets })
   }
 
   const handleAddColumn = () => {
     const newSheets = [...data.sheets]
+    currentSheet.rows.forEach((row, rowIndex) => recordChange(rowIndex, row.length, ''))
     newSheets[activeSheet].rows = currentSheet.rows.map((row) => [...row, ''])
     onUpdate({ ...data, sheets: newSheets })
   }
@@ -101,9 +211,25 @@ function Spreadsheet({ data, onUpdate, charts = [] }) {
           </div>
 
           <div className="flex space-x-2">
+            <input
+              ref={fileInput}
+              type="file"
+              accept=".csv,.tsv,.xlsx,.xlsm"
+              onChange={handleImport}
+              className="hidden"
+            />
+            <button
+              onClick={() => fileInput.current.click()}
+              disabled={isImporting}
+              className="px-3 py-1 bg-gray-100 text-gray-700 rounded hover:bg-gray-200 disabled:text-gray-400 transition-colors text-sm"
+            >
+              {isImporting ? '导入中...' : '导入'}
+            </button>
             <button
               onClick={handleAddRow}
-              className="px-3 py-1 bg-gray-100 text-gray-700 rounded hover:bg-gray-200 transition-colors text-sm"
+              disabled={!isFullyLoaded(currentSheet)}
+              title={isFullyLoaded(currentSheet) ? '添加行' : '请先加载全部行'}
+              className="px-3 py-1 bg-gray-100 text-gray-700 rounded hover:bg-gray-200 disabled:text-gray-400 disabled:cursor-not-allowed transition-colors text-sm"
             >
               + 行
             </button>
@@ -152,10 +278,21 @@ function Spreadsheet({ data, onUpdate, charts = [] }) {
             ))}
           </tbody>
         </table>
+        {!isFullyLoaded(currentSheet) && (
+          <button
+            onClick={handleLoadMoreRows}
+            disabled={isLoadingRows}
+            className="mt-2 px-4 py-1 bg-blue-600 text-white rounded hover:bg-blue-700 disabled:bg-gray-400 transition-colors text-sm"
+          >
+            {isLoadingRows
+              ? '加载中...'
+              : `加载更多 (${currentSheet.rows.length} / ${totalRows(currentSheet)} 行)`}
+          </button>
+        )}
       </div>
 
       <div className="bg-gray-100 border-t border-gray-200 px-4 py-2 text-sm text-gray-600">
-        当前表格: {currentSheet.name} | {currentSheet.rows.length} 行 x {currentSheet.rows[0]?.length || 0} 列
+        当前表格: {currentSheet.name} | {totalRows(currentSheet)} 行 x {currentSheet.rows[0]?.length ?? currentSheet.n_cols ?? 0} 列
       </div>
     </div>
   )
@@ -13,6 +13,41 @@ export const sendMessage = async (message) => {
   return response.data
 }
 
+// Chat as Server-Sent Events: onEvent(name, data) is called for each
+// event as it arrives (message, status, workbook, rows, done, error)
+export const streamMessage = async (message, onEvent) => {
+  const response = await fetch('/api/chat/stream', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ message }),
+  })
+  if (!response.ok) {
+    throw new Error(`Request failed with status code ${response.status}`)
+  }
+
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+  let buffer = ''
+  for (;;) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffer += value
+
+    // Events end with a blank line
+    let end
+    while ((end = buffer.indexOf('\n\n')) >= 0) {
+      const block = buffer.slice(0, end)
+      buffer = buffer.slice(end + 2)
+      let name = 'message'
+      const data = []
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) name = line.slice(6).trim()
+        else if (line.startsWith('data:')) data.push(line.slice(5).trimStart())
+      }
+      if (data.length) onEvent(name, JSON.parse(data.join('\n')))
+    }
+  }
+}
+
 // Excel APIs
 export const createWorkbook = async (data) => {
   const response = await api.post('/excel/workbook', data)